@@ -1,51 +1,214 @@
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+import uuid
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
 from passlib.context import CryptContext
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 
 from . import schemas, models
-from .database import get_db
+from .database import SessionLocal, get_db
 from .config import settings
 from .models import User
+from .tokens import TokenCache, RevocationList
+from .ratelimit import SlidingWindowLimiter
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+PASSWORD_SCHEMES = ["bcrypt", "argon2"]
+
+def build_password_context(
+    scheme: str = settings.PASSWORD_HASH_SCHEME,
+    bcrypt_rounds: int = settings.BCRYPT_ROUNDS,
+    argon2_time_cost: int = settings.ARGON2_TIME_COST,
+    argon2_memory_cost: int = settings.ARGON2_MEMORY_COST,
+    argon2_parallelism: int = settings.ARGON2_PARALLELISM,
+) -> CryptContext:
+    """
+    CryptContext for the configured policy. Pinning min and max rounds makes
+    needs_update() true for any hash made with other parameters, so a policy
+    change is applied to each user on their next successful login.
+    """
+    return CryptContext(
+        schemes=[scheme] + [s for s in PASSWORD_SCHEMES if s != scheme],
+        default=scheme,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__rounds=argon2_time_cost,
+        argon2__min_rounds=argon2_time_cost,
+        argon2__max_rounds=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+pwd_context = build_password_context()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+token_cache = TokenCache(max_size=settings.TOKEN_CACHE_SIZE)
+revocations = RevocationList(
+    SessionLocal,
+    refresh_interval=settings.REVOCATION_REFRESH_SECONDS,
+    max_token_lifetime=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+login_failures_by_user = SlidingWindowLimiter(settings.LOGIN_MAX_FAILURES_PER_USER, settings.LOGIN_WINDOW_SECONDS)
+login_failures_by_ip = SlidingWindowLimiter(settings.LOGIN_MAX_FAILURES_PER_IP, settings.LOGIN_WINDOW_SECONDS)
+
 # def verify_password(plain_password: str, hashed_password: str) -> bool:
 #     return pwd_context.verify(plain_password, hashed_password)
 
 def verify_password(plain_password: str, hashed_password: str):
     try:
         return pwd_context.verify(plain_password, hashed_password)
-    except Exception as e:
-        print(f"Verify error: {e}")  # Debug
+    except Exception:
+        logger.warning("Could not verify a stored password hash", exc_info=True)
         return False
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, username: str, password: str):
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Returns (valid, new_hash); new_hash is set when the stored hash is outdated."""
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception:
+        logger.warning("Could not verify a stored password hash", exc_info=True)
+        return False, None
+
+def check_login_rate(username: str, client_ip: Optional[str] = None):
+    """Reject a login attempt before any hashing if recent failures hit the limit."""
+    retry_after = login_failures_by_user.retry_after(username)
+    if client_ip:
+        retry_after = max(retry_after, login_failures_by_ip.retry_after(client_ip))
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+def authenticate_user(db: Session, username: str, password: str, client_ip: Optional[str] = None):
+    check_login_rate(username, client_ip)
     user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    valid, new_hash = verify_and_update_password(password, user.hashed_password) if user else (False, None)
+    if not valid:
+        login_failures_by_user.hit(username)
+        if client_ip:
+            login_failures_by_ip.hit(client_ip)
         return None
+    login_failures_by_user.reset(username)
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
     return user
 
 
 
+def token_claims(user: models.User) -> dict:
+    """Claims that let get_current_user build the user without a DB lookup."""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role,
+        "loc": user.location,
+        "lid": user.location_id,
+        "pid": user.parent_id,
+        "active": user.is_active,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # iat is kept fractional so a revocation cutoff taken in the same second
+    # still rejects tokens issued before it
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def new_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+def hash_refresh_token(token: str) -> str:
+    """Keyed hash of a refresh token; cheap to compute, unlike bcrypt."""
+    return hmac.new(settings.SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+@lru_cache(maxsize=None)
+def signing_key():
+    """The parsed signing key, so jose does not rebuild it on every decode."""
+    return jwk.construct(settings.SECRET_KEY, settings.ALGORITHM)
+
+def decode_token(token: str) -> dict:
+    """
+    Verify a token and return its payload.
+    Successful decodes are memoized by token digest until the token expires;
+    the revocation list is consulted on every call. Raises JWTError.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    payload = token_cache.get(key, now)
+    if payload is None:
+        payload = jwt.decode(token, signing_key(), algorithms=[settings.ALGORITHM])
+        token_cache.put(key, payload, payload.get("exp", now))
+    if revocations.is_revoked(payload):
+        raise JWTError("Token has been revoked")
+    return payload
+
+def request_owner(scope) -> Optional[str]:
+    """Username from the bearer token, or None if there is no valid one."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return decode_token(token).get("sub")
+            except JWTError:
+                return None
+    return None
+
+def revoke_token(payload: dict):
+    revocations.revoke(payload["jti"], payload.get("exp", time.time()))
+
+def revoke_user_tokens(username: str):
+    """Reject every token issued to `username` up to now."""
+    revocations.revoke_subject(username)
+
+# User columns copied into access tokens by token_claims. A committed change
+# to any of them revokes the user's tokens, so the next request needs a
+# refresh (which reads the new values) instead of acting on stale claims.
+CLAIM_COLUMNS = ("role", "is_active", "location_id", "parent_id")
+
+@event.listens_for(SessionLocal, "after_flush")
+def _note_claim_changes(session, flush_context):
+    for record in session.dirty:
+        if isinstance(record, models.User):
+            state = inspect(record)
+            if any(state.attrs[column].history.has_changes() for column in CLAIM_COLUMNS):
+                session.info.setdefault("stale_claims", set()).add(record.username)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _revoke_stale_claims(session):
+    for username in session.info.pop("stale_claims", ()):
+        revoke_user_tokens(username)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_claim_changes(session):
+    session.info.pop("stale_claims", None)
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,12 +216,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    if "uid" in payload and "lid" in payload:
+        return schemas.User(
+            id=payload["uid"],
+            username=username,
+            role=payload["role"],
+            location=payload.get("loc"),
+            location_id=payload.get("lid"),
+            parent_id=payload.get("pid"),
+            is_active=payload.get("active", True),
+        )
+    # Tokens issued before the user claims existed still need the users table
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
@@ -70,14 +244,14 @@ async def get_current_active_user(current_user: models.User = Depends(get_curren
     return current_user
 
 def check_admin_or_pastor(user: schemas.User):
-    if user.role not in ['admin', 'pastor']:
+    if user.role not in ['admin', 'overseer', 'pastor']:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Operation not permitted for your role"
         )
     
 def check_leader_or_above(user: schemas.User):
-    if user.role not in ['admin', 'pastor', 'leader']:
+    if user.role not in ['admin', 'overseer', 'pastor', 'leader']:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Operation not permitted for your role"
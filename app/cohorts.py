@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, scoping
+from .config import settings
+from .locations import cache as location_cache
+
+WINDOWS = (7, 30, 90)  # days from being added to being converted
+
+CHECKPOINT = "conversion_cohorts"
+
+
+def week_start(moment: datetime) -> datetime:
+    """Monday 00:00 of the week `moment` falls in."""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
+
+def rebuild_week(db: Session, start: datetime):
+    """Recompute every cohort cell of one week from the potentials added in it."""
+    rows = db.query(
+        models.Potential.location_id,
+        models.Potential.creator_id,
+        models.Potential.date_added,
+        models.Potential.converted_at,
+    ).filter(
+        models.Potential.deleted_at.is_(None),
+        models.Potential.date_added >= start,
+        models.Potential.date_added < start + timedelta(days=7),
+    )
+    cells = {}
+    for location_id, creator_id, date_added, converted_at in rows:
+        cell = cells.setdefault((location_id, creator_id), {
+            "added": 0, "converted": 0, **{f"converted_{days}d": 0 for days in WINDOWS}
+        })
+        cell["added"] += 1
+        if converted_at is not None:
+            cell["converted"] += 1
+            for days in WINDOWS:
+                if converted_at - date_added <= timedelta(days=days):
+                    cell[f"converted_{days}d"] += 1
+
+    db.query(models.ConversionCohort).filter(models.ConversionCohort.week_start == start).delete(
+        synchronize_session=False
+    )
+    db.add_all(
+        models.ConversionCohort(week_start=start, location_id=location_id, creator_id=creator_id, **counts)
+        for (location_id, creator_id), counts in cells.items()
+    )
+
+
+def refresh(db: Session) -> int:
+    """
+    Bring conversion_cohorts up to date. Only weeks holding potentials
+    created, edited, converted or deleted since the last refresh are
+    rebuilt (found through updated_at), so the cost follows recent activity,
+    not the size of the history. Returns the number of weeks rebuilt.
+    """
+    if db.get(models.ReportCheckpoint, CHECKPOINT) is None:
+        db.add(models.ReportCheckpoint(name=CHECKPOINT))
+        try:
+            db.commit()
+        except IntegrityError:  # created concurrently
+            db.rollback()
+    # Refreshes in other workers wait here for this one to commit, then see
+    # its watermark (SQLite serializes the writes on its own)
+    checkpoint = db.query(models.ReportCheckpoint).filter(
+        models.ReportCheckpoint.name == CHECKPOINT
+    ).with_for_update().one()
+    # Same settle window as /sync: a transaction may commit a little
+    # after its updated_at, so look back that far each time
+    now = datetime.utcnow()
+    query = db.query(models.Potential.date_added).distinct()
+    if checkpoint.watermark is not None:
+        since = checkpoint.watermark - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+        query = query.filter(models.Potential.updated_at > since)
+    weeks = {week_start(date_added) for (date_added,) in query if date_added is not None}
+    for start in sorted(weeks):
+        rebuild_week(db, start)
+    checkpoint.watermark = now
+    db.commit()
+    return len(weeks)
+
+
+def cohort_matrix(db: Session, user, group_by: str = "location", start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> list:
+    """
+    Cohort rows (one per week and location or leader) within the user's
+    scope: how many potentials were added and how many converted within each
+    window. Recent cohorts are partial until their windows have passed.
+    """
+    cohort = models.ConversionCohort
+    key = cohort.location_id if group_by == "location" else cohort.creator_id
+    query = db.query(
+        cohort.week_start,
+        key,
+        func.sum(cohort.added),
+        func.sum(cohort.converted),
+        *[func.sum(getattr(cohort, f"converted_{days}d")) for days in WINDOWS],
+    ).filter(scoping.scope_predicate(cohort, user))
+    if start is not None:
+        query = query.filter(cohort.week_start >= week_start(start))
+    if end is not None:
+        query = query.filter(cohort.week_start <= end)
+    rows = query.group_by(cohort.week_start, key).order_by(cohort.week_start, key).all()
+
+    if group_by == "location":
+        names = {row[1]: location_cache.name_for(db, row[1]) for row in rows}
+    else:
+        names = dict(db.query(models.User.id, models.User.username).filter(
+            models.User.id.in_({row[1] for row in rows if row[1] is not None})
+        ))
+    return [
+        {
+            "week_start": week,
+            "key": group_key,
+            "name": names.get(group_key),
+            "added": added or 0,
+            "converted": converted or 0,
+            **{f"converted_{days}d": count or 0 for days, count in zip(WINDOWS, window_counts)},
+        }
+        for week, group_key, added, converted, *window_counts in rows
+    ]
@@ -0,0 +1,271 @@
+"""
+Columnar export files, written one record batch at a time.
+
+With pyarrow installed exports can be Arrow IPC streams or Parquet. Without
+it they use "cols", a small typed binary format of our own that needs only
+the standard library to read (read_cols). A cols file is laid out as:
+
+    8 bytes   magic, b"COLS\\x00\\x01\\x00\\x00"
+    u32       length of the schema, then the schema as JSON: {"columns": [[name, type], ...]}
+    batches, each:
+      u32     rows in the batch; 0 ends the file
+      for each column, in schema order:
+        validity bitmap, ceil(rows / 8) bytes, least significant bit first (1 = not null)
+        int64, timestamp_us (since the epoch, UTC): rows x i64
+        float64: rows x f64
+        bool: a bitmap like the validity one
+        utf8: (rows + 1) x i32 offsets into the bytes that follow
+        dictionary: u32 count of entries new in this batch, those entries as a utf8
+                    block, then rows x i32 indices into all entries so far
+
+All integers are little-endian.
+"""
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: exports fall back to the cols format
+    pyarrow = None
+
+INT64, FLOAT64, BOOL, TIMESTAMP, UTF8, DICTIONARY = "int64", "float64", "bool", "timestamp_us", "utf8", "dictionary"
+
+ARROW_FORMATS = ("arrow", "parquet")
+FORMATS = ARROW_FORMATS + ("cols",)
+
+MAGIC = b"COLS\x00\x01\x00\x00"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def column_type(sql_type) -> str:
+    """Export type of a SQLAlchemy column type; anything else is written as text (JSON for structures)."""
+    if isinstance(sql_type, Boolean):
+        return BOOL
+    if isinstance(sql_type, Integer):
+        return INT64
+    if isinstance(sql_type, Float):
+        return FLOAT64
+    if isinstance(sql_type, DateTime):
+        return TIMESTAMP
+    return UTF8
+
+
+def text_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+class Dictionary:
+    """Dictionary of one column across a whole file; each batch only adds the entries it introduces."""
+
+    def __init__(self):
+        self.index = {}
+
+    def encode(self, values: list):
+        """(indices, new entries) for `values`; None stays None."""
+        new = []
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            value = text_value(value)
+            position = self.index.get(value)
+            if position is None:
+                position = self.index[value] = len(self.index)
+                new.append(value)
+            indices.append(position)
+        return indices, new
+
+
+def _le(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _bitmap(flags) -> bytes:
+    out = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+def _unbitmap(data: bytes, count: int) -> list:
+    return [bool(data[i >> 3] >> (i & 7) & 1) for i in range(count)]
+
+
+def _utf8_block(strings: list) -> bytes:
+    offsets = array("i", [0])
+    data = bytearray()
+    for value in strings:
+        data += (value or "").encode()
+        offsets.append(len(data))
+    return _le(offsets) + bytes(data)
+
+
+class ColsWriter:
+    """Writes the cols format to a binary file object."""
+
+    def __init__(self, f, columns: list):
+        self.f = f
+        self.columns = columns
+        self.dictionaries = {name: Dictionary() for name, kind in columns if kind == DICTIONARY}
+        schema = json.dumps({"columns": columns}).encode()
+        f.write(MAGIC + struct.pack("<I", len(schema)) + schema)
+
+    def write(self, batch: dict):
+        """Write one batch, given as {column: list of values}."""
+        rows = len(batch[self.columns[0][0]])
+        if not rows:
+            return
+        parts = [struct.pack("<I", rows)]
+        for name, kind in self.columns:
+            values = batch[name]
+            parts.append(_bitmap([value is not None for value in values]))
+            if kind in (INT64, TIMESTAMP):
+                if kind == TIMESTAMP:
+                    values = [None if v is None else (v - EPOCH) // MICROSECOND for v in values]
+                parts.append(_le(array("q", (0 if v is None else int(v) for v in values))))
+            elif kind == FLOAT64:
+                parts.append(_le(array("d", (0.0 if v is None else float(v) for v in values))))
+            elif kind == BOOL:
+                parts.append(_bitmap([bool(v) for v in values]))
+            elif kind == DICTIONARY:
+                indices, new = self.dictionaries[name].encode(values)
+                parts.append(struct.pack("<I", len(new)) + _utf8_block(new))
+                parts.append(_le(array("i", (0 if i is None else i for i in indices))))
+            else:
+                parts.append(_utf8_block([text_value(v) for v in values]))
+        self.f.write(b"".join(parts))
+
+    def close(self):
+        self.f.write(struct.pack("<I", 0))
+
+
+class _Reader:
+    def __init__(self, f):
+        self.f = f
+
+    def take(self, size: int) -> bytes:
+        data = self.f.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated cols file")
+        return data
+
+    def u32(self) -> int:
+        return struct.unpack("<I", self.take(4))[0]
+
+    def utf8(self, count: int) -> list:
+        offsets = _from_le("i", self.take(4 * (count + 1)))
+        data = self.take(offsets[-1])
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(count)]
+
+
+def read_cols(f) -> Iterator[dict]:
+    """Batches of a cols file as {column: list of values}; timestamps come back as naive UTC datetimes."""
+    reader = _Reader(f)
+    if reader.take(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a cols file")
+    columns = json.loads(reader.take(reader.u32()))["columns"]
+    dictionaries = {name: [] for name, kind in columns if kind == DICTIONARY}
+    while True:
+        rows = reader.u32()
+        if not rows:
+            return
+        batch = {}
+        for name, kind in columns:
+            present = _unbitmap(reader.take((rows + 7) // 8), rows)
+            if kind in (INT64, TIMESTAMP):
+                values = list(_from_le("q", reader.take(8 * rows)))
+                if kind == TIMESTAMP:
+                    values = [EPOCH + v * MICROSECOND for v in values]
+            elif kind == FLOAT64:
+                values = list(_from_le("d", reader.take(8 * rows)))
+            elif kind == BOOL:
+                values = _unbitmap(reader.take((rows + 7) // 8), rows)
+            elif kind == DICTIONARY:
+                entries = dictionaries[name]
+                entries += reader.utf8(reader.u32())
+                values = [entries[i] for i in _from_le("i", reader.take(4 * rows))]
+            else:
+                values = reader.utf8(rows)
+            batch[name] = [value if ok else None for value, ok in zip(values, present)]
+        yield batch
+
+
+class ArrowWriter:
+    """Writes an Arrow IPC stream or a Parquet file through pyarrow."""
+
+    def __init__(self, f, columns: list, file_format: str):
+        self.columns = columns
+        self.dictionaries = {name: Dictionary() for name, kind in columns if kind == DICTIONARY}
+        self.entries = {name: [] for name in self.dictionaries}
+        types = {
+            INT64: pyarrow.int64(),
+            FLOAT64: pyarrow.float64(),
+            BOOL: pyarrow.bool_(),
+            TIMESTAMP: pyarrow.timestamp("us"),
+            UTF8: pyarrow.string(),
+            DICTIONARY: pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        }
+        self.schema = pyarrow.schema([pyarrow.field(name, types[kind]) for name, kind in columns])
+        self.parquet = file_format == "parquet"
+        if self.parquet:
+            self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+        else:
+            # Dictionaries only grow, so later batches send just their new entries
+            options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = pyarrow.ipc.new_stream(f, self.schema, options=options)
+
+    def write(self, batch: dict):
+        arrays = []
+        for field, (name, kind) in zip(self.schema, self.columns):
+            values = batch[name]
+            if kind == DICTIONARY:
+                indices, new = self.dictionaries[name].encode(values)
+                self.entries[name] += new
+                arrays.append(pyarrow.DictionaryArray.from_arrays(
+                    pyarrow.array(indices, pyarrow.int32()), pyarrow.array(self.entries[name], pyarrow.string())
+                ))
+            elif kind == UTF8:
+                arrays.append(pyarrow.array([text_value(v) for v in values], field.type))
+            else:
+                arrays.append(pyarrow.array(values, field.type))
+        record_batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.parquet:
+            self.writer.write_table(pyarrow.Table.from_batches([record_batch]))
+        else:
+            self.writer.write_batch(record_batch)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(f, file_format: str, columns: list):
+    """Batch writer for `file_format` over the binary file `f`; `columns` is [(name, type), ...]."""
+    if file_format in ARROW_FORMATS:
+        if pyarrow is None:
+            raise ValueError(f"The {file_format} format needs pyarrow installed")
+        return ArrowWriter(f, columns, file_format)
+    return ColsWriter(f, columns)
@@ -0,0 +1,185 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+# Upper bounds (seconds) of the queue-wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1.0, 5.0, math.inf)
+
+
+class Overloaded(Exception):
+    """No slot became free within the queue timeout, or the queue is full."""
+
+
+class ConcurrencyLimiter:
+    """
+    Bulkhead for one route class: at most `limit` requests run at once,
+    later ones wait in FIFO order for up to `queue_timeout` seconds and are
+    shed after that (or straight away once `max_queue` are waiting).
+    Used from the event loop only, so it needs no lock.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * len(WAIT_BUCKETS)
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(self.name)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self.shed += 1
+                raise Overloaded(self.name)
+            # release() handed us the slot just as the timeout fired
+        except asyncio.CancelledError:  # client went away while queued
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _record_wait(self, seconds: float):
+        self.admitted += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.wait_histogram[i] += 1
+                break
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_seconds_avg": self.wait_total / self.admitted if self.admitted else 0.0,
+            "wait_seconds_max": self.wait_max,
+            "wait_seconds_histogram": {
+                ("+Inf" if bound == math.inf else str(bound)): count
+                for bound, count in zip(WAIT_BUCKETS, self.wait_histogram)
+            },
+        }
+
+
+# Path prefixes that are never limited: docs and the long-lived change feed
+UNLIMITED_PREFIXES = ("/docs", "/redoc", "/openapi.json", "/events")
+AUTH_PREFIXES = ("/token", "/logout", "/test-login")
+REPORT_PREFIXES = ("/jobs", "/reports", "/sync")
+
+
+def route_class(method: str, path: str):
+    """The limiter class for a request, or None if it is not limited."""
+    if path == "/" or path.startswith(UNLIMITED_PREFIXES):
+        return None
+    if path.startswith(AUTH_PREFIXES):
+        return "auth"
+    if path.startswith(REPORT_PREFIXES):
+        return "reports"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "reads"
+    return "writes"
+
+
+limiters = {
+    name: ConcurrencyLimiter(
+        name,
+        limit,
+        settings.CONCURRENCY_QUEUE_TIMEOUTS.get(name, 1.0),
+        settings.CONCURRENCY_MAX_QUEUE,
+    )
+    for name, limit in settings.CONCURRENCY_LIMITS.items()
+}
+
+
+def thread_tokens_needed() -> int:
+    """Worker threads needed so that every class can use its full limit at once."""
+    return sum(limiter.limit for limiter in limiters.values())
+
+
+def metrics() -> dict:
+    return {name: limiter.metrics() for name, limiter in limiters.items()}
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    ASGI middleware applying the per-class limiters. The slot is held until
+    the response starts, which covers the endpoint and its dependencies
+    (where the threadpool is used) but not the streaming of the body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = limiters.get(route_class(scope["method"], scope["path"]))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            response = JSONResponse(
+                {"detail": "Server is busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(max(1, math.ceil(limiter.queue_timeout)))},
+            )
+            return await response(scope, receive, send)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                limiter.release()
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            release()
@@ -1,11 +1,88 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
+from typing import Dict, List
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./sql_app.db"
+    # Run migrations from the app's startup instead of migrate.py; only
+    # safe with a single worker process
+    AUTO_MIGRATE: bool = False
+    DB_POOL_WARM_CONNECTIONS: int = 2  # opened at startup so the first requests do not pay for connecting
+    # Read replicas for GET routes (see app/database.py). A replica further
+    # behind than REPLICA_MAX_LAG_SECONDS is skipped, and a user's reads stay
+    # on the primary for that long after their own writes
+    READ_REPLICA_URLS: List[str] = []
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_CHECK_SECONDS: float = 1.0  # how often replica lag is measured
+    # Optional sharding (see app/database.py): potentials, disciples and
+    # workers of the locations under each SHARD_LOCATIONS entry live in that
+    # shard's database; everything else, and unmapped locations, stay in
+    # DATABASE_URL. Read replicas are not used when sharding is on.
+    SHARD_URLS: Dict[str, str] = {}  # shard name -> database URL
+    SHARD_LOCATIONS: Dict[str, str] = {}  # location or region name -> shard name
+    SHARD_FAN_OUT_WORKERS: int = 8  # shards queried at once by cross-shard lists
     SECRET_KEY: str = "JUST_A_RANDOM_SECRET_KEY"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Password hashing policy; tune with calibrate_password_hash.py.
+    # Stored hashes that do not match it are rehashed on the next login.
+    PASSWORD_HASH_SCHEME: str = "bcrypt"  # "bcrypt" or "argon2" (needs argon2-cffi)
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    # Failed logins allowed per window before /token rejects without hashing
+    LOGIN_MAX_FAILURES_PER_USER: int = 5
+    LOGIN_MAX_FAILURES_PER_IP: int = 20
+    LOGIN_WINDOW_SECONDS: int = 300
+    SYNC_PAGE_SIZE: int = 500
+    # Rows written in the last few seconds are held back from /sync so a
+    # transaction that commits late cannot land behind a client's watermark
+    SYNC_SETTLE_SECONDS: float = 2.0
+    EVENTS_BUFFER_SIZE: int = 100  # queued events per /events client before it must resync
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    DEFAULT_PHONE_COUNTRY_CODE: str = "1"  # used for phone numbers stored without one
+    TOKEN_CACHE_SIZE: int = 10000
+    # Token revocations live in the database; each worker reloads its copy
+    # this often, so a logout reaches the other workers within this time
+    REVOCATION_REFRESH_SECONDS: float = 2.0
+    # Background jobs (exports, reports)
+    JOB_WORKERS: int = 2  # worker processes
+    JOB_MAX_ACTIVE_PER_USER: int = 3  # queued + running jobs one user may have
+    JOB_TYPE_CONCURRENCY: Dict[str, int] = {"export": 2, "report": 1}  # running jobs per type
+    ARTIFACT_DIR: str = "./artifacts"
+    ARTIFACT_TTL_HOURS: float = 24.0
+    JOB_PURGE_SECONDS: float = 600.0
+    # A running job's lease is renewed every third of this; jobs whose
+    # runner stops renewing (crashed worker) are requeued once it lapses
+    JOB_LEASE_SECONDS: float = 60.0
+    EXPORT_BATCH_ROWS: int = 10000  # rows per record batch in columnar exports
+    # Requests in flight per route class (see app/concurrency.py); the rest
+    # queue for up to the class timeout, then get 503 with Retry-After
+    CONCURRENCY_LIMITS: Dict[str, int] = {"auth": 8, "reads": 24, "writes": 8, "reports": 4}
+    CONCURRENCY_QUEUE_TIMEOUTS: Dict[str, float] = {"auth": 5.0, "reads": 2.0, "writes": 5.0, "reports": 1.0}
+    CONCURRENCY_MAX_QUEUE: int = 200  # waiting requests per class
+    # List endpoints whose concurrent identical requests share one query
+    SINGLE_FLIGHT_ENDPOINTS: Dict[str, bool] = {"potentials.list": True, "disciples.list": True, "workers.list": True}
+    # Idempotency-Key support for POST/PUT; responses are kept this long
+    IDEMPOTENCY_TTL_HOURS: float = 24.0
+    IDEMPOTENCY_LOCK_SECONDS: float = 60.0  # a first attempt still unfinished after this is taken over
+    IDEMPOTENCY_CACHE_SIZE: int = 10000  # stored responses also held in memory
+    IDEMPOTENCY_MAX_BODY_BYTES: int = 1_000_000  # larger responses are recorded without their body and not replayed
+    IDEMPOTENCY_PURGE_SECONDS: float = 300.0
+    # Audit entries whose changes take at least this many bytes as JSON are
+    # stored compressed: "zlib", "zstd" (needs the zstandard package) or "none"
+    AUDIT_COMPRESSION: str = "zlib"
+    AUDIT_COMPRESS_MIN_BYTES: int = 512
+    # Leaders by potentials added/converted (see app/leaderboard.py). Each
+    # process saves its counts and reloads everyone's this often
+    LEADERBOARD_FLUSH_SECONDS: float = 5.0
+    LEADERBOARD_PERIODS_KEPT: int = 12  # weeks and months of history
+    # X-Total-Count on list endpoints (see app/counts.py)
+    COUNT_CACHE_SECONDS: float = 30.0  # filtered counts are reused this long
+    COUNT_CACHE_SIZE: int = 10000
+    COUNT_ESTIMATE_CAP: int = 10000  # count=estimate stops counting here on databases without planner estimates
 
     class Config:
         env_file = ".env"
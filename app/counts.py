@@ -0,0 +1,178 @@
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models, scoping
+from .config import settings
+from .database import PRIMARY_SHARD, shards
+from .tokens import TokenCache
+
+# Tables whose list endpoints report X-Total-Count
+COUNTED = {model.__tablename__: model for model in (models.Potential, models.Disciple, models.Worker)}
+
+EXACT, ESTIMATE = "exact", "estimate"
+MODES = (EXACT, ESTIMATE)
+
+# Exact counts of filtered lists, by table, scope and filters
+filtered_cache = TokenCache(settings.COUNT_CACHE_SIZE)
+
+
+def cell(model, location_id: Optional[int], owner_id: Optional[int]) -> dict:
+    return {"table_name": model.__tablename__, "location_id": location_id or 0, "owner_id": owner_id or 0}
+
+
+def increment(db: Session, counter, key: dict, deltas: dict):
+    """
+    Add `deltas` ({column: amount}) to the row of `counter` whose primary key
+    is `key`, creating the row if needed, in the caller's transaction.
+    """
+    added = {column: getattr(counter, column) + amount for column, amount in deltas.items()}
+    dialect = db.get_bind(inspect(counter)).dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        upsert = (sqlite if dialect == "sqlite" else postgresql).insert(counter).values(**key, **deltas)
+        db.execute(upsert.on_conflict_do_update(index_elements=list(key), set_=added))
+        return
+    updated = db.execute(
+        update(counter).filter_by(**key).values(**added),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    if updated == 0:
+        db.execute(insert(counter).values(**key, **deltas))
+
+
+def adjust(db: Session, model, location_id: Optional[int], owner_id: Optional[int], delta: int):
+    """Add `delta` to one counter cell, in the caller's transaction."""
+    increment(db, models.RecordCount, cell(model, location_id, owner_id), {"live": delta})
+
+
+def cell_keys(model) -> set:
+    """Columns that place a row in a counter cell."""
+    return {"location_id", scoping.owner_column(model).key}
+
+
+def moved(db: Session, model, before: Optional[dict], record):
+    """
+    Move a row's count to its new cell after an update that may have changed
+    its location or owner; `before` holds the cell_keys values read (locked) before the update.
+    """
+    owner = scoping.owner_column(model).key
+    after = (record.location_id, getattr(record, owner))
+    if before is None or (before["location_id"], before[owner]) == after:
+        return
+    adjust(db, model, before["location_id"], before[owner], -1)
+    adjust(db, model, *after, 1)
+
+
+def scope_total(db: Session, model, user) -> int:
+    """Live rows of `model` in the user's scope, summed from the counters."""
+    counter = models.RecordCount
+    rule = scoping.scope_rule(model, user)
+    query = db.query(func.coalesce(func.sum(counter.live), 0)).filter(counter.table_name == model.__tablename__)
+    if rule == scoping.LOCATION_TREE:
+        if user.location_id is None:
+            return 0
+        query = query.filter(counter.location_id.in_(scoping.locations_under(user.location_id)))
+    elif rule == scoping.TEAM:
+        query = query.filter(counter.owner_id.in_(scoping.users_under(user.id)))
+    elif rule == scoping.OWN:
+        query = query.filter(counter.owner_id == user.id)
+    elif rule != scoping.ALL:
+        return 0
+    return int(query.scalar())
+
+
+def _planner_rows(conn, statement) -> int:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate(db: Session, query) -> Tuple[int, bool]:
+    """
+    Approximate row count of `query` and whether it is approximate. On
+    PostgreSQL this is the planner's estimate from table statistics; other
+    databases count exactly up to COUNT_ESTIMATE_CAP rows and report the
+    cap beyond that.
+    """
+    statement = query.statement
+    if shards.holds(query.column_descriptions[0]["entity"].__tablename__):
+        engines = [shards.engines[shard] for shard in shards.shards_for_statement(statement)]
+    else:
+        engines = [None]
+    dialect = (engines[0] or db.get_bind()).dialect.name
+    if dialect == "postgresql":
+        total = 0
+        for engine in engines:
+            if engine is None:
+                total += _planner_rows(db.connection(), statement)
+            else:
+                with engine.connect() as conn:
+                    total += _planner_rows(conn, statement)
+        return total, True
+    cap = settings.COUNT_ESTIMATE_CAP
+    counted = shards.count(query.limit(cap + 1))
+    return (cap, True) if counted > cap else (counted, False)
+
+
+def total(db: Session, model, user, query, filters: tuple, mode: str = EXACT) -> Tuple[int, bool]:
+    """
+    X-Total-Count for a list of `model` rows in the user's scope: the number
+    of rows `query` matches and whether that number is an estimate.
+    Unfiltered lists are summed from the counters; filtered ones are counted
+    (or estimated with mode=ESTIMATE) and exact counts are reused for
+    COUNT_CACHE_SECONDS, so they can trail recent writes by that much.
+    """
+    if all(value is None for value in filters):
+        return scope_total(db, model, user), False
+    if mode == ESTIMATE:
+        return estimate(db, query)
+    key = hashlib.sha256(
+        repr((model.__tablename__, scoping.scope_key(model, user), filters)).encode()
+    ).digest()
+    now = time.time()
+    cached = filtered_cache.get(key, now)
+    if cached is None:
+        cached = shards.count(query)
+        filtered_cache.put(key, cached, now + settings.COUNT_CACHE_SECONDS)
+    return cached, False
+
+
+def rebuild(conn):
+    """Recount every counter cell from the tables (and shards); run in the caller's transaction."""
+    cells = Counter()
+    for table, model in COUNTED.items():
+        owner = scoping.owner_column(model)
+        stmt = select(model.location_id, owner, func.count()).where(
+            model.deleted_at.is_(None)
+        ).group_by(model.location_id, owner)
+        rows = list(conn.execute(stmt))
+        if shards.holds(table):
+            for name, shard_engine in shards.engines.items():
+                if name != PRIMARY_SHARD:
+                    with shard_engine.connect() as shard_conn:
+                        rows += shard_conn.execute(stmt).all()
+        for location_id, owner_id, live in rows:
+            cells[(table, location_id or 0, owner_id or 0)] += live
+
+    conn.execute(delete(models.RecordCount))
+    if cells:
+        conn.execute(insert(models.RecordCount), [
+            {"table_name": table, "location_id": location_id, "owner_id": owner_id, "live": live}
+            for (table, location_id, owner_id), live in cells.items()
+        ])
+
+
+def headers(total: int, estimated: bool = False) -> dict:
+    """Response headers reporting a list total."""
+    values = {"X-Total-Count": str(total)}
+    if estimated:
+        values["X-Total-Count-Estimated"] = "true"
+    return values
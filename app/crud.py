@@ -1,8 +1,15 @@
+from sqlalchemy import and_, case, delete, false, insert, literal, or_, select, true, update
+from sqlalchemy.orm import aliased, defer
 from sqlalchemy.orm import Session
-from . import models, schemas, auth
-from datetime import datetime
+from . import models, schemas, auth, counts, events, utils, scoping
+from .leaderboard import board as leaderboard
+from .database import shards
+from .locations import cache as location_cache
+from .config import settings
+from datetime import datetime, timedelta
 from typing import Optional
 import json
+import uuid
 
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
@@ -10,23 +17,197 @@ def json_serial(obj):
         return obj.isoformat()
     raise TypeError(f"Type {type(obj)} not serializable")
 
-def create_audit_log(db: Session, action: str, table_name: str, record_id: int, user_id: int, changes: dict):
-    # Convert datetime objects to strings in the changes dictionary
-    serializable_changes = json.loads(json.dumps(changes, default=json_serial))
-    
-    db_log = models.AuditLog(
+def audit_log_row(action: str, table_name: str, record_id: int, user_id: int, changes: dict) -> models.AuditLog:
+    """
+    Audit row for `changes`; JSON of AUDIT_COMPRESS_MIN_BYTES or more goes
+    compressed into changes_packed instead of changes.
+    """
+    serialized = json.dumps(changes, default=json_serial, separators=(",", ":"))
+    packed = None
+    if settings.AUDIT_COMPRESSION != "none" and len(serialized) >= settings.AUDIT_COMPRESS_MIN_BYTES:
+        packed = utils.compress(serialized.encode(), settings.AUDIT_COMPRESSION)
+    return models.AuditLog(
         action=action,
         table_name=table_name,
         record_id=record_id,
         user_id=user_id,
         timestamp=datetime.utcnow(),
-        changes=serializable_changes  # Use the serialized version
+        changes=None if packed else json.loads(serialized),
+        changes_packed=packed,
     )
+
+def create_audit_log(db: Session, action: str, table_name: str, record_id: int, user_id: int, changes: dict):
+    db_log = audit_log_row(action, table_name, record_id, user_id, changes)
     db.add(db_log)
     db.commit()
-    db.refresh(db_log)
     return db_log
 
+def audit_changes(log: models.AuditLog) -> dict:
+    """The changes recorded in an audit row, compressed or not."""
+    if log.changes_packed is not None:
+        return json.loads(utils.decompress(log.changes_packed))
+    return log.changes or {}
+
+def without_nulls(values: dict) -> dict:
+    """`values` minus None entries, also inside nested dicts (such as contact_info)."""
+    return {
+        key: without_nulls(value) if isinstance(value, dict) else value
+        for key, value in values.items() if value is not None
+    }
+
+def audit_diff(before: dict, after: dict) -> dict:
+    """{key: [old, new]} for the keys of `after` whose value differs from `before`."""
+    def plain(value):
+        return json.loads(json.dumps(value, default=json_serial))
+    return {
+        key: [plain(before.get(key)), plain(value)]
+        for key, value in after.items() if plain(before.get(key)) != plain(value)
+    }
+
+def query_live(db: Session, model):
+    """Query rows of `model` that have not been soft-deleted."""
+    return db.query(model).filter(model.deleted_at.is_(None))
+
+def without_detail(model) -> tuple:
+    """Loader options leaving out the large columns, for rows that are only checked, not returned."""
+    return defer(model.notes), defer(model.contact_info)
+
+def locked_values(db: Session, model, record_id: int, keys, user=None) -> Optional[dict]:
+    """
+    Current values of some columns of a live row, which stays locked
+    (SELECT ... FOR UPDATE) until the caller commits. None if there is no
+    such row, or it is outside `user`'s scope (then nothing is locked).
+    """
+    keys = list(keys)
+    query = db.query(*[getattr(model, key) for key in keys]).filter(model.id == record_id, model.deleted_at.is_(None))
+    if user is not None:
+        query = query.filter(scoping.scope_predicate(model, user))
+    row = query.with_for_update().first()
+    return dict(zip(keys, row)) if row is not None else None
+
+def fetch(query, order_by: list, skip: int = 0, limit: Optional[int] = None) -> list:
+    """
+    query.order_by(*order_by).offset(skip).limit(limit).all(). With sharding
+    on, the shards the query touches are queried at once and merged in order.
+    """
+    if not shards.enabled:
+        return query.order_by(*order_by).offset(skip).limit(limit).all()
+    return shards.fan_out(query, order_by, skip, limit)
+
+def record_to_dict(record) -> dict:
+    """Column values of an ORM row, made JSON-safe."""
+    values = {c.key: getattr(record, c.key) for c in record.__mapper__.column_attrs}
+    if "location_id" in values:
+        values["location"] = record.location
+    return json.loads(json.dumps(values, default=json_serial))
+
+def add_outbox_event(db: Session, table_name: str, action: str, record):
+    """
+    Queue an outbox row for downstream consumers. Call before the write's
+    commit so the event is stored in the same transaction as the change.
+    """
+    db.add(models.OutboxEvent(
+        table_name=table_name,
+        action=action,
+        record_id=record.id,
+        payload=record_to_dict(record),
+        created_at=datetime.utcnow(),
+    ))
+
+CONTACT_HANDLE_NETWORKS = ("instagram", "facebook", "twitter", "snapchat", "tiktok")
+
+def contact_handles(contact_info: Optional[dict]) -> dict:
+    """Normalized {network: handle} pairs present in a contact_info dict."""
+    contact_info = contact_info or {}
+    handles = {network: utils.normalize_handle(contact_info.get(network)) for network in CONTACT_HANDLE_NETWORKS}
+    return {network: handle for network, handle in handles.items() if handle}
+
+def contact_columns(contact_info: Optional[dict]) -> dict:
+    """Normalized email/phone column values for a contact_info dict."""
+    contact_info = contact_info or {}
+    return {
+        "contact_email": utils.normalize_email(contact_info.get("email")),
+        "contact_phone": utils.normalize_phone(contact_info.get("phone")),
+    }
+
+def index_contact_handles(db: Session, table_name: str, record_id: int, contact_info: Optional[dict]):
+    """Replace a record's handle rows from its contact_info. Call once it has an id, before commit."""
+    db.query(models.ContactHandle).filter(
+        models.ContactHandle.table_name == table_name,
+        models.ContactHandle.record_id == record_id
+    ).delete(synchronize_session=False)
+    for network, handle in contact_handles(contact_info or {}).items():
+        db.add(models.ContactHandle(table_name=table_name, record_id=record_id, network=network, handle=handle))
+
+def model_fields(db: Session, model, values: dict) -> dict:
+    """
+    Constructor kwargs for `model` from schema values: the location name is
+    interned to location_id and keys the model does not map are dropped.
+    """
+    fields = {k: v for k, v in values.items() if k != "location" and hasattr(model, k)}
+    if "location" in values:
+        fields["location_id"] = location_cache.intern(db, values["location"])
+    return fields
+
+def location_is(db: Session, column, name: str):
+    """Filter on a location_id column by location name; unknown names match nothing."""
+    location_id = location_cache.id_for(db, name)
+    return column == location_id if location_id is not None else false()
+
+def set_field(db: Session, record, key: str, value):
+    if key == "location":
+        record.location_id = location_cache.intern(db, value)
+    else:
+        setattr(record, key, value)
+
+def versioned_update(db: Session, model, record_id: int, values: dict, user=None, versions=None):
+    """
+    Write `values` to a live row with a single
+    UPDATE ... WHERE id = ? [AND version IN (...)] [AND <user's scope>],
+    bumping its version, and return the updated row. Returns None if no row
+    matched: missing, out of scope or modified since (get_scoped tells which).
+    Raises ValueError if sharding is on and the new location is in another shard.
+    """
+    stmt = update(model).where(model.id == record_id, model.deleted_at.is_(None))
+    if user is not None:
+        stmt = stmt.where(scoping.scope_predicate(model, user))
+    if versions is not None:
+        stmt = stmt.where(model.version.in_(versions))
+    stmt = stmt.values(**values, version=model.version + 1)
+    shard = shards.shard_for_record(model.__tablename__, record_id) if shards.holds(model.__tablename__) else None
+    # Rows returned by UPDATE ... RETURNING do not carry their shard, so sharded updates re-read the row
+    if shard is None and db.get_bind().dialect.update_returning:
+        record = db.execute(stmt.returning(model), execution_options={"populate_existing": True}).scalars().first()
+    elif db.execute(stmt, execution_options={"synchronize_session": False}).rowcount == 0:
+        record = None
+    else:
+        record = db.get(model, record_id, populate_existing=True)
+    # A record's shard is fixed when it is created, so it cannot follow its location to another one
+    if record is not None and shard is not None and shards.shard_for_location(record.location_id) != shard:
+        db.rollback()
+        raise ValueError("Records cannot be moved to a location in another shard")
+    return record
+
+def update_values(db: Session, model, values: dict) -> dict:
+    """Column values for an update from schema values, including the derived contact columns."""
+    fields = model_fields(db, model, values)
+    fields.pop('date_added', None)  # set once on create
+    if 'contact_info' in fields:
+        fields.update(contact_columns(fields['contact_info']))
+    fields['updated_at'] = datetime.utcnow()
+    return fields
+
+def publish_change(table_name: str, action: str, record):
+    """Announce a committed write to /events subscribers."""
+    events.bus.publish({
+        "table": table_name,
+        "action": action,
+        "id": record.id,
+        "location_id": record.location_id,
+        "owner_id": record.manager_id if table_name == "workers" else record.creator_id,
+        "updated_at": record.updated_at.isoformat() if record.updated_at else None,
+    })
+
 # User operations
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
@@ -43,22 +224,177 @@ def create_user(db: Session, user: schemas.UserCreate):
         username=user.username,
         hashed_password=hashed_password,
         role=user.role,
-        location=user.location
+        location_id=location_cache.intern(db, user.location)
     )
     db.add(db_user)
+    db.flush()
+    add_closure_node(db, models.UserClosure, db_user.id, user.parent_id)
+    db_user.parent_id = user.parent_id
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+# Hierarchy operations on the closure tables (UserClosure, LocationClosure)
+def add_closure_node(db: Session, closure, node_id: int, parent_id: Optional[int]):
+    """Link a new leaf node under `parent_id` (or as a root)."""
+    db.add(closure(ancestor_id=node_id, descendant_id=node_id, depth=0))
+    if parent_id is not None:
+        db.execute(insert(closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(closure.ancestor_id, literal(node_id), closure.depth + 1).where(closure.descendant_id == parent_id)
+        ))
+
+def move_closure_subtree(db: Session, closure, node_id: int, parent_id: Optional[int]):
+    """
+    Re-attach `node_id` and everything under it below `parent_id` (or make it
+    a root). Raises ValueError if that would create a cycle.
+    """
+    subtree = select(closure.descendant_id).where(closure.ancestor_id == node_id).scalar_subquery()
+    if parent_id is not None:
+        in_subtree = db.query(closure).filter(closure.ancestor_id == node_id, closure.descendant_id == parent_id).first()
+        if in_subtree is not None:
+            raise ValueError("Cannot move a node under itself")
+
+    # Cut the links from the node's old ancestors into its subtree ...
+    db.execute(delete(closure).where(
+        closure.descendant_id.in_(subtree),
+        closure.ancestor_id.not_in(subtree)
+    ).execution_options(synchronize_session=False))
+    if parent_id is None:
+        return
+    # ... and link every ancestor of the new parent to every node of the subtree
+    above = aliased(closure)
+    below = aliased(closure)
+    db.execute(insert(closure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+        .select_from(above).join(below, true())  # cross join, intended
+        .where(
+            above.descendant_id == parent_id,
+            below.ancestor_id == node_id
+        )
+    ))
+
+def set_user_parent(db: Session, user_id: int, parent_id: Optional[int]):
+    db_user = get_user(db, user_id)
+    if db_user is None:
+        return None
+    if parent_id is not None and get_user(db, parent_id) is None:
+        raise ValueError("Parent user not found")
+    move_closure_subtree(db, models.UserClosure, user_id, parent_id)
+    db_user.parent_id = parent_id
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def get_locations(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(models.Location).order_by(models.Location.id).offset(skip).limit(limit).all()
+
+def create_location(db: Session, name: str, parent_id: Optional[int] = None):
+    location_id = location_cache.intern(db, name)
+    if parent_id is not None:
+        return set_location_parent(db, location_id, parent_id)
+    return db.get(models.Location, location_id)
+
+def set_location_parent(db: Session, location_id: int, parent_id: Optional[int]):
+    db_location = db.get(models.Location, location_id)
+    if db_location is None:
+        return None
+    if parent_id is not None and db.get(models.Location, parent_id) is None:
+        raise ValueError("Parent location not found")
+    move_closure_subtree(db, models.LocationClosure, location_id, parent_id)
+    db_location.parent_id = parent_id
+    db.commit()
+    db.refresh(db_location)
+    return db_location
+
+# Refresh token operations
+def create_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None, commit: bool = True):
+    """Store a new refresh token for a user and return the raw token."""
+    token = auth.new_refresh_token()
+    now = datetime.utcnow()
+    db.add(models.RefreshToken(
+        user_id=user_id,
+        token_hash=auth.hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        created_at=now,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    if commit:
+        db.commit()
+    return token
+
+def get_refresh_token(db: Session, token: str):
+    return db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == auth.hash_refresh_token(token)
+    ).first()
+
+def rotate_refresh_token(db: Session, token: str):
+    """
+    Exchange a refresh token for a new one in the same family.
+    Returns (user, new_token), or None if the token is unknown, expired,
+    revoked or belongs to an inactive user. Presenting an already rotated
+    token revokes the whole family, since it means the token leaked.
+    """
+    db_token = get_refresh_token(db, token)
+    if db_token is None:
+        return None
+
+    now = datetime.utcnow()
+    if db_token.revoked_at is not None:
+        revoke_refresh_token_family(db, db_token.family_id)
+        return None
+    if db_token.expires_at <= now:
+        return None
+
+    user = get_user(db, db_token.user_id)
+    if user is None or not user.is_active:
+        return None
+
+    # Conditional write: of two concurrent refreshes with the same token only
+    # one revokes it; the other is treated as reuse
+    claimed = db.query(models.RefreshToken).filter(
+        models.RefreshToken.id == db_token.id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: now}, synchronize_session=False)
+    if claimed == 0:
+        db.rollback()
+        revoke_refresh_token_family(db, db_token.family_id)
+        return None
+    new_token = create_refresh_token(db, user.id, family_id=db_token.family_id, commit=False)
+    db.commit()
+    return user, new_token
+
+def revoke_refresh_token(db: Session, token: str):
+    db_token = get_refresh_token(db, token)
+    if db_token is not None and db_token.revoked_at is None:
+        db_token.revoked_at = datetime.utcnow()
+        db.commit()
+    return db_token
+
+def revoke_refresh_token_family(db: Session, family_id: str):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def revoke_user_refresh_tokens(db: Session, user_id: int):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user_id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
 # Potential operations
 def get_potential(db: Session, potential_id: int):
-    return db.query(models.Potential).filter(models.Potential.id == potential_id).first()
+    return query_live(db, models.Potential).filter(models.Potential.id == potential_id).first()
 
 def get_potentials(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Potential).offset(skip).limit(limit).all()
+    return fetch(query_live(db, models.Potential), [models.Potential.id], skip, limit)
 
 def get_potentials_by_creator(db: Session, creator_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Potential).filter(models.Potential.creator_id == creator_id).offset(skip).limit(limit).all()
+    return fetch(query_live(db, models.Potential).filter(models.Potential.creator_id == creator_id), [models.Potential.id], skip, limit)
 
 from datetime import datetime
 
@@ -70,15 +406,17 @@ def create_potential(db: Session, potential: schemas.PotentialCreate, creator_id
     if not potential_dict.get('date_added'):
         potential_dict['date_added'] = datetime.utcnow()
     
-    # Ensure date_added is serializable (convert datetime to ISO format string)
-    if isinstance(potential_dict['date_added'], datetime):
-        potential_dict['date_added'] = potential_dict['date_added'].isoformat()
-    
     # Create the potential
-    db_potential = models.Potential(**potential_dict, creator_id=creator_id)
+    fields = model_fields(db, models.Potential, potential_dict)
+    db_potential = models.Potential(**fields, **contact_columns(fields.get('contact_info')), creator_id=creator_id, updated_at=datetime.utcnow())
     db.add(db_potential)
+    db.flush()  # assigns the id for the outbox row
+    index_contact_handles(db, 'potentials', db_potential.id, db_potential.contact_info)
+    add_outbox_event(db, 'potentials', 'create', db_potential)
+    counts.adjust(db, models.Potential, db_potential.location_id, db_potential.creator_id, 1)
     db.commit()
     db.refresh(db_potential)
+    leaderboard.record(db_potential.location_id, db_potential.creator_id, db_potential.date_added, None)
     
     # Create audit log with serialized data
     create_audit_log(
@@ -87,54 +425,65 @@ def create_potential(db: Session, potential: schemas.PotentialCreate, creator_id
         table_name="potentials",
         record_id=db_potential.id,
         user_id=creator_id,
-        changes=potential_dict
+        changes=without_nulls(potential_dict)
     )
     
+    publish_change('potentials', 'create', db_potential)
     return db_potential
 
-def update_potential(db: Session, potential_id: int, potential: schemas.PotentialCreate, user_id: int):
-    db_potential = db.query(models.Potential).filter(models.Potential.id == potential_id).first()
-    if not db_potential:
+def update_potential(db: Session, potential_id: int, potential: schemas.PotentialCreate, user_id: int, user=None, versions=None):
+    """
+    Update a potential: its previous values are read (and the row locked) within
+    `user`'s scope, then written in one conditional UPDATE. Pass `user` to
+    limit it to that user's scope and `versions` (from If-Match) to only
+    apply it over those versions. Returns None if nothing was updated.
+    """
+    fields = update_values(db, models.Potential, potential.dict())
+    # Conversion state (is_disciple, converted_at, disciple_id) only changes
+    # through update_potential_disciple_status; a plain PUT would otherwise
+    # reset is_disciple to the schema default
+    fields.pop('is_disciple', None)
+    # The previous values feed the audit diff, the list counters and the leaderboard
+    before = locked_values(db, models.Potential, potential_id, counts.cell_keys(models.Potential) | fields.keys() | {'date_added', 'converted_at'}, user=user)
+    if before is None:  # missing, deleted or out of scope
         return None
-
-    changes = {}
-    potential_dict = potential.dict()
-    
-    for key, value in potential_dict.items():
-        # Skip date_added in updates to prevent modification
-        if key == 'date_added':
-            continue
-            
-        if getattr(db_potential, key) != value:
-            # Serialize datetime objects if they exist in other fields
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            old_value = getattr(db_potential, key)
-            if isinstance(old_value, datetime):
-                old_value = old_value.isoformat()
-            changes[key] = (old_value, value)
-            setattr(db_potential, key, value)
+    db_potential = versioned_update(db, models.Potential, potential_id, fields, user=user, versions=versions)
+    if db_potential is None:
+        return None
+    counts.moved(db, models.Potential, before, db_potential)
+    record_scope_exit(db, models.Potential, before, db_potential)
+    index_contact_handles(db, 'potentials', db_potential.id, db_potential.contact_info)
+    add_outbox_event(db, 'potentials', 'update', db_potential)
 
     db.commit()
     db.refresh(db_potential)
+    if (before['location_id'], before['date_added']) != (db_potential.location_id, db_potential.date_added):
+        leaderboard.record(before['location_id'], before['creator_id'], before['date_added'], before['converted_at'], -1)
+        leaderboard.record(db_potential.location_id, db_potential.creator_id, db_potential.date_added, db_potential.converted_at)
 
+    # log the update as [old, new] pairs of the fields that changed
     create_audit_log(
         db=db,
         action='update',
         table_name='potentials',
         record_id=db_potential.id,
         user_id=user_id,
-        changes=changes
+        changes={'changed': audit_diff(before, {k: v for k, v in fields.items() if k != 'updated_at'}), 'version': db_potential.version}
     )
+    publish_change('potentials', 'update', db_potential)
     return db_potential
 
 def delete_potential(db: Session, potential_id: int, user_id: int):
-    db_potential = db.query(models.Potential).filter(models.Potential.id == potential_id).first()
-    if not db_potential:
+    # Soft delete: the row stays as a tombstone so delta sync can report it.
+    # One conditional UPDATE, so a concurrent write just lands before it
+    now = datetime.utcnow()
+    db_potential = versioned_update(db, models.Potential, potential_id, {'deleted_at': now, 'updated_at': now})
+    if db_potential is None:
         return None
-
-    db.delete(db_potential)
+    add_outbox_event(db, 'potentials', 'delete', db_potential)
+    counts.adjust(db, models.Potential, db_potential.location_id, db_potential.creator_id, -1)
     db.commit()
+    leaderboard.record(db_potential.location_id, db_potential.creator_id, db_potential.date_added, db_potential.converted_at, -1)
 
     # log the deletion
     create_audit_log(
@@ -145,21 +494,29 @@ def delete_potential(db: Session, potential_id: int, user_id: int):
         user_id=user_id,
         changes={'deleted': True}
     )
+    publish_change('potentials', 'delete', db_potential)
     return db_potential
 
 # Disciple Operations
 def get_disciple(db: Session, disciple_id: int):
-    return db.query(models.Disciple).filter(models.Disciple.id == disciple_id).first()
+    return query_live(db, models.Disciple).filter(models.Disciple.id == disciple_id).first()
 
 def get_disciples(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Disciple).offset(skip).limit(limit).all()
+    return fetch(query_live(db, models.Disciple), [models.Disciple.id], skip, limit)
 
 def get_disciples_by_creator(db: Session, creator_id: int, skip: int = 0, limit: int = 10):
-    return db.query(models.Disciple).filter(models.Disciple.creator_id == creator_id).offset(skip).limit(limit).all()
+    return fetch(query_live(db, models.Disciple).filter(models.Disciple.creator_id == creator_id), [models.Disciple.id], skip, limit)
 
 def create_disciple(db: Session, disciple: schemas.DiscipleCreate, creator_id: int):
-    db_disciple = models.Disciple(**disciple.dict(), creator_id=creator_id, date_added=datetime.utcnow())
+    now = datetime.utcnow()
+    fields = model_fields(db, models.Disciple, disciple.dict())
+    fields['date_added'] = fields.get('date_added') or now
+    db_disciple = models.Disciple(**fields, **contact_columns(fields.get('contact_info')), creator_id=creator_id, updated_at=now)
     db.add(db_disciple)
+    db.flush()  # assigns the id for the outbox row
+    index_contact_handles(db, 'disciples', db_disciple.id, db_disciple.contact_info)
+    add_outbox_event(db, 'disciples', 'create', db_disciple)
+    counts.adjust(db, models.Disciple, db_disciple.location_id, db_disciple.creator_id, 1)
     db.commit()
     db.refresh(db_disciple)
 
@@ -170,41 +527,55 @@ def create_disciple(db: Session, disciple: schemas.DiscipleCreate, creator_id: i
         table_name='disciples',
         record_id=db_disciple.id,
         user_id=creator_id,
-        changes=disciple.dict()
+        changes=without_nulls(disciple.dict())
     )
+    publish_change('disciples', 'create', db_disciple)
     return db_disciple
 
-def update_disciple(db: Session, disciple_id: int, disciple: schemas.DiscipleCreate, user_id: int): 
-    db_disciple = db.query(models.Disciple).filter(models.Disciple.id == disciple_id).first()
-    if not db_disciple:
+def update_disciple(db: Session, disciple_id: int, disciple: schemas.DiscipleCreate, user_id: int, user=None, versions=None):
+    """
+    Update a disciple: its previous values are read (and the row locked) within
+    `user`'s scope, then written in one conditional UPDATE. Pass `user` to
+    limit it to that user's scope and `versions` (from If-Match) to only
+    apply it over those versions. Returns None if nothing was updated.
+    """
+    fields = update_values(db, models.Disciple, disciple.dict())
+    # The previous values feed the audit diff and the list counters
+    before = locked_values(db, models.Disciple, disciple_id, counts.cell_keys(models.Disciple) | fields.keys(), user=user)
+    if before is None:  # missing, deleted or out of scope
         return None
-
-    changes = {}
-    for key, value in disciple.dict().items():
-        if getattr(db_disciple, key) != value:
-            changes[key] = (getattr(db_disciple, key), value)
-            setattr(db_disciple, key, value)
+    db_disciple = versioned_update(db, models.Disciple, disciple_id, fields, user=user, versions=versions)
+    if db_disciple is None:
+        return None
+    counts.moved(db, models.Disciple, before, db_disciple)
+    record_scope_exit(db, models.Disciple, before, db_disciple)
+    index_contact_handles(db, 'disciples', db_disciple.id, db_disciple.contact_info)
+    add_outbox_event(db, 'disciples', 'update', db_disciple)
 
     db.commit()
     db.refresh(db_disciple)
 
-    # log the update
+    # log the update as [old, new] pairs of the fields that changed
     create_audit_log(
         db=db,
         action='update',
         table_name='disciples',
         record_id=db_disciple.id,
         user_id=user_id,
-        changes=changes
+        changes={'changed': audit_diff(before, {k: v for k, v in fields.items() if k != 'updated_at'}), 'version': db_disciple.version}
     )
+    publish_change('disciples', 'update', db_disciple)
     return db_disciple
 
 def delete_disciple(db: Session, disciple_id: int, user_id: int):
-    db_disciple = db.query(models.Disciple).filter(models.Disciple.id == disciple_id).first()
-    if not db_disciple:
+    # Soft delete: the row stays as a tombstone so delta sync can report it.
+    # One conditional UPDATE, so a concurrent write just lands before it
+    now = datetime.utcnow()
+    db_disciple = versioned_update(db, models.Disciple, disciple_id, {'deleted_at': now, 'updated_at': now})
+    if db_disciple is None:
         return None
-
-    db.delete(db_disciple)
+    add_outbox_event(db, 'disciples', 'delete', db_disciple)
+    counts.adjust(db, models.Disciple, db_disciple.location_id, db_disciple.creator_id, -1)
     db.commit()
 
     # log the deletion
@@ -216,21 +587,42 @@ def delete_disciple(db: Session, disciple_id: int, user_id: int):
         user_id=user_id,
         changes={'deleted': True}
     )
+    publish_change('disciples', 'delete', db_disciple)
     return db_disciple
 
 # Worker Operations
 def get_worker(db: Session, worker_id: int):
-    return db.query(models.Worker).filter(models.Worker.id == worker_id).first()
+    return query_live(db, models.Worker).filter(models.Worker.id == worker_id).first()
 
 def get_workers(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Worker).offset(skip).limit(limit).all()
+    return fetch(query_live(db, models.Worker), [models.Worker.id], skip, limit)
 
-def get_workers_by_manager(db: Session, manager_id: int, skip: int = 0, limit: int = 10):
-    return db.query(models.Worker).filter(models.Worker.manager_id == manager_id).offset(skip).limit(limit).all()
+# The scoped worker lists each filter on one column of workers and order by id,
+# so they are served by the matching (column, id) index without a sort or join.
+def get_workers_by_location(db: Session, location: str, skip: int = 0, limit: int = 10, user=None):
+    query = query_live(db, models.Worker).filter(location_is(db, models.Worker.location_id, location))
+    if user is not None:
+        query = query.filter(worker_scope(user))
+    return fetch(query, [models.Worker.id], skip, limit)
 
-def create_worker(db: Session, worker: schemas.WorkerCreate, manager_id: int):
-    db_worker = models.Worker(**worker.dict(), manager_id=manager_id, date_added=datetime.utcnow())
+def get_workers_by_location_id(db: Session, location_id: Optional[int], skip: int = 0, limit: int = 10):
+    return fetch(query_live(db, models.Worker).filter(models.Worker.location_id == location_id), [models.Worker.id], skip, limit)
+
+def get_workers_by_leader(db: Session, leader_id: int, skip: int = 0, limit: int = 10):
+    return fetch(query_live(db, models.Worker).filter(models.Worker.manager_id == leader_id), [models.Worker.id], skip, limit)
+
+def get_workers_by_role(db: Session, role: str, skip: int = 0, limit: int = 10):
+    return fetch(query_live(db, models.Worker).filter(models.Worker.role == role), [models.Worker.id], skip, limit)
+
+def create_worker(db: Session, worker: schemas.WorkerCreate, leader_id: int):
+    now = datetime.utcnow()
+    fields = model_fields(db, models.Worker, worker.dict())
+    db_worker = models.Worker(**fields, **contact_columns(fields.get('contact_info')), manager_id=leader_id, date_added=now, updated_at=now)
     db.add(db_worker)
+    db.flush()  # assigns the id for the outbox row
+    index_contact_handles(db, 'workers', db_worker.id, db_worker.contact_info)
+    add_outbox_event(db, 'workers', 'create', db_worker)
+    counts.adjust(db, models.Worker, db_worker.location_id, db_worker.manager_id, 1)
     db.commit()
     db.refresh(db_worker)
 
@@ -240,42 +632,56 @@ def create_worker(db: Session, worker: schemas.WorkerCreate, manager_id: int):
         action='create',
         table_name='workers',
         record_id=db_worker.id,
-        user_id=manager_id,
-        changes=worker.dict()
+        user_id=leader_id,
+        changes=without_nulls(worker.dict())
     )
+    publish_change('workers', 'create', db_worker)
     return db_worker
 
-def update_worker(db: Session, worker_id: int, worker: schemas.WorkerCreate, user_id: int):
-    db_worker = db.query(models.Worker).filter(models.Worker.id == worker_id).first()
-    if not db_worker:
+def update_worker(db: Session, worker_id: int, worker: schemas.WorkerCreate, user_id: int, user=None, versions=None):
+    """
+    Update a worker: its previous values are read (and the row locked) within
+    `user`'s scope, then written in one conditional UPDATE. Pass `user` to
+    limit it to that user's scope and `versions` (from If-Match) to only
+    apply it over those versions. Returns None if nothing was updated.
+    """
+    fields = update_values(db, models.Worker, worker.dict())
+    # The previous values feed the audit diff and the list counters
+    before = locked_values(db, models.Worker, worker_id, counts.cell_keys(models.Worker) | fields.keys(), user=user)
+    if before is None:  # missing, deleted or out of scope
         return None
-
-    changes = {}
-    for key, value in worker.dict().items():
-        if getattr(db_worker, key) != value:
-            changes[key] = (getattr(db_worker, key), value)
-            setattr(db_worker, key, value)
+    db_worker = versioned_update(db, models.Worker, worker_id, fields, user=user, versions=versions)
+    if db_worker is None:
+        return None
+    counts.moved(db, models.Worker, before, db_worker)
+    record_scope_exit(db, models.Worker, before, db_worker)
+    index_contact_handles(db, 'workers', db_worker.id, db_worker.contact_info)
+    add_outbox_event(db, 'workers', 'update', db_worker)
 
     db.commit()
     db.refresh(db_worker)
 
-    # log the update
+    # log the update as [old, new] pairs of the fields that changed
     create_audit_log(
         db=db,
         action='update',
         table_name='workers',
         record_id=db_worker.id,
         user_id=user_id,
-        changes=changes
+        changes={'changed': audit_diff(before, {k: v for k, v in fields.items() if k != 'updated_at'}), 'version': db_worker.version}
     )
+    publish_change('workers', 'update', db_worker)
     return db_worker
 
 def delete_worker(db: Session, worker_id: int, user_id: int):
-    db_worker = db.query(models.Worker).filter(models.Worker.id == worker_id).first()
-    if not db_worker:
+    # Soft delete: the row stays as a tombstone so delta sync can report it.
+    # One conditional UPDATE, so a concurrent write just lands before it
+    now = datetime.utcnow()
+    db_worker = versioned_update(db, models.Worker, worker_id, {'deleted_at': now, 'updated_at': now})
+    if db_worker is None:
         return None
-
-    db.delete(db_worker)
+    add_outbox_event(db, 'workers', 'delete', db_worker)
+    counts.adjust(db, models.Worker, db_worker.location_id, db_worker.manager_id, -1)
     db.commit()
 
     # log the deletion
@@ -287,6 +693,7 @@ def delete_worker(db: Session, worker_id: int, user_id: int):
         user_id=user_id,
         changes={'deleted': True}
     )
+    publish_change('workers', 'delete', db_worker)
     return db_worker
 
 def get_potentials_with_filters(
@@ -298,18 +705,18 @@ def get_potentials_with_filters(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ):
-    query = db.query(models.Potential)
+    query = query_live(db, models.Potential)
     
     if is_disciple is not None:
         query = query.filter(models.Potential.is_disciple == is_disciple)
     if location:
-        query = query.filter(models.Potential.location == location)
+        query = query.filter(location_is(db, models.Potential.location_id, location))
     if start_date:
         query = query.filter(models.Potential.date_added >= start_date)
     if end_date:
         query = query.filter(models.Potential.date_added <= end_date)
     
-    return query.offset(skip).limit(limit).all()
+    return fetch(query, [models.Potential.id], skip, limit)
 
 def get_potentials_by_creator_with_filters(
     db: Session,
@@ -321,23 +728,234 @@ def get_potentials_by_creator_with_filters(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ):
-    query = db.query(models.Potential).filter(models.Potential.creator_id == creator_id)
+    query = query_live(db, models.Potential).filter(models.Potential.creator_id == creator_id)
     
     if is_disciple is not None:
         query = query.filter(models.Potential.is_disciple == is_disciple)
     if location:
-        query = query.filter(models.Potential.location == location)
+        query = query.filter(location_is(db, models.Potential.location_id, location))
     if start_date:
         query = query.filter(models.Potential.date_added >= start_date)
     if end_date:
         query = query.filter(models.Potential.date_added <= end_date)
     
-    return query.offset(skip).limit(limit).all()
+    return fetch(query, [models.Potential.id], skip, limit)
 
-def update_potential_disciple_status(db: Session, potential_id: int, is_disciple: bool):
-    db_potential = db.query(models.Potential).filter(models.Potential.id == potential_id).first()
+def update_potential_disciple_status(db: Session, potential_id: int, is_disciple: bool, disciple_id: Optional[int] = None):
+    """Mark a potential converted (recording when, and into which disciple) or not."""
+    before = locked_values(db, models.Potential, potential_id, {'converted_at'})
+    if before is None:
+        return None
+    now = datetime.utcnow()
+    db_potential = versioned_update(db, models.Potential, potential_id, {
+        'is_disciple': is_disciple,
+        'converted_at': now if is_disciple else None,
+        'disciple_id': disciple_id if is_disciple else None,
+        'updated_at': now,
+    })
     if db_potential:
-        db_potential.is_disciple = is_disciple
+        converted_before = before['converted_at']
+        add_outbox_event(db, 'potentials', 'convert' if is_disciple else 'update', db_potential)
         db.commit()
         db.refresh(db_potential)
-    return db_potential
\ No newline at end of file
+        # a re-conversion replaces the earlier one
+        leaderboard.converted(db_potential.location_id, db_potential.creator_id, converted_before, -1)
+        leaderboard.converted(db_potential.location_id, db_potential.creator_id, db_potential.converted_at)
+        publish_change('potentials', 'convert' if is_disciple else 'update', db_potential)
+    return db_potential
+
+# Row scoping as SQL predicates, so scoped reads are answered by the database
+# instead of per-row Python checks. The rules live in scoping.SCOPE_RULES.
+def potential_scope(user):
+    return scoping.scope_predicate(models.Potential, user)
+
+def disciple_scope(user):
+    return scoping.scope_predicate(models.Disciple, user)
+
+def worker_scope(user):
+    return scoping.scope_predicate(models.Worker, user)
+
+def get_scoped(db: Session, model, record_id: int, user, detail: bool = True):
+    """
+    Fetch one live row with the caller's scope evaluated in the same query.
+    Returns (row, allowed); row is None if it does not exist. Pass
+    detail=False when the row is only checked, to skip its large columns.
+    """
+    allowed = case((scoping.scope_predicate(model, user), True), else_=False).label("allowed")
+    query = db.query(model, allowed).filter(model.id == record_id, model.deleted_at.is_(None))
+    if not detail:
+        query = query.options(*without_detail(model))
+    result = query.first()
+    if result is None:
+        return None, False
+    return result[0], bool(result[1])
+
+# SQLite builds older than 3.32 cap a statement at 999 bound parameters.
+BATCH_GET_CHUNK_SIZE = 900
+
+def get_many_by_ids(db: Session, model, ids: list, scope):
+    """
+    Fetch rows of `model` by id, evaluating `scope` in the same query.
+    Returns (found, forbidden_ids, missing_ids); found keeps the request order.
+    """
+    wanted = list(dict.fromkeys(ids))
+    allowed = case((scope, True), else_=False).label("allowed")
+    rows = {}
+    forbidden = set()
+    for start in range(0, len(wanted), BATCH_GET_CHUNK_SIZE):
+        chunk = wanted[start:start + BATCH_GET_CHUNK_SIZE]
+        live = model.deleted_at.is_(None)
+        for row, is_allowed in db.query(model, allowed).filter(model.id.in_(chunk), live):
+            if is_allowed:
+                rows[row.id] = row
+            else:
+                forbidden.add(row.id)
+
+    found = [rows[i] for i in wanted if i in rows]
+    missing = [i for i in wanted if i not in rows and i not in forbidden]
+    return found, [i for i in wanted if i in forbidden], missing
+
+def get_potentials_by_ids(db: Session, ids: list, user):
+    return get_many_by_ids(db, models.Potential, ids, potential_scope(user))
+
+def get_disciples_by_ids(db: Session, ids: list, user):
+    return get_many_by_ids(db, models.Disciple, ids, disciple_scope(user))
+
+def get_workers_by_ids(db: Session, ids: list, user):
+    return get_many_by_ids(db, models.Worker, ids, worker_scope(user))
+
+
+# Delta sync
+def record_scope_exit(db: Session, model, before: Optional[dict], record):
+    """Remember a row's previous location and owner if an update just moved it (see get_scope_exits)."""
+    owner = scoping.owner_column(model).key
+    if before is None or (before['location_id'], before[owner]) == (record.location_id, getattr(record, owner)):
+        return
+    db.add(models.ScopeExit(
+        table_name=model.__tablename__,
+        record_id=record.id,
+        location_id=before['location_id'],
+        owner_id=before[owner],
+        left_at=record.updated_at,
+    ))
+
+def get_scope_exits(db: Session, model, user, since: datetime, until: datetime) -> list:
+    """
+    Ids of `model` rows moved out of the user's scope after `since`, up to
+    `until`: the user could see them before the move and cannot
+    now. /sync reports them as deleted. Changes to the user or location
+    hierarchy leave no such record; clients resync from scratch after those.
+    """
+    scope_exit = models.ScopeExit
+    ids = list(db.execute(select(scope_exit.record_id).distinct().where(
+        scope_exit.table_name == model.__tablename__,
+        scope_exit.left_at > since,
+        scope_exit.left_at <= until,
+        scoping.scope_predicate(model, user, columns=(scope_exit.location_id, scope_exit.owner_id)),
+    )).scalars())
+    if not ids:
+        return []
+    visible = set()
+    for start in range(0, len(ids), BATCH_GET_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_GET_CHUNK_SIZE]
+        visible.update(record_id for (record_id,) in db.query(model.id).filter(model.id.in_(chunk), scoping.scope_predicate(model, user)))
+    return [record_id for record_id in ids if record_id not in visible]
+
+def get_changes_since(db: Session, model, scope, since: Optional[tuple], until: datetime, limit: int):
+    """
+    Rows of `model` in `scope` changed after the (updated_at, id) watermark
+    `since` and no later than `until`, including soft-deleted tombstones,
+    in watermark order. Fetches one row past `limit` so callers can tell
+    whether more remain.
+    """
+    query = db.query(model).filter(scope, model.updated_at <= until)
+    if since is not None:
+        updated_at, last_id = since
+        query = query.filter(or_(
+            model.updated_at > updated_at,
+            and_(model.updated_at == updated_at, model.id > last_id)
+        ))
+    return fetch(query, [model.updated_at, model.id], limit=limit + 1)
+
+
+# Contact lookups over the normalized contact columns
+CONTACT_TABLES = {
+    "potentials": (models.Potential, potential_scope),
+    "disciples": (models.Disciple, disciple_scope),
+    "workers": (models.Worker, worker_scope),
+}
+
+def find_by_contact_column(db: Session, column: str, value: Optional[str], user=None, limit: int = 100):
+    """Live records in every contact table whose `column` equals `value`, keyed by table."""
+    results = {table_name: [] for table_name in CONTACT_TABLES}
+    if not value:
+        return results
+    for table_name, (model, scope) in CONTACT_TABLES.items():
+        query = query_live(db, model).filter(getattr(model, column) == value)
+        if user is not None:
+            query = query.filter(scope(user))
+        results[table_name] = fetch(query, [model.id], limit=limit)
+    return results
+
+def find_by_phone(db: Session, phone: str, user=None, limit: int = 100):
+    return find_by_contact_column(db, "contact_phone", utils.normalize_phone(phone), user, limit)
+
+def find_by_email(db: Session, email: str, user=None, limit: int = 100):
+    return find_by_contact_column(db, "contact_email", utils.normalize_email(email), user, limit)
+
+def find_by_handle(db: Session, network: str, handle: str, user=None, limit: int = 100):
+    results = {table_name: [] for table_name in CONTACT_TABLES}
+    handle = utils.normalize_handle(handle)
+    if not handle:
+        return results
+    for table_name, (model, scope) in CONTACT_TABLES.items():
+        query = query_live(db, model).join(
+            models.ContactHandle,
+            and_(models.ContactHandle.table_name == table_name, models.ContactHandle.record_id == model.id)
+        ).filter(models.ContactHandle.network == network, models.ContactHandle.handle == handle)
+        if user is not None:
+            query = query.filter(scope(user))
+        results[table_name] = fetch(query, [model.id], limit=limit)
+    return results
+
+
+# Scoped lists: one query per call with the caller's scope as a predicate
+def potentials_for_user_query(
+    db: Session,
+    user,
+    is_disciple: Optional[bool] = None,
+    location: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """The user's live potentials matching the filters, unordered (for listing and counting)."""
+    query = query_live(db, models.Potential).filter(potential_scope(user))
+
+    if is_disciple is not None:
+        query = query.filter(models.Potential.is_disciple == is_disciple)
+    if location:
+        query = query.filter(location_is(db, models.Potential.location_id, location))
+    if start_date:
+        query = query.filter(models.Potential.date_added >= start_date)
+    if end_date:
+        query = query.filter(models.Potential.date_added <= end_date)
+    return query
+
+def get_potentials_for_user(
+    db: Session,
+    user,
+    skip: int = 0,
+    limit: int = 100,
+    is_disciple: Optional[bool] = None,
+    location: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    query = potentials_for_user_query(db, user, is_disciple, location, start_date, end_date)
+    return fetch(query, [models.Potential.id], skip, limit)
+
+def get_disciples_for_user(db: Session, user, skip: int = 0, limit: int = 100):
+    return fetch(query_live(db, models.Disciple).filter(disciple_scope(user)), [models.Disciple.id], skip, limit)
+
+def get_workers_for_user(db: Session, user, skip: int = 0, limit: int = 100):
+    return fetch(query_live(db, models.Worker).filter(worker_scope(user)), [models.Worker.id], skip, limit)
@@ -1,15 +1,535 @@
-from sqlalchemy import create_engine
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import DateTime, bindparam, create_engine, event, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.horizontal_shard import ShardedSession
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from sqlalchemy.sql.util import find_tables
 
 from .config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def warm_pool(engine, connections: int):
+    """Open `connections` pooled connections up front and return them to the pool."""
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for conn in opened:
+            conn.close()
+
+PRIMARY_SHARD = "primary"
+
+# Tables whose rows are spread over the shards. Records of the first three
+# get ids from shard_sequences and an entry in shard_records; contact handle
+# rows live next to the record they index.
+RECORD_TABLES = ("potentials", "disciples", "workers")
+SHARDED_TABLES = RECORD_TABLES + ("contact_handles",)
+
+# Stay under SQLite's bound-parameter limit in directory lookups
+LOOKUP_CHUNK_SIZE = 900
+
+def routing_criteria(whereclause) -> dict:
+    """
+    {(table, column): values} for the `column == value` and
+    `column IN (values)` terms ANDed together at the top of a WHERE clause.
+    """
+    terms = [whereclause] if whereclause is not None else []
+    criteria = {}
+    while terms:
+        term = terms.pop()
+        if isinstance(term, BooleanClauseList) and term.operator is operators.and_:
+            terms.extend(term.clauses)
+            continue
+        if not isinstance(term, BinaryExpression) or not isinstance(term.right, BindParameter):
+            continue
+        column = term.left
+        if getattr(column, "table", None) is None or not hasattr(column.table, "name"):
+            continue
+        value = term.right.effective_value
+        if value is None:
+            continue  # supplied at execution time (e.g. ORM refresh and lazy loads)
+        if term.operator is operators.eq:
+            values = {value}
+        elif term.operator is operators.in_op and term.right.expanding:
+            values = set(value)
+        else:
+            continue
+        key = (column.table.name, column.name)
+        criteria[key] = criteria[key] & values if key in criteria else values
+    return criteria
+
+class ShardSession(ShardedSession):
+    """ShardedSession that sends statements without a mapped entity (text(), Core) to the primary."""
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if mapper is None and shard_id is None:
+            shard_id = PRIMARY_SHARD
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+class ShardRouter:
+    """
+    Location-based sharding of the contact tables. Every location is pinned
+    to a shard the first time it is used (its own or its nearest ancestor's
+    SHARD_LOCATIONS entry, else the primary) and keeps it; records live in
+    their location's shard and are found by id through shard_records.
+    Users, locations, audit and the other tables stay in the primary.
+
+    Statements are routed from their WHERE clause: by record id if one is
+    given, else by location_id (scope predicates are turned into location
+    and user id lists for this), else to every shard. Ordered lists that
+    span shards are fanned out concurrently and merged here (fan_out);
+    other multi-shard statements run on each shard in turn and their rows
+    are concatenated. A write touching two databases commits them one after
+    the other, not atomically.
+    """
+
+    def __init__(self, primary, urls: dict, location_shards: dict, fan_out_workers: int):
+        unknown = set(location_shards.values()) - set(urls) - {PRIMARY_SHARD}
+        if unknown:
+            raise ValueError(f"SHARD_LOCATIONS names shards missing from SHARD_URLS: {', '.join(sorted(unknown))}")
+        self.primary = primary
+        self.engines = {PRIMARY_SHARD: primary, **{name: create_engine(url) for name, url in urls.items()}}
+        self.location_shards = location_shards
+        self.enabled = bool(urls)
+        self.fan_out_workers = fan_out_workers
+        self._locations = {}  # location_id -> shard; assignments never change
+        self._records = {}  # (table, record_id) -> shard; records never move
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def holds(self, table_name: str) -> bool:
+        return self.enabled and table_name in SHARDED_TABLES
+
+    def primary_ids(self, statement) -> list:
+        """Run a single-column select against the primary (where the closure tables live)."""
+        with self.primary.connect() as conn:
+            return list(conn.execute(statement).scalars())
+
+    # Location and record placement
+
+    def shard_for_location(self, location_id: Optional[int]) -> str:
+        if location_id is None:
+            return PRIMARY_SHARD
+        shard = self._locations.get(location_id)
+        if shard is not None:
+            return shard
+        lookup = text("SELECT shard FROM shard_locations WHERE location_id = :id")
+        with self.primary.connect() as conn:
+            shard = conn.execute(lookup, {"id": location_id}).scalar()
+        if shard is None:
+            try:
+                with self.primary.begin() as conn:
+                    shard = self._assign(conn, location_id)
+                    conn.execute(
+                        text("INSERT INTO shard_locations (location_id, shard) VALUES (:id, :shard)"),
+                        {"id": location_id, "shard": shard},
+                    )
+            except IntegrityError:  # assigned concurrently
+                with self.primary.connect() as conn:
+                    shard = conn.execute(lookup, {"id": location_id}).scalar()
+        self._locations[location_id] = shard
+        return shard
+
+    def _assign(self, conn, location_id: int) -> str:
+        ancestors = conn.execute(text(
+            "SELECT l.name FROM location_closure c JOIN locations l ON l.id = c.ancestor_id "
+            "WHERE c.descendant_id = :id ORDER BY c.depth"
+        ), {"id": location_id}).scalars()
+        for name in ancestors:
+            if name in self.location_shards:
+                return self.location_shards[name]
+        return PRIMARY_SHARD
+
+    def shards_for_records(self, table_name: str, record_ids) -> set:
+        """Shards holding these records; ids missing from shard_records predate sharding and are in the primary."""
+        found, wanted = set(), []
+        for record_id in set(record_ids):
+            shard = self._records.get((table_name, record_id))
+            if shard is None:
+                wanted.append(record_id)
+            else:
+                found.add(shard)
+        lookup = text(
+            "SELECT record_id, shard FROM shard_records WHERE table_name = :t AND record_id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        with self.primary.connect() as conn:
+            for start in range(0, len(wanted), LOOKUP_CHUNK_SIZE):
+                chunk = wanted[start:start + LOOKUP_CHUNK_SIZE]
+                located = dict(conn.execute(lookup, {"t": table_name, "ids": chunk}).all())
+                with self._lock:
+                    if len(self._records) > 100000:
+                        self._records.clear()
+                    self._records.update(((table_name, record_id), shard) for record_id, shard in located.items())
+                found.update(located.values())
+                if len(located) < len(chunk):
+                    found.add(PRIMARY_SHARD)
+        return found
+
+    def shard_for_record(self, table_name: str, record_id: int) -> str:
+        return next(iter(self.shards_for_records(table_name, [record_id])))
+
+    def allocate(self, table_name: str, shard: str) -> int:
+        """A new id for `table_name`, unique across shards, recorded as living in `shard`."""
+        while True:
+            try:
+                with self.primary.begin() as conn:
+                    params = {"t": table_name}
+                    bumped = conn.execute(
+                        text("UPDATE shard_sequences SET last_id = last_id + 1 WHERE table_name = :t"), params
+                    ).rowcount
+                    if not bumped:
+                        # First id since sharding was turned on: continue after the primary's rows
+                        conn.execute(text(
+                            f"INSERT INTO shard_sequences (table_name, last_id) "
+                            f"SELECT :t, COALESCE(MAX(id), 0) + 1 FROM {table_name}"
+                        ), params)
+                    record_id = conn.execute(
+                        text("SELECT last_id FROM shard_sequences WHERE table_name = :t"), params
+                    ).scalar()
+                    conn.execute(
+                        text("INSERT INTO shard_records (table_name, record_id, shard) VALUES (:t, :id, :shard)"),
+                        {"t": table_name, "id": record_id, "shard": shard},
+                    )
+                return record_id
+            except IntegrityError:  # another process seeded the sequence first
+                continue
+
+    # ShardedSession hooks
+
+    def shard_chooser(self, mapper, instance, clause=None, **kw):
+        table_name = mapper.local_table.name
+        if instance is None or not self.holds(table_name):
+            return PRIMARY_SHARD
+        if table_name == "contact_handles":
+            return self.shard_for_record(instance.table_name, instance.record_id)
+        return self.shard_for_location(instance.location_id)
+
+    def identity_chooser(self, mapper, primary_key, **kw):
+        table_name = mapper.local_table.name
+        if not self.holds(table_name):
+            return [PRIMARY_SHARD]
+        if table_name in RECORD_TABLES:
+            return [self.shard_for_record(table_name, primary_key[0])]
+        return list(self.engines)
+
+    def execute_chooser(self, orm_context):
+        return self.shards_for_statement(orm_context.statement)
+
+    def shards_for_statement(self, statement) -> list:
+        tables = {table.name for table in find_tables(statement, include_joins=True, include_crud=True)}
+        if not any(self.holds(name) for name in tables):
+            return [PRIMARY_SHARD]
+        criteria = routing_criteria(statement.whereclause)
+        shards = None
+        for table_name in RECORD_TABLES:
+            if (table_name, "id") in criteria:
+                shards = self.shards_for_records(table_name, criteria[(table_name, "id")])
+                break
+        else:
+            handle_tables = criteria.get(("contact_handles", "table_name"), ())
+            if ("contact_handles", "record_id") in criteria and len(handle_tables) == 1:
+                shards = self.shards_for_records(next(iter(handle_tables)), criteria[("contact_handles", "record_id")])
+            else:
+                locations = None
+                for table_name in tables:
+                    if (table_name, "location_id") in criteria:
+                        found = criteria[(table_name, "location_id")]
+                        locations = found if locations is None else locations & found
+                if locations is not None:
+                    shards = {self.shard_for_location(location_id) for location_id in locations}
+        if shards is None:
+            return list(self.engines)
+        return sorted(shards) or [PRIMARY_SHARD]
+
+    # Cross-shard reads
+
+    def _map(self, fn, shard_ids: list) -> list:
+        if len(shard_ids) == 1:
+            return [fn(shard_ids[0])]
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.fan_out_workers, thread_name_prefix="shard-fan-out")
+        return list(self._pool.map(fn, shard_ids))
+
+    def fan_out(self, query, order_by: list, skip: int = 0, limit: Optional[int] = None) -> list:
+        """
+        query.order_by(*order_by).offset(skip).limit(limit).all() over the
+        shards the query can touch, queried concurrently, each in a session
+        of its own (so the rows come back detached), then merged in order.
+        """
+        shard_ids = self.shards_for_statement(query.statement)
+        query = query.order_by(*order_by)
+        if len(shard_ids) == 1:
+            return query.set_shard(shard_ids[0]).offset(skip).limit(limit).all()
+        window = None if limit is None else skip + limit
+
+        def run(shard_id):
+            with SessionLocal() as own:
+                return query.with_session(own).set_shard(shard_id).limit(window).all()
+
+        keys = [column.key for column in order_by]
+        merged = heapq.merge(*self._map(run, shard_ids), key=lambda row: tuple(getattr(row, k) for k in keys))
+        return list(itertools.islice(merged, skip, window))
+
+    def count(self, query) -> int:
+        """query.count(), summed over the shards the query can touch."""
+        if not self.enabled:
+            return query.count()
+
+        def run(shard_id):
+            with SessionLocal() as own:
+                return query.with_session(own).set_shard(shard_id).count()
+
+        return sum(self._map(run, self.shards_for_statement(query.statement)))
+
+shards = ShardRouter(engine, settings.SHARD_URLS, settings.SHARD_LOCATIONS, settings.SHARD_FAN_OUT_WORKERS)
+
+if shards.enabled:
+    SessionLocal = sessionmaker(
+        class_=ShardSession,
+        autocommit=False,
+        autoflush=False,
+        shards=shards.engines,
+        shard_chooser=shards.shard_chooser,
+        identity_chooser=shards.identity_chooser,
+        execute_chooser=shards.execute_chooser,
+    )
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@event.listens_for(ShardSession, "before_flush")
+def _allocate_record_ids(session, flush_context, instances):
+    for record in session.new:
+        table_name = record.__table__.name
+        if table_name in RECORD_TABLES and record.id is None:
+            record.id = shards.allocate(table_name, shards.shard_for_location(record.location_id))
+
+READ_HEARTBEAT = text("SELECT beat FROM replica_heartbeat WHERE id = 1").columns(beat=DateTime)
+
+class Replica:
+    """One read replica: its engine, sessions and the lag measured at the last check."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_engine(url)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        event.listen(self.session_factory, "before_flush", self._refuse_writes)
+        self.lag: Optional[float] = None  # seconds behind the primary; None until checked or if unreachable
+        self.error: Optional[str] = None
+        self.reads = 0
+
+    @staticmethod
+    def _refuse_writes(session, flush_context, instances):
+        raise RuntimeError("Replica sessions are read-only; use get_db for routes that write")
+
+    def metrics(self) -> dict:
+        return {"name": self.name, "lag_seconds": self.lag, "error": self.error, "reads": self.reads}
+
+class ReplicaRouter:
+    """
+    Chooses where a read runs: round robin over the replicas whose lag is
+    within `max_lag`, else the primary. A client's reads also stay on the
+    primary for a while after its own writes, so it sees them: responses to
+    requests that wrote carry the write time (ReadYourWritesMiddleware) and
+    the client sends it back, so this works whichever worker serves the read.
+
+    Lag is measured every `check_interval` seconds, from a request thread,
+    with a heartbeat row: the beat last written to the primary is compared
+    with the one the replica holds, then the primary's is moved to now. A
+    replica whose lag is unknown (e.g. before the first beat) is not used.
+    """
+
+    def __init__(self, primary, replicas: list, max_lag: float, check_interval: float):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = max_lag + check_interval
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._last_check = None
+        self._round_robin = itertools.count()
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def is_sticky(self, last_write: Optional[float]) -> bool:
+        """Whether a client that last wrote at `last_write` (epoch seconds) must still read from the primary."""
+        return last_write is not None and abs(time.time() - last_write) < self.sticky_seconds
+
+    def maybe_check(self):
+        if not self.replicas:
+            return
+        if self._last_check is not None and time.monotonic() - self._last_check < self.check_interval:
+            return
+        if not self._check_lock.acquire(blocking=False):
+            return  # another thread is checking; use the previous results
+        try:
+            self._last_check = time.monotonic()
+            self.check()
+        finally:
+            self._check_lock.release()
+
+    def check(self):
+        """Measure every replica's lag, then advance the primary's heartbeat."""
+        try:
+            with self.primary.connect() as conn:
+                primary_beat = conn.execute(READ_HEARTBEAT).scalar()
+        except SQLAlchemyError:
+            for replica in self.replicas:
+                replica.lag = None
+            return
+
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    replica_beat = conn.execute(READ_HEARTBEAT).scalar()
+            except SQLAlchemyError as e:
+                replica.lag, replica.error = None, str(e.__cause__ or e)
+                continue
+            replica.error = None
+            if primary_beat is None:
+                replica.lag = None  # nothing to compare against until the first beat
+            elif replica_beat == primary_beat:
+                replica.lag = 0.0
+            elif replica_beat is None:
+                replica.lag = float("inf")
+            else:
+                replica.lag = max(0.0, (primary_beat - replica_beat).total_seconds())
+
+        try:
+            with self.primary.begin() as conn:
+                now = datetime.utcnow()
+                if conn.execute(text("UPDATE replica_heartbeat SET beat = :now WHERE id = 1"), {"now": now}).rowcount == 0:
+                    conn.execute(text("INSERT INTO replica_heartbeat (id, beat) VALUES (1, :now)"), {"now": now})
+        except SQLAlchemyError:  # another worker inserted the row first, or the primary is down
+            pass
+
+    def session_for(self, last_write: Optional[float] = None):
+        """
+        A session for a read-only request from a client that last wrote at
+        `last_write`; session.info["source"] says where it reads from.
+        """
+        self.maybe_check()
+        sticky = self.is_sticky(last_write)
+        replica = None
+        if not sticky:
+            usable = [r for r in self.replicas if r.lag is not None and r.lag <= self.max_lag]
+            if usable:
+                replica = usable[next(self._round_robin) % len(usable)]
+        with self._lock:
+            if replica is not None:
+                replica.reads += 1
+            elif sticky:
+                self.sticky_reads += 1
+            else:
+                self.primary_reads += 1
+        if replica is None:
+            db = SessionLocal()
+            db.info["source"] = "primary"
+        else:
+            db = replica.session_factory()
+            db.info["source"] = replica.name
+        return db
+
+    def session_on(self, source: str):
+        """A new session on the named source ("primary" or a replica's name), e.g. one from session.info["source"]."""
+        for replica in self.replicas:
+            if replica.name == source:
+                db = replica.session_factory()
+                db.info["source"] = source
+                return db
+        db = SessionLocal()
+        db.info["source"] = "primary"
+        return db
+
+    def metrics(self) -> dict:
+        return {
+            "max_lag_seconds": self.max_lag,
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+            "replicas": [replica.metrics() for replica in self.replicas],
+        }
+
+replicas = ReplicaRouter(
+    engine,
+    [] if shards.enabled else [Replica(f"replica-{i}", url) for i, url in enumerate(settings.READ_REPLICA_URLS)],
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_CHECK_SECONDS,
+)
+
+# The writes of the request being handled, set by ReadYourWritesMiddleware.
+# Request threads get a copy of the context, so they share the dict.
+_request_writes = ContextVar("request_writes", default=None)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_write(session):
+    writes = _request_writes.get()
+    if writes is not None:
+        writes["at"] = time.time()
+
+LAST_WRITE_HEADER = "X-Last-Write"
+LAST_WRITE_COOKIE = "last_write"
+
+class ReadYourWritesMiddleware:
+    """
+    Marks responses to requests that committed a write with the write time,
+    as an X-Last-Write header and a cookie. get_read_db keeps the client's
+    reads on the primary while that time is recent; clients that do not keep
+    cookies send the header back themselves.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas.replicas:
+            await self.app(scope, receive, send)
+            return
+        writes = {}
+        token = _request_writes.set(writes)
+
+        async def send_marked(message):
+            if message["type"] == "http.response.start" and "at" in writes:
+                value = f"{writes['at']:.3f}"
+                cookie = (f"{LAST_WRITE_COOKIE}={value}; Max-Age={math.ceil(replicas.sticky_seconds)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                headers = list(message.get("headers", []))
+                headers += [(LAST_WRITE_HEADER.lower().encode(), value.encode()), (b"set-cookie", cookie.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_marked)
+        finally:
+            _request_writes.reset(token)
+
+def last_write(request: Request) -> Optional[float]:
+    """When the client last wrote, from the X-Last-Write header or cookie."""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,3 +537,10 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(request: Request):
+    """Session for read-only routes: a replica when one is close enough, else the primary."""
+    db = replicas.session_for(last_write(request) if replicas.replicas else None)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from typing import Callable, Optional
+
+from .config import settings
+
+
+class Subscriber:
+    """
+    One connected change-feed client. Events are queued on the client's own
+    event loop in a bounded buffer; if the client falls behind, the buffer is
+    dropped and the client is told to resync instead of growing without limit.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, accepts: Callable[[dict], bool], max_buffer: int):
+        self.loop = loop
+        self.accepts = accepts
+        self.queue = asyncio.Queue(maxsize=max_buffer)
+        self.overflowed = False
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class EventBus:
+    """
+    In-process pub/sub fan-out. publish() may be called from any thread
+    (the sync routes run in the threadpool); delivery is handed to each
+    subscriber's loop, so idle subscribers cost one queue and no thread.
+    """
+
+    def __init__(self, max_buffer: int = 100):
+        self.max_buffer = max_buffer
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, accepts: Callable[[dict], bool], max_buffer: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), accepts, max_buffer or self.max_buffer)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: dict):
+        if not self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.accepts(event):
+                try:
+                    subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+                except RuntimeError:  # loop already closed
+                    self.unsubscribe(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+bus = EventBus(max_buffer=settings.EVENTS_BUFFER_SIZE)
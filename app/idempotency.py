@@ -0,0 +1,251 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from . import auth, models
+from .concurrency import route_class
+from .config import settings
+from .database import SessionLocal
+from .tokens import TokenCache
+
+RUN, REPLAY, IN_PROGRESS, MISMATCH = "run", "replay", "in_progress", "mismatch"
+
+# Response headers worth replaying; the rest are recomputed or per-response
+REPLAYED_HEADERS = {"content-type", "etag", "location", "retry-after"}
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """
+    Responses to requests sent with an Idempotency-Key, in the
+    idempotency_keys table with an in-memory LRU in front. A key is claimed
+    (row inserted without a response) before the request runs, so a retry
+    that arrives while the first attempt is still running is turned away
+    rather than run twice, even by another process.
+    """
+
+    def __init__(self, session_factory, ttl: timedelta, lock_timeout: timedelta, cache_size: int, purge_interval: float):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.purge_interval = purge_interval
+        self.cache = TokenCache(cache_size)
+        self._last_purge = 0.0
+
+    def _cache_key(self, owner: str, key: str) -> bytes:
+        return hashlib.sha256(f"{owner}\0{key}".encode()).digest()
+
+    def claim(self, owner: str, key: str, fingerprint: str) -> Tuple[str, Optional[dict]]:
+        """
+        RUN if the caller should execute the request (the key is now claimed),
+        REPLAY with the stored response, IN_PROGRESS, or MISMATCH if the key
+        was used for a different request.
+        """
+        stored = self.cache.get(self._cache_key(owner, key), time.time())
+        if stored is not None:
+            return (REPLAY, stored) if stored["fingerprint"] == fingerprint else (MISMATCH, None)
+
+        self.maybe_purge()
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            db.add(models.IdempotencyKey(
+                owner=owner, key=key, fingerprint=fingerprint, created_at=now, expires_at=now + self.ttl
+            ))
+            try:
+                db.commit()
+                return RUN, None
+            except IntegrityError:
+                db.rollback()
+
+            row = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.owner == owner, models.IdempotencyKey.key == key
+            ).first()
+            if row is None:  # released in between; let this attempt run
+                return self.claim(owner, key, fingerprint)
+            if row.fingerprint != fingerprint and row.expires_at > now:
+                return MISMATCH, None
+            if row.expires_at <= now or (row.status_code is None and row.created_at < now - self.lock_timeout):
+                # Expired, or the first attempt died without finishing: take the key over
+                row.fingerprint = fingerprint
+                row.status_code = row.headers = row.body = None
+                row.created_at, row.expires_at = now, now + self.ttl
+                db.commit()
+                return RUN, None
+            if row.status_code is None:
+                return IN_PROGRESS, None
+            stored = self._remember(row)
+            return REPLAY, stored
+
+    def complete(self, owner: str, key: str, status_code: int, headers: list, body: Optional[bytes]):
+        """Store the response; body None records that it was too large to keep."""
+        with self.session_factory() as db:
+            row = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.owner == owner, models.IdempotencyKey.key == key
+            ).first()
+            if row is None:
+                return
+            row.status_code = status_code
+            row.headers = headers
+            row.body = body
+            db.commit()
+            self._remember(row)
+
+    def release(self, owner: str, key: str):
+        """Forget a claim whose request failed, so that a retry runs again."""
+        with self.session_factory() as db:
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.owner == owner,
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code.is_(None),
+            ).delete(synchronize_session=False)
+            db.commit()
+
+    def _remember(self, row: models.IdempotencyKey) -> dict:
+        stored = {
+            "fingerprint": row.fingerprint,
+            "status_code": row.status_code,
+            "headers": row.headers or [],
+            "body": row.body,  # None when the response was too large to keep
+        }
+        expires_at = (row.expires_at - datetime.utcnow()).total_seconds() + time.time()
+        self.cache.put(self._cache_key(row.owner, row.key), stored, expires_at)
+        return stored
+
+    def maybe_purge(self):
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        with self.session_factory() as db:
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.expires_at < datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+
+
+store = IdempotencyStore(
+    SessionLocal,
+    ttl=timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+    lock_timeout=timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+    cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    purge_interval=settings.IDEMPOTENCY_PURGE_SECONDS,
+)
+
+
+async def send_json(send, status_code: int, detail: str, extra_headers: list = ()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Honors an Idempotency-Key header on authenticated POST/PUT requests
+    (login and token routes excluded): the first request runs and its
+    response is stored; retries with the same key get that response back
+    with Idempotent-Replayed: true instead of running the write again.
+    5xx responses are not stored, so those can be retried. A response larger
+    than IDEMPOTENCY_MAX_BODY_BYTES is recorded without its body, and its
+    retries get a 409 saying the write already happened.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(b"idempotency-key")
+        if key is None or route_class(scope["method"], scope["path"]) == "auth":
+            return await self.app(scope, receive, send)
+        key = key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await send_json(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+        owner = auth.request_owner(scope)
+        if owner is None:
+            return await self.app(scope, receive, send)  # the route rejects it as unauthenticated
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        fingerprint = hashlib.sha256(
+            b"\0".join([scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), bytes(body)])
+        ).hexdigest()
+
+        outcome, stored = await run_in_threadpool(store.claim, owner, key, fingerprint)
+        if outcome == REPLAY and stored["body"] is None:
+            return await send_json(
+                send, 409,
+                f"A request with this Idempotency-Key already completed with status {stored['status_code']}; "
+                "its response was too large to keep for replay",
+            )
+        if outcome == REPLAY:
+            headers = [(name.encode(), value.encode()) for name, value in stored["headers"]]
+            await send({
+                "type": "http.response.start",
+                "status": stored["status_code"],
+                "headers": headers + [
+                    (b"content-length", str(len(stored["body"])).encode()),
+                    (b"idempotent-replayed", b"true"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": stored["body"]})
+            return
+        if outcome == IN_PROGRESS:
+            return await send_json(send, 409, "A request with this Idempotency-Key is still in progress",
+                                   [(b"retry-after", b"1")])
+        if outcome == MISMATCH:
+            return await send_json(send, 422, "Idempotency-Key was already used for a different request")
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": bytes(body), "more_body": False}
+            return await receive()
+
+        response = {"status": None, "headers": [], "body": bytearray(), "too_large": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in message.get("headers", [])
+                    if name.decode("latin-1").lower() in REPLAYED_HEADERS
+                ]
+            elif message["type"] == "http.response.body" and not response["too_large"]:
+                response["body"] += message.get("body", b"")
+                if len(response["body"]) > settings.IDEMPOTENCY_MAX_BODY_BYTES:
+                    response["too_large"] = True
+                    response["body"] = bytearray()
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await run_in_threadpool(store.release, owner, key)
+            raise
+        if response["status"] is None or response["status"] >= 500:
+            await run_in_threadpool(store.release, owner, key)
+        else:
+            # The write happened even when the body is too large to keep, so the
+            # claim is completed without it rather than released for a rerun
+            body = None if response["too_large"] else bytes(response["body"])
+            await run_in_threadpool(
+                store.complete, owner, key, response["status"], response["headers"], body
+            )
@@ -0,0 +1,516 @@
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+from types import SimpleNamespace
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session, aliased, undefer
+
+from . import columnar, crud, models, schemas, scoping
+from .config import settings
+from .database import SessionLocal, shards
+from .locations import cache as location_cache
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+
+# Values that put a running job back in the queue
+REQUEUED = {"status": "queued", "started_at": None, "progress": 0.0, "runner_id": None, "lease_expires_at": None}
+
+REPORT_TABLES = {
+    "potentials": models.Potential,
+    "disciples": models.Disciple,
+    "workers": models.Worker,
+}
+EXPORT_TABLES = {**REPORT_TABLES, "audit_logs": models.AuditLog}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "cols": "application/octet-stream",
+}
+
+
+class JobLimitExceeded(Exception):
+    """The user already has as many queued/running jobs as allowed."""
+
+
+class ProgressReporter:
+    """
+    Records a job's progress from inside the worker process. Writes go
+    through their own short sessions, at most once per `interval` seconds.
+    """
+
+    def __init__(self, session_factory, job_id: str, interval: float = 1.0):
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self._last_write = 0.0
+
+    def advance(self, count: int = 1):
+        self.done += count
+        if self.total and time.monotonic() - self._last_write >= self.interval:
+            self._last_write = time.monotonic()
+            with self.session_factory() as db:
+                db.query(models.Job).filter(models.Job.id == self.job_id).update(
+                    {"progress": min(self.done / self.total, 0.99)}, synchronize_session=False
+                )
+                db.commit()
+
+
+# Exports
+
+# contact_info is flattened into contact_<field> columns, which also stand in
+# for the normalized contact_email/contact_phone lookup columns
+NOT_EXPORTED = {"contact_info", "contact_email", "contact_phone", "deleted_at", "changes_packed"}
+
+# Few distinct values, so columnar exports store each once per file
+DICTIONARY_COLUMNS = {"location", "role", "action", "table_name"}
+
+
+def export_columns(model) -> list:
+    columns = [c.key for c in model.__mapper__.column_attrs if c.key not in NOT_EXPORTED]
+    if hasattr(model, "location_id"):
+        columns.append("location")
+    if hasattr(model, "contact_info"):
+        columns += [f"contact_{key}" for key in schemas.ContactInfo.model_fields]
+    return columns
+
+
+def export_types(model) -> list:
+    """[(column, columnar type), ...] for the columns of export_columns."""
+    types = {c.key: columnar.column_type(c.columns[0].type) for c in model.__mapper__.column_attrs}
+    return [
+        (name, columnar.DICTIONARY if name in DICTIONARY_COLUMNS else types.get(name, columnar.UTF8))
+        for name in export_columns(model)
+    ]
+
+
+def typed_record(record) -> dict:
+    """Export values of a record, as Python types (datetimes, numbers) for columnar files."""
+    row = {c.key: getattr(record, c.key) for c in record.__mapper__.column_attrs}
+    if "location_id" in row:
+        row["location"] = record.location
+    if "changes_packed" in row:
+        row["changes"] = crud.audit_changes(record)
+        del row["changes_packed"]
+    for key, value in (row.pop("contact_info", None) or {}).items():
+        row[f"contact_{key}"] = value
+    return row
+
+
+def flatten_record(record) -> dict:
+    """typed_record made JSON-safe, for csv and jsonl."""
+    return json.loads(json.dumps(typed_record(record), default=crud.json_serial))
+
+
+def validate_export(params: dict, user) -> dict:
+    table = params.get("table")
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+    export_format = params.get("format", "csv")
+    if export_format == "columnar":  # the best columnar format this installation can write
+        export_format = "arrow" if columnar.pyarrow is not None else "cols"
+    if export_format not in ("csv", "jsonl") + columnar.FORMATS:
+        raise ValueError(f"format must be csv, jsonl, columnar or one of {', '.join(columnar.FORMATS)}")
+    if export_format in columnar.ARROW_FORMATS and columnar.pyarrow is None:
+        raise ValueError(f"The {export_format} format needs pyarrow installed; use columnar instead")
+    model = EXPORT_TABLES[table]
+    if model is models.AuditLog:
+        if user.role != "admin":
+            raise PermissionError("Only admins may export audit_logs")
+    elif scoping.scope_rule(model, user) == scoping.NONE:
+        raise PermissionError(f"Not authorized to export {table}")
+    return {"table": table, "format": export_format}
+
+
+def export_query(db: Session, model, user):
+    if model is models.AuditLog:  # admins only, see validate_export
+        return db.query(model).options(undefer(model.changes), undefer(model.changes_packed))
+    return crud.query_live(db, model).filter(scoping.scope_predicate(model, user))
+
+
+def run_export(db: Session, params: dict, user, path: str, progress: ProgressReporter) -> int:
+    model = EXPORT_TABLES[params["table"]]
+    query = export_query(db, model, user)
+    progress.total = shards.count(query)
+    if params["format"] in columnar.FORMATS:
+        return write_columnar(query, model, params["format"], path, progress)
+    rows = 0
+    with open(path, "w", newline="") as f:
+        if params["format"] == "csv":
+            writer = csv.DictWriter(f, fieldnames=export_columns(model), extrasaction="ignore")
+            writer.writeheader()
+            write = lambda row: writer.writerow({
+                key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in row.items()
+            })
+        else:
+            write = lambda row: f.write(json.dumps(row) + "\n")
+        for record in query.order_by(model.id).yield_per(1000):
+            write(flatten_record(record))
+            rows += 1
+            progress.advance()
+    return rows
+
+
+def write_columnar(query, model, file_format: str, path: str, progress: ProgressReporter) -> int:
+    """Stream the query into a columnar file, EXPORT_BATCH_ROWS rows per record batch."""
+    columns = export_types(model)
+    batch_rows = settings.EXPORT_BATCH_ROWS
+    rows = 0
+
+    def empty_batch():
+        return {name: [] for name, _ in columns}
+
+    with open(path, "wb") as f:
+        writer = columnar.open_writer(f, file_format, columns)
+        batch, size = empty_batch(), 0
+        for record in query.order_by(model.id).yield_per(batch_rows):
+            row = typed_record(record)
+            for name, values in batch.items():
+                values.append(row.get(name))
+            size += 1
+            if size == batch_rows:
+                writer.write(batch)
+                rows += size
+                progress.advance(size)
+                batch, size = empty_batch(), 0
+        if size:
+            writer.write(batch)
+            rows += size
+            progress.advance(size)
+        writer.close()
+    return rows
+
+
+# Reports
+
+def validate_report(params: dict, user) -> dict:
+    group_by = params.get("group_by", "location")
+    if group_by not in ("location", "leader"):
+        raise ValueError("group_by must be location or leader")
+    return {"group_by": group_by, "format": "json"}
+
+
+def run_report(db: Session, params: dict, user, path: str, progress: ProgressReporter) -> int:
+    """Live record counts per location or per leader, within the user's scope."""
+    group_by = params["group_by"]
+    groups = {}
+    progress.total = len(REPORT_TABLES)
+    for table, model in REPORT_TABLES.items():
+        if scoping.scope_rule(model, user) != scoping.NONE:
+            key = model.location_id if group_by == "location" else scoping.owner_column(model)
+            columns = [key, func.count(model.id)]
+            if model is models.Potential:
+                columns.append(func.sum(case((model.is_disciple.is_(True), 1), else_=0)))
+            query = crud.query_live(db, model).with_entities(*columns).filter(
+                scoping.scope_predicate(model, user)
+            ).group_by(key)
+            for group_key, count, *converted in query:
+                group = groups.setdefault(group_key, {"key": group_key})
+                group[table] = group.get(table, 0) + count  # a group can span shards
+                if converted:
+                    group["converted"] = group.get("converted", 0) + (converted[0] or 0)
+        progress.advance()
+
+    if group_by == "location":
+        names = {key: location_cache.name_for(db, key) for key in groups}
+    else:
+        names = dict(db.query(models.User.id, models.User.username).filter(models.User.id.in_(list(groups))))
+    for key, group in groups.items():
+        group["name"] = names.get(key)
+        for table in REPORT_TABLES:
+            group.setdefault(table, 0)
+        group.setdefault("converted", 0)
+
+    with open(path, "w") as f:
+        json.dump({
+            "group_by": group_by,
+            "generated_at": datetime.utcnow().isoformat(),
+            "groups": sorted(groups.values(), key=lambda g: (g["name"] is None, g["name"] or "")),
+        }, f)
+    return len(groups)
+
+
+class JobType:
+    def __init__(self, validate, run):
+        self.validate = validate  # (params, user) -> normalized params; ValueError/PermissionError if invalid
+        self.run = run  # (db, params, user, path, progress) -> row count
+
+
+JOB_TYPES = {
+    "export": JobType(validate_export, run_export),
+    "report": JobType(validate_report, run_report),
+}
+
+
+def execute(job_id: str, job_type: str, params: dict, user: dict, path: str) -> dict:
+    """Worker-process entry point: run one job and write its artifact to `path`."""
+    partial_path = path + ".part"
+    try:
+        with SessionLocal() as db:
+            progress = ProgressReporter(SessionLocal, job_id)
+            rows = JOB_TYPES[job_type].run(db, params, SimpleNamespace(**user), partial_path, progress)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return {"rows": rows, "size": os.path.getsize(path)}
+
+
+class ArtifactStore:
+    """Job results on local disk, one file per job, removed once expired."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, job_id: str, extension: str) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f"{job_id}.{extension}")
+
+    def delete(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class JobRunner:
+    """
+    Runs queued jobs on a process pool. Jobs live in the jobs table, so the
+    queue survives restarts and every API worker process runs its own
+    runner over the same queue. A runner claims a job with a conditional
+    UPDATE that also enforces the per-type limit across all runners, and
+    holds it under a lease it renews while the job runs; jobs whose lease
+    lapses (their runner died) are requeued by whichever runner notices.
+    """
+
+    def __init__(self, session_factory, store: ArtifactStore, workers: int, type_limits: dict,
+                 max_active_per_user: int, ttl: timedelta, purge_seconds: float, lease_seconds: float):
+        self.session_factory = session_factory
+        self.store = store
+        self.workers = workers
+        self.type_limits = type_limits
+        self.max_active_per_user = max_active_per_user
+        self.ttl = ttl
+        self.purge_seconds = purge_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool = None
+        self._owned = set()  # ids of the jobs this runner holds leases on
+        self._lock = threading.RLock()  # done callbacks may run dispatch() re-entrantly
+        self._stop = threading.Event()
+
+    def _new_pool(self):
+        # spawn, not fork: the parent has live DB connections and threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def start(self):
+        self._stop.clear()
+        self._pool = self._new_pool()
+        self.recover()
+        self.purge_expired()
+        self.dispatch()
+        threading.Thread(target=self._purge_loop, name="job-artifact-purge", daemon=True).start()
+        threading.Thread(target=self._lease_loop, name="job-lease", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, db: Session, user, job_type: str, params: dict) -> models.Job:
+        spec = JOB_TYPES.get(job_type)
+        if spec is None:
+            raise ValueError(f"Unknown job type: {job_type}")
+        params = spec.validate(params, user)
+        active = db.query(func.count(models.Job.id)).filter(
+            models.Job.user_id == user.id, models.Job.status.in_(ACTIVE)
+        ).scalar()
+        if active >= self.max_active_per_user:
+            raise JobLimitExceeded(f"At most {self.max_active_per_user} jobs may be queued or running per user")
+        job = models.Job(
+            id=uuid.uuid4().hex,
+            job_type=job_type,
+            params=params,
+            user_id=user.id,
+            status="queued",
+            progress=0.0,
+            created_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self.dispatch()
+        return job
+
+    def recover(self) -> int:
+        """Requeue running jobs whose lease has lapsed; jobs are safe to rerun."""
+        with self.session_factory() as db:
+            requeued = db.query(models.Job).filter(
+                models.Job.status == "running",
+                or_(models.Job.lease_expires_at.is_(None), models.Job.lease_expires_at < datetime.utcnow()),
+            ).update(REQUEUED, synchronize_session=False)
+            db.commit()
+            return requeued
+
+    def renew_leases(self):
+        """Extend the leases of the jobs this runner is running."""
+        with self._lock:
+            owned = list(self._owned)
+        if not owned:
+            return
+        with self.session_factory() as db:
+            db.query(models.Job).filter(
+                models.Job.id.in_(owned), models.Job.runner_id == self.runner_id, models.Job.status == "running"
+            ).update({"lease_expires_at": datetime.utcnow() + self.lease}, synchronize_session=False)
+            db.commit()
+
+    def dispatch(self):
+        """Start as many queued jobs as the per-type limits allow, oldest first."""
+        with self._lock:
+            if self._pool is None:
+                return
+            with self.session_factory() as db:
+                for job_type in JOB_TYPES:
+                    limit = self.type_limits.get(job_type, 1)
+                    running = db.query(func.count(models.Job.id)).filter(
+                        models.Job.status == "running", models.Job.job_type == job_type
+                    ).scalar()
+                    if running >= limit:
+                        continue
+                    queued = db.query(models.Job).filter(
+                        models.Job.status == "queued", models.Job.job_type == job_type
+                    ).order_by(models.Job.created_at).limit(limit - running).all()
+                    for job in queued:
+                        self._start(db, job, limit)
+
+    def _claim(self, db: Session, job: models.Job, limit: int) -> bool:
+        """Mark the job running under this runner's lease, unless another runner got it or the type is full."""
+        other = aliased(models.Job)
+        running = select(func.count(other.id)).where(
+            other.status == "running", other.job_type == job.job_type
+        ).scalar_subquery()
+        now = datetime.utcnow()
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job.id, models.Job.status == "queued", running < limit
+        ).update({
+            "status": "running", "started_at": now,
+            "runner_id": self.runner_id, "lease_expires_at": now + self.lease,
+        }, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+
+    def _start(self, db: Session, job: models.Job, limit: int):
+        if not self._claim(db, job, limit):
+            return
+        user = db.get(models.User, job.user_id)
+        if user is None or not user.is_active:
+            self._finish(job.id, status="failed", error="User is no longer active")
+            return
+        path = self.store.path_for(job.id, job.params.get("format", "json"))
+        user_values = {"id": user.id, "role": user.role, "location_id": user.location_id}
+        try:
+            future = self._pool.submit(execute, job.id, job.job_type, job.params, user_values, path)
+        except BrokenProcessPool:
+            # A worker died hard (e.g. out of memory); start a fresh pool and retry later
+            self._pool = self._new_pool()
+            self._finish(job.id, **REQUEUED)
+            return
+        self._owned.add(job.id)
+        future.add_done_callback(partial(self._finished, job.id, path))
+
+    def _finished(self, job_id: str, path: str, future):
+        with self._lock:
+            self._owned.discard(job_id)
+        now = datetime.utcnow()
+        try:
+            result = future.result()
+        except CancelledError:
+            # Shut down before it started; run it after the next start
+            self._finish(job_id, **REQUEUED)
+            return
+        except Exception as e:
+            self.store.delete(path)
+            self._finish(job_id, status="failed", error=str(e) or type(e).__name__, finished_at=now)
+        else:
+            self._finish(
+                job_id,
+                status="succeeded",
+                progress=1.0,
+                artifact_path=path,
+                artifact_size=result["size"],
+                row_count=result["rows"],
+                finished_at=now,
+                expires_at=now + self.ttl,
+            )
+        if not self._stop.is_set():
+            self.dispatch()
+
+    def _finish(self, job_id: str, **values):
+        """Record a job's outcome, unless its lease lapsed and another runner has taken it over."""
+        with self.session_factory() as db:
+            db.query(models.Job).filter(
+                models.Job.id == job_id, models.Job.runner_id == self.runner_id, models.Job.status == "running"
+            ).update({"lease_expires_at": None, **values}, synchronize_session=False)
+            db.commit()
+
+    def purge_expired(self) -> int:
+        """Delete artifacts past their expiry; the job rows stay, marked expired."""
+        with self.session_factory() as db:
+            expired = db.query(models.Job).filter(
+                models.Job.status == "succeeded", models.Job.expires_at < datetime.utcnow()
+            ).all()
+            for job in expired:
+                if job.artifact_path:
+                    self.store.delete(job.artifact_path)
+                job.status = "expired"
+                job.artifact_path = None
+            db.commit()
+            return len(expired)
+
+    def _purge_loop(self):
+        while not self._stop.wait(self.purge_seconds):
+            try:
+                self.purge_expired()
+            except Exception:
+                logger.exception("Artifact purge failed")
+
+    def _lease_loop(self):
+        while not self._stop.wait(self.lease.total_seconds() / 3):
+            try:
+                self.renew_leases()
+                if self.recover():
+                    self.dispatch()
+            except Exception:
+                logger.exception("Job lease renewal failed")
+
+
+runner = JobRunner(
+    SessionLocal,
+    ArtifactStore(settings.ARTIFACT_DIR),
+    workers=settings.JOB_WORKERS,
+    type_limits=settings.JOB_TYPE_CONCURRENCY,
+    max_active_per_user=settings.JOB_MAX_ACTIVE_PER_USER,
+    ttl=timedelta(hours=settings.ARTIFACT_TTL_HOURS),
+    purge_seconds=settings.JOB_PURGE_SECONDS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+)
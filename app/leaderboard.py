@@ -0,0 +1,268 @@
+import heapq
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from . import counts, models, scoping
+from .cohorts import week_start
+from .config import settings
+from .database import PRIMARY_SHARD, SessionLocal, shards
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("week", "month")
+METRICS = ("added", "converted")
+ADDED, CONVERTED = 0, 1
+
+
+def period_start(period: str, moment: datetime) -> datetime:
+    """Start of the week (Monday) or month that `moment` falls in, UTC."""
+    if period == "week":
+        return week_start(moment)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def earliest_kept(period: str, now: datetime) -> datetime:
+    start = period_start(period, now)
+    for _ in range(settings.LEADERBOARD_PERIODS_KEPT - 1):
+        start = period_start(period, start - timedelta(days=1))
+    return start
+
+
+def new_cells():
+    # (period, start) -> (location_id, creator_id) -> [added, converted]
+    return defaultdict(lambda: defaultdict(lambda: [0, 0]))
+
+
+def add_to(cells, metric: int, location_id: Optional[int], creator_id: Optional[int], when: datetime, delta: int,
+           now: datetime) -> list:
+    """Count `delta` into every period `when` falls in that is still kept; returns the (period, start) keys touched."""
+    touched = []
+    for period in PERIODS:
+        start = period_start(period, when)
+        if start >= earliest_kept(period, now):
+            cells[(period, start)][(location_id or 0, creator_id or 0)][metric] += delta
+            touched.append((period, start))
+    return touched
+
+
+class Leaderboard:
+    """
+    Potentials added and converted per leader, location and week/month,
+    held in memory so top-K queries need no database scan. crud feeds it
+    after each committed create, conversion, move and delete.
+
+    Counts made in this process are kept as pending and added to
+    leaderboard_counts every `flush_interval` seconds; the totals of every
+    process are then reloaded and the pending counts made since laid on
+    top. Reads therefore see this process's writes at once and other
+    processes' within about two intervals. Rebuild from potentials with
+    rebuild() (migrate.py --rebuild-leaderboard).
+    """
+
+    def __init__(self, session_factory, flush_interval: float):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._cells = new_cells()     # totals + pending, what reads see
+        self._by_leader = {}          # (period, start) -> {creator_id: [added, converted]}, summed over locations
+        self._pending = new_cells()   # counted here, not yet in leaderboard_counts
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._subtrees = {}           # cached closure subtrees, cleared on reload
+        self._usernames = {}
+
+    # Feeding
+
+    def _count(self, metric: int, location_id, creator_id, when: Optional[datetime], delta: int):
+        if when is None:
+            return
+        now = datetime.utcnow()
+        with self._lock:
+            add_to(self._pending, metric, location_id, creator_id, when, delta, now)
+            for key in add_to(self._cells, metric, location_id, creator_id, when, delta, now):
+                self._by_leader.setdefault(key, {}).setdefault(creator_id or 0, [0, 0])[metric] += delta
+
+    def record(self, location_id, creator_id, date_added: Optional[datetime], converted_at: Optional[datetime],
+               delta: int = 1):
+        """Count a potential (and its conversion, if any); delta=-1 takes it back out."""
+        self._count(ADDED, location_id, creator_id, date_added, delta)
+        self._count(CONVERTED, location_id, creator_id, converted_at, delta)
+
+    def converted(self, location_id, creator_id, converted_at: Optional[datetime], delta: int = 1):
+        self._count(CONVERTED, location_id, creator_id, converted_at, delta)
+
+    # Persistence
+
+    def flush(self):
+        """Save pending counts, drop periods no longer kept and reload everyone's totals."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, new_cells()
+            try:
+                with self.session_factory() as db:
+                    for (period, start), cells in pending.items():
+                        for (location_id, creator_id), (added, converted) in cells.items():
+                            if added or converted:
+                                counts.increment(db, models.LeaderboardCount, {
+                                    "period": period, "period_start": start,
+                                    "location_id": location_id, "creator_id": creator_id,
+                                }, {"added": added, "converted": converted})
+                    now = datetime.utcnow()
+                    for period in PERIODS:
+                        db.query(models.LeaderboardCount).filter(
+                            models.LeaderboardCount.period == period,
+                            models.LeaderboardCount.period_start < earliest_kept(period, now),
+                        ).delete(synchronize_session=False)
+                    db.commit()
+                    rows = db.query(
+                        models.LeaderboardCount.period, models.LeaderboardCount.period_start,
+                        models.LeaderboardCount.location_id, models.LeaderboardCount.creator_id,
+                        models.LeaderboardCount.added, models.LeaderboardCount.converted,
+                    ).all()
+            except Exception:
+                with self._lock:  # keep the counts for the next attempt
+                    for key, cells in pending.items():
+                        for cell, values in cells.items():
+                            self._pending[key][cell][ADDED] += values[ADDED]
+                            self._pending[key][cell][CONVERTED] += values[CONVERTED]
+                raise
+
+            totals = new_cells()
+            for period, start, location_id, creator_id, added, converted in rows:
+                totals[(period, start)][(location_id, creator_id)] = [added, converted]
+            with self._lock:
+                for key, cells in self._pending.items():  # counted while this flush ran
+                    for cell, values in cells.items():
+                        totals[key][cell][ADDED] += values[ADDED]
+                        totals[key][cell][CONVERTED] += values[CONVERTED]
+                by_leader = {}
+                for key, cells in totals.items():
+                    leaders = by_leader[key] = {}
+                    for (_, creator_id), (added, converted) in cells.items():
+                        values = leaders.setdefault(creator_id, [0, 0])
+                        values[ADDED] += added
+                        values[CONVERTED] += converted
+                self._cells, self._by_leader = totals, by_leader
+                self._subtrees.clear()
+                self._loaded = True
+
+    def start(self):
+        self._stop.clear()
+        self.flush()
+        threading.Thread(target=self._flush_loop, name="leaderboard-flush", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Leaderboard flush failed")
+
+    # Queries
+
+    def _subtree(self, db: Session, kind: str, root_id: int) -> frozenset:
+        key = (kind, root_id)
+        ids = self._subtrees.get(key)
+        if ids is None:
+            subquery = scoping.locations_under(root_id) if kind == "locations" else scoping.users_under(root_id)
+            ids = self._subtrees[key] = frozenset(db.execute(subquery).scalars())
+        return ids
+
+    def top(self, db: Session, user, period: str = "week", metric: str = "added", limit: int = 10,
+            at: Optional[datetime] = None):
+        """
+        (period start, [(creator_id, added, converted), ...]): the `limit`
+        leaders with the most potentials added or converted in the period
+        holding `at` (default now), counting only potentials the user may see.
+        """
+        if not self._loaded:
+            self.flush()
+        start = period_start(period, at or datetime.utcnow())
+        key = (period, start)
+        rule = scoping.scope_rule(models.Potential, user)
+        if rule == scoping.LOCATION_TREE:
+            locations = self._subtree(db, "locations", user.location_id) if user.location_id is not None else ()
+        elif rule == scoping.TEAM:
+            team = self._subtree(db, "users", user.id)
+
+        with self._lock:
+            leaders = self._by_leader.get(key, {})
+            if rule == scoping.ALL:
+                candidates = leaders.items()
+            elif rule == scoping.TEAM:
+                candidates = [(creator_id, values) for creator_id, values in leaders.items() if creator_id in team]
+            elif rule == scoping.OWN:
+                candidates = [(user.id, leaders[user.id])] if user.id in leaders else []
+            elif rule == scoping.LOCATION_TREE:
+                summed = {}
+                for (location_id, creator_id), (added, converted) in self._cells.get(key, {}).items():
+                    if location_id in locations:
+                        values = summed.setdefault(creator_id, [0, 0])
+                        values[ADDED] += added
+                        values[CONVERTED] += converted
+                candidates = summed.items()
+            else:
+                candidates = []
+            primary = METRICS.index(metric)
+            ranked = heapq.nlargest(
+                limit,
+                ((creator_id, added, converted) for creator_id, (added, converted) in candidates
+                 if creator_id and (added or converted)),
+                key=lambda row: (row[1 + primary], row[2 - primary], -row[0]),
+            )
+        return start, ranked
+
+    def usernames(self, db: Session, user_ids) -> dict:
+        """Usernames of leaders, cached for the life of the process (users are not renamed)."""
+        missing = [user_id for user_id in user_ids if user_id not in self._usernames]
+        if missing:
+            self._usernames.update(db.query(models.User.id, models.User.username).filter(models.User.id.in_(missing)))
+        return {user_id: self._usernames.get(user_id) for user_id in user_ids}
+
+
+def rebuild(conn):
+    """Recount leaderboard_counts from potentials (and shards); run in the caller's transaction."""
+    now = datetime.utcnow()
+    oldest = min(earliest_kept(period, now) for period in PERIODS)
+    potential = models.Potential
+    stmt = select(potential.location_id, potential.creator_id, potential.date_added, potential.converted_at).where(
+        potential.deleted_at.is_(None),
+        or_(potential.date_added >= oldest, potential.converted_at >= oldest),
+    )
+    rows = list(conn.execute(stmt))
+    if shards.holds(potential.__tablename__):
+        for name, shard_engine in shards.engines.items():
+            if name != PRIMARY_SHARD:
+                with shard_engine.connect() as shard_conn:
+                    rows += shard_conn.execute(stmt).all()
+
+    cells = new_cells()
+    for location_id, creator_id, date_added, converted_at in rows:
+        if date_added is not None:
+            add_to(cells, ADDED, location_id, creator_id, date_added, 1, now)
+        if converted_at is not None:
+            add_to(cells, CONVERTED, location_id, creator_id, converted_at, 1, now)
+
+    conn.execute(delete(models.LeaderboardCount))
+    values = [
+        {"period": period, "period_start": start, "location_id": location_id, "creator_id": creator_id,
+         "added": added, "converted": converted}
+        for (period, start), period_cells in cells.items()
+        for (location_id, creator_id), (added, converted) in period_cells.items()
+    ]
+    if values:
+        conn.execute(insert(models.LeaderboardCount), values)
+
+
+board = Leaderboard(SessionLocal, settings.LEADERBOARD_FLUSH_SECONDS)
@@ -0,0 +1,83 @@
+import threading
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+
+class LocationCache:
+    """
+    In-process name <-> id map for the locations table. Locations are few and
+    never renamed in place, so once seen an entry stays valid for the life
+    of the process.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def remember(self, location_id: int, name: str):
+        with self._lock:
+            self._ids[name] = location_id
+            self._names[location_id] = name
+
+    def load(self, db: Session):
+        """Warm the cache with every known location."""
+        from .models import Location
+        for location_id, name in db.query(Location.id, Location.name):
+            self.remember(location_id, name)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+    def id_for(self, db: Session, name: Optional[str]) -> Optional[int]:
+        """Id of an existing location, or None if the name is unknown."""
+        if not name:
+            return None
+        location_id = self._ids.get(name)
+        if location_id is None and db is not None:
+            from .models import Location
+            location_id = db.query(Location.id).filter(Location.name == name).scalar()
+            if location_id is not None:
+                self.remember(location_id, name)
+        return location_id
+
+    def name_for(self, db: Optional[Session], location_id: Optional[int]) -> Optional[str]:
+        if location_id is None:
+            return None
+        name = self._names.get(location_id)
+        if name is None and db is not None:
+            from .models import Location
+            name = db.query(Location.name).filter(Location.id == location_id).scalar()
+            if name is not None:
+                self.remember(location_id, name)
+        return name
+
+    def intern(self, db: Session, name: Optional[str]) -> Optional[int]:
+        """
+        Id for a location name, creating the location if needed. New rows are
+        committed in their own short session so the id stays valid even if the
+        caller's transaction rolls back.
+        """
+        location_id = self.id_for(db, name)
+        if location_id is not None or not name:
+            return location_id
+        from .models import Location, LocationClosure
+        with Session(bind=db.get_bind()) as own:
+            location = Location(name=name)
+            own.add(location)
+            try:
+                own.flush()
+                own.add(LocationClosure(ancestor_id=location.id, descendant_id=location.id, depth=0))
+                own.commit()
+            except IntegrityError:  # created concurrently
+                own.rollback()
+            location_id = own.query(Location.id).filter(Location.name == name).scalar()
+        self.remember(location_id, name)
+        return location_id
+
+
+cache = LocationCache()
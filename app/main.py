@@ -1,13 +1,44 @@
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import engine, Base
-from .routers import auth, potentials, workers
+from . import concurrency, idempotency, leaderboard
+from .auth import revocations, signing_key
+from .config import settings
+from .database import engine, replicas, ReadYourWritesMiddleware, SessionLocal, warm_pool
+from .jobs import runner as job_runner
+from .locations import cache as location_cache
+from .migrations import is_current, upgrade
+from .routers import auth, potentials, disciples, workers, contacts, sync, events, locations, jobs, metrics, reports
 
-# Create all database tables
-Base.metadata.create_all(bind=engine)
+# Nothing here touches the database at import time; schema changes are made
+# by migrate.py and the lifespan below only checks and warms up.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.AUTO_MIGRATE:
+        upgrade(engine)
+    elif not is_current(engine):
+        raise RuntimeError("Database schema is not up to date; run `python migrate.py` first")
+    warm_pool(engine, settings.DB_POOL_WARM_CONNECTIONS)
+    replicas.maybe_check()  # connects to each replica and measures its lag before the first read
+    with SessionLocal() as db:
+        location_cache.load(db)
+    signing_key()
+    revocations.start()
+    # Sync endpoints share one threadpool; size it so each route class can
+    # reach its own concurrency limit without borrowing from the others
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    thread_limiter.total_tokens = max(thread_limiter.total_tokens, concurrency.thread_tokens_needed())
+    job_runner.start()
+    leaderboard.board.start()
+    yield
+    leaderboard.board.stop()
+    job_runner.stop()
+    revocations.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 origins = [
@@ -16,19 +47,34 @@ origins = [
     "http://localhost:3000",
 ]
 
+# Middleware added first runs innermost: idempotency replays are subject to
+# the concurrency limits, and CORS is outermost so that shed (503)
+# responses still get CORS headers
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_middleware(concurrency.ConcurrencyLimitMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Total-Count-Estimated", "X-Last-Write"],
 )
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(potentials.router)
-# app.include_router(disciples.router)
+app.include_router(disciples.router)
 app.include_router(workers.router)
+app.include_router(contacts.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+app.include_router(locations.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(reports.router)
 
 @app.get("/")
 async def root():
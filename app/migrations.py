@@ -0,0 +1,230 @@
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateTable
+
+from .database import PRIMARY_SHARD, SHARDED_TABLES, Base, shards
+from . import counts, leaderboard
+from . import models  # noqa: F401  (registers the tables on Base.metadata)
+
+# Columns added to tables after their first release. create_all() never alters
+# an existing table, so databases created by an older version get these here.
+def backfill_contact_columns(table):
+    """Populate normalized contact columns and handle rows from contact_info."""
+    def backfill(conn):
+        from .crud import contact_handles
+        from .utils import normalize_email, normalize_phone
+
+        conn.execute(text("DELETE FROM contact_handles WHERE table_name = :t"), {"t": table})
+        rows = conn.execute(text(f"SELECT id, contact_info FROM {table}")).all()
+        for record_id, contact_info in rows:
+            if isinstance(contact_info, str):
+                contact_info = json.loads(contact_info)
+            contact_info = contact_info or {}
+            conn.execute(
+                text(f"UPDATE {table} SET contact_email = :email, contact_phone = :phone WHERE id = :id"),
+                {"email": normalize_email(contact_info.get("email")),
+                 "phone": normalize_phone(contact_info.get("phone")),
+                 "id": record_id},
+            )
+            for network, handle in contact_handles(contact_info).items():
+                conn.execute(
+                    text("INSERT INTO contact_handles (table_name, record_id, network, handle) VALUES (:t, :id, :n, :h)"),
+                    {"t": table, "id": record_id, "n": network, "h": handle},
+                )
+    return backfill
+
+
+def backfill_location_ids(table):
+    """Intern the legacy free-text location column into locations and point location_id at it."""
+    def backfill(conn):
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if "location" not in columns:
+            return
+        conn.execute(text(
+            f"INSERT INTO locations (name) SELECT DISTINCT location FROM {table} "
+            f"WHERE location IS NOT NULL AND location NOT IN (SELECT name FROM locations)"
+        ))
+        conn.execute(text(
+            f"UPDATE {table} SET location_id = (SELECT id FROM locations WHERE locations.name = {table}.location)"
+        ))
+    return backfill
+
+
+def backfill_conversions(conn):
+    """Conversion time and disciple of already converted potentials, from their 'convert' audit rows."""
+    rows = conn.execute(text(
+        "SELECT record_id, changes, timestamp FROM audit_logs "
+        "WHERE table_name = 'potentials' AND action = 'convert' ORDER BY id"
+    )).all()
+    for record_id, changes, timestamp in rows:
+        if isinstance(changes, str):
+            changes = json.loads(changes)
+        disciple_id = (changes or {}).get("converted_to_disciple_id")
+        if disciple_id is None:
+            continue
+        conn.execute(
+            text("UPDATE potentials SET converted_at = :at, disciple_id = :disciple_id WHERE id = :id AND is_disciple"),
+            {"at": timestamp, "disciple_id": disciple_id, "id": record_id},
+        )
+
+
+# (table, column, DDL after the column type, backfill run once when the
+#  column is added: an SQL string or a callable taking the connection).
+# The type itself is rendered from the model for the database's dialect.
+ADDED_COLUMNS = [
+    ("workers", "role", "DEFAULT 'worker'", None),
+    ("potentials", "updated_at", "", "UPDATE potentials SET updated_at = date_added"),
+    ("potentials", "deleted_at", "", None),
+    ("disciples", "updated_at", "", "UPDATE disciples SET updated_at = date_added"),
+    ("disciples", "deleted_at", "", None),
+    ("workers", "updated_at", "", "UPDATE workers SET updated_at = date_added"),
+    ("workers", "deleted_at", "", None),
+    # the contact backfill fills both columns, so it hangs off the second one
+    ("potentials", "contact_email", "", None),
+    ("potentials", "contact_phone", "", backfill_contact_columns("potentials")),
+    ("disciples", "contact_email", "", None),
+    ("disciples", "contact_phone", "", backfill_contact_columns("disciples")),
+    ("workers", "contact_email", "", None),
+    ("workers", "contact_phone", "", backfill_contact_columns("workers")),
+    ("users", "location_id", "REFERENCES locations(id)", backfill_location_ids("users")),
+    ("potentials", "location_id", "REFERENCES locations(id)", backfill_location_ids("potentials")),
+    ("disciples", "location_id", "REFERENCES locations(id)", backfill_location_ids("disciples")),
+    ("workers", "location_id", "REFERENCES locations(id)", backfill_location_ids("workers")),
+    ("users", "parent_id", "REFERENCES users(id)", None),
+    ("potentials", "version", "NOT NULL DEFAULT 1", None),
+    ("disciples", "version", "NOT NULL DEFAULT 1", None),
+    ("workers", "version", "NOT NULL DEFAULT 1", None),
+    # the conversion backfill fills both columns, so it hangs off the second one
+    ("potentials", "converted_at", "", None),
+    ("potentials", "disciple_id", "REFERENCES disciples(id)", backfill_conversions),
+    ("audit_logs", "changes_packed", "", None),
+    ("jobs", "runner_id", "", None),
+    ("jobs", "lease_expires_at", "", None),
+    ("outbox_checkpoints", "gaps", "", None),
+]
+
+# Columns replaced by newer ones; dropped (with their indexes) once migrated.
+# (table, column)
+DROPPED_COLUMNS = [
+    ("users", "location"),
+    ("potentials", "location"),
+    ("disciples", "location"),
+    ("workers", "location"),
+]
+
+
+def add_missing_columns(conn, tables=None):
+    inspector = inspect(conn)
+    for table, column, ddl, backfill in ADDED_COLUMNS:
+        if tables is not None and table not in tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            column_type = Base.metadata.tables[table].c[column].type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type} {ddl}".rstrip()))
+            if callable(backfill):
+                backfill(conn)
+            elif backfill:
+                conn.execute(text(backfill))
+
+
+def drop_replaced_columns(conn):
+    inspector = inspect(conn)
+    for table, column in DROPPED_COLUMNS:
+        if column not in {c["name"] for c in inspector.get_columns(table)}:
+            continue
+        for index in inspector.get_indexes(table):
+            if column in index["column_names"]:
+                conn.execute(text(f"DROP INDEX {index['name']}"))
+        try:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        except OperationalError:
+            # SQLite before 3.35 cannot drop columns; the column is no longer
+            # mapped, so leaving it in place only costs space.
+            pass
+
+
+def ensure_closure_self_rows(conn):
+    """Every user and location is its own depth-0 ancestor in its closure table."""
+    for table, closure in (("users", "user_closure"), ("locations", "location_closure")):
+        conn.execute(text(
+            f"INSERT INTO {closure} (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM {table} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {closure} c WHERE c.ancestor_id = {table}.id AND c.descendant_id = {table}.id)"
+        ))
+
+
+def create_missing_indexes(conn, tables=None):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if tables is not None and table.name not in tables:
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+
+
+def upgrade_shard(engine):
+    """
+    Create or upgrade the sharded tables in one shard database. They are
+    created without foreign keys, since users and locations stay in the
+    primary.
+    """
+    with engine.begin() as conn:
+        existing = set(inspect(conn).get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name in SHARDED_TABLES and table.name not in existing:
+                conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        add_missing_columns(conn, SHARDED_TABLES)
+        create_missing_indexes(conn, SHARDED_TABLES)
+
+
+def schema_fingerprint() -> str:
+    """Digest of the tables, columns and indexes this code expects."""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(sorted(f"{table.name}.{column.name}" for column in table.columns))
+        parts.extend(sorted(f"{table.name}:{index.name}" for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def upgrade(engine):
+    """
+    Bring the database schema up to date, along with every shard database
+    when sharding is on. Safe to run repeatedly, but not from several
+    processes at once: run it once per deploy (migrate.py) before starting
+    the workers.
+    """
+    Base.metadata.create_all(bind=engine)
+    for name, shard_engine in shards.engines.items():
+        if name != PRIMARY_SHARD:
+            upgrade_shard(shard_engine)
+    with engine.begin() as conn:
+        add_missing_columns(conn)
+        drop_replaced_columns(conn)
+        create_missing_indexes(conn)
+        ensure_closure_self_rows(conn)
+        if conn.execute(text("SELECT 1 FROM record_counts LIMIT 1")).first() is None:
+            counts.rebuild(conn)  # first upgrade since list totals were added
+        if conn.execute(text("SELECT 1 FROM leaderboard_counts LIMIT 1")).first() is None:
+            leaderboard.rebuild(conn)
+        conn.execute(text("DELETE FROM schema_version"))
+        conn.execute(
+            text("INSERT INTO schema_version (id, fingerprint, upgraded_at) VALUES (1, :fingerprint, :now)"),
+            {"fingerprint": schema_fingerprint(), "now": datetime.utcnow()},
+        )
+
+
+def is_current(engine) -> bool:
+    """Whether the database was upgraded by this version of the code; one query, no reflection."""
+    try:
+        with engine.connect() as conn:
+            stored = conn.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1")).scalar()
+    except (OperationalError, ProgrammingError):  # no schema_version table yet
+        return False
+    return stored == schema_fingerprint()
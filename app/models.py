@@ -1,6 +1,30 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, DateTime, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, Float, Integer, LargeBinary, String, DateTime, ForeignKey, DateTime, JSON, Index
+from sqlalchemy.orm import deferred, object_session, relationship, synonym
 from .database import Base
+from .locations import cache as location_cache
+
+def location_name():
+    """Read-only `location` name for a row's location_id, served from the location cache."""
+    return property(lambda self: location_cache.name_for(object_session(self), self.location_id))
+
+class Location(Base):
+    __tablename__ = 'locations'
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    parent_id = Column(Integer, ForeignKey('locations.id'), nullable=True)  # region this location belongs to
+
+class LocationClosure(Base):
+    """Every (ancestor, descendant) pair in the location tree, including each location with itself."""
+    __tablename__ = 'location_closure'
+
+    ancestor_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    depth = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_location_closure_descendant_id', 'descendant_id'),
+    )
 
 class User(Base):
     __tablename__ = 'users'
@@ -10,12 +34,26 @@ class User(Base):
     hashed_password = Column(String)
     role = Column(String, default='worker')  # Default role is 'worker'
     is_active = Column(Boolean, default=True)
-    location = Column(String)
+    location_id = Column(Integer, ForeignKey('locations.id'), index=True)
+    location = location_name()
+    parent_id = Column(Integer, ForeignKey('users.id'), nullable=True)  # who this user reports to
 
     created_potentials = relationship("Potential", back_populates="creator")
     created_disciples = relationship("Disciple", back_populates="creator")
     managed_workers = relationship("Worker", back_populates="manager")
 
+class UserClosure(Base):
+    """Every (ancestor, descendant) pair in the reporting tree, including each user with itself."""
+    __tablename__ = 'user_closure'
+
+    ancestor_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    depth = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_user_closure_descendant_id', 'descendant_id'),
+    )
+
 class Potential(Base):
     __tablename__ = 'potentials'
 
@@ -23,14 +61,31 @@ class Potential(Base):
     first_name = Column(String)
     last_name = Column(String)
     contact_info = Column(JSON)  # Store contact info as JSON
-    location = Column(String)
+    contact_email = Column(String, nullable=True, index=True)  # normalized from contact_info
+    contact_phone = Column(String, nullable=True, index=True)  # E.164, normalized from contact_info
+    location_id = Column(Integer, ForeignKey('locations.id'), index=True)
+    location = location_name()
     notes = Column(String, nullable=True)
     date_added = Column(DateTime)
     is_disciple = Column(Boolean, default=False)
+    converted_at = Column(DateTime, nullable=True)  # when it was converted to a disciple
+    disciple_id = Column(Integer, ForeignKey('disciples.id'), nullable=True)  # the disciple it became
     creator_id = Column(Integer, ForeignKey('users.id'))
+    leader_id = synonym('creator_id')  # schemas expose the creator as leader_id
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)  # soft-delete tombstone
+    version = Column(Integer, nullable=False, default=1)  # bumped on every write, served as the ETag
 
     creator = relationship("User", back_populates="created_potentials")
 
+    # (scope, updated_at, id) indexes serve the delta-sync watermark scans
+    __table_args__ = (
+        Index('ix_potentials_updated_at_id', 'updated_at', 'id'),
+        Index('ix_potentials_creator_id_updated_at_id', 'creator_id', 'updated_at', 'id'),
+        Index('ix_potentials_date_added', 'date_added'),  # cohort refreshes read one week at a time
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class Disciple(Base):
     __tablename__ = 'disciples'
 
@@ -38,13 +93,26 @@ class Disciple(Base):
     first_name = Column(String)
     last_name = Column(String)
     contact_info = Column(JSON)  # Store contact info as JSON
-    location = Column(String)
+    contact_email = Column(String, nullable=True, index=True)  # normalized from contact_info
+    contact_phone = Column(String, nullable=True, index=True)  # E.164, normalized from contact_info
+    location_id = Column(Integer, ForeignKey('locations.id'), index=True)
+    location = location_name()
     notes = Column(String, nullable=True)
     date_added = Column(DateTime)
     creator_id = Column(Integer, ForeignKey('users.id'))
+    leader_id = synonym('creator_id')  # schemas expose the creator as leader_id
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)  # soft-delete tombstone
+    version = Column(Integer, nullable=False, default=1)  # bumped on every write, served as the ETag
 
     creator = relationship("User", back_populates="created_disciples")
 
+    __table_args__ = (
+        Index('ix_disciples_updated_at_id', 'updated_at', 'id'),
+        Index('ix_disciples_creator_id_updated_at_id', 'creator_id', 'updated_at', 'id'),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class Worker(Base):
     __tablename__ = 'workers'
 
@@ -52,13 +120,33 @@ class Worker(Base):
     first_name = Column(String)
     last_name = Column(String)
     contact_info = Column(JSON)  # Store contact info as JSON
-    location = Column(String)
+    contact_email = Column(String, nullable=True, index=True)  # normalized from contact_info
+    contact_phone = Column(String, nullable=True, index=True)  # E.164, normalized from contact_info
+    location_id = Column(Integer, ForeignKey('locations.id'))
+    location = location_name()
     notes = Column(String, nullable=True)
     date_added = Column(DateTime)
+    role = Column(String, default='worker')
     manager_id = Column(Integer, ForeignKey('users.id'))
+    leader_id = synonym('manager_id')  # routers and schemas call the manager the leader
+    updated_at = Column(DateTime)
+    deleted_at = Column(DateTime, nullable=True)  # soft-delete tombstone
+    version = Column(Integer, nullable=False, default=1)  # bumped on every write, served as the ETag
 
     manager = relationship("User", back_populates="managed_workers")
 
+    # Scope columns live on the row itself so the pastor/leader/role list views
+    # are index range scans ordered by id instead of joins against users.
+    __table_args__ = (
+        Index('ix_workers_location_id_id', 'location_id', 'id'),
+        Index('ix_workers_manager_id_id', 'manager_id', 'id'),
+        Index('ix_workers_role_id', 'role', 'id'),
+        Index('ix_workers_updated_at_id', 'updated_at', 'id'),
+        Index('ix_workers_location_id_updated_at_id', 'location_id', 'updated_at', 'id'),
+        Index('ix_workers_manager_id_updated_at_id', 'manager_id', 'updated_at', 'id'),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
 
@@ -66,6 +154,222 @@ class AuditLog(Base):
     action = Column(String)  # e.g., 'create', 'update', 'delete'
     table_name = Column(String)  # e.g., 'potentials', 'disciples', 'workers'
     record_id = Column(Integer)  # ID of the record affected
-    changes = Column(JSON)  # Store changes as JSON
+    # What changed (see crud.audit_changes), in changes or, when large,
+    # compressed in changes_packed. Neither is loaded unless accessed.
+    changes = deferred(Column(JSON, nullable=True))
+    changes_packed = deferred(Column(LargeBinary, nullable=True))
     user_id = Column(Integer, ForeignKey('users.id'))
     timestamp = Column(DateTime)
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    token_hash = Column(String, unique=True, index=True)  # keyed hash, never the token itself
+    family_id = Column(String, index=True)  # all rotations of one login share a family
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+
+class TokenRevocation(Base):
+    """A revoked access token (jti) or a cutoff for all of a subject's tokens (subject, not_before)."""
+    __tablename__ = 'token_revocations'
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, nullable=True)
+    subject = Column(String, nullable=True)  # username
+    not_before = Column(Float, nullable=True)  # epoch seconds; the subject's tokens issued earlier are rejected
+    expires_at = Column(Float, index=True)  # epoch seconds; purged after this, once no token it covers is valid
+
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+
+    id = Column(Integer, primary_key=True, index=True)  # delivery order
+    table_name = Column(String)
+    action = Column(String)  # 'create', 'update', 'delete', 'convert'
+    record_id = Column(Integer)
+    payload = Column(JSON)  # the row as it was after the change
+    created_at = Column(DateTime)
+
+class OutboxCheckpoint(Base):
+    __tablename__ = 'outbox_checkpoints'
+
+    consumer = Column(String, primary_key=True)
+    last_event_id = Column(Integer, default=0)
+    gaps = Column(JSON, nullable=True)  # {id: first skipped at} for ids below last_event_id not yet seen
+    updated_at = Column(DateTime)
+
+class ContactHandle(Base):
+    """Normalized social handles from contact_info, one row per network."""
+    __tablename__ = 'contact_handles'
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String)  # 'potentials', 'disciples' or 'workers'
+    record_id = Column(Integer)
+    network = Column(String)  # e.g. 'instagram'
+    handle = Column(String)
+
+    __table_args__ = (
+        Index('ix_contact_handles_network_handle', 'network', 'handle'),
+        Index('ix_contact_handles_record', 'table_name', 'record_id'),
+    )
+
+class Job(Base):
+    """A queued export or report, run by the background job runner."""
+    __tablename__ = 'jobs'
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    job_type = Column(String)  # e.g. 'export', 'report'
+    params = Column(JSON)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    status = Column(String)  # 'queued', 'running', 'succeeded', 'failed', 'expired'
+    progress = Column(Float, default=0.0)  # 0..1
+    error = Column(String, nullable=True)
+    artifact_path = Column(String, nullable=True)
+    artifact_size = Column(Integer, nullable=True)
+    row_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)  # artifact is deleted after this
+    runner_id = Column(String, nullable=True)  # host:pid:nonce of the runner holding it while running
+    lease_expires_at = Column(DateTime, nullable=True)  # requeued if still running after this
+
+    __table_args__ = (
+        Index('ix_jobs_status_created_at', 'status', 'created_at'),
+        Index('ix_jobs_user_id_status', 'user_id', 'status'),
+    )
+
+class IdempotencyKey(Base):
+    """The response to the first request sent with an Idempotency-Key, replayed to its retries."""
+    __tablename__ = 'idempotency_keys'
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String)  # username; keys are only unique per user
+    key = Column(String)
+    fingerprint = Column(String)  # sha256 of method, path and body
+    status_code = Column(Integer, nullable=True)  # None while the first request is still running
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)  # None with a status_code: too large to keep, not replayed
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_idempotency_keys_owner_key', 'owner', 'key', unique=True),
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+class ConversionCohort(Base):
+    """
+    Potentials added in one week (Monday 00:00 UTC) for one location and
+    creator, and how many of them converted within 7/30/90 days.
+    Precomputed by app/cohorts.py.
+    """
+    __tablename__ = 'conversion_cohorts'
+
+    id = Column(Integer, primary_key=True, index=True)
+    week_start = Column(DateTime)
+    location_id = Column(Integer, ForeignKey('locations.id'), nullable=True)
+    creator_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    added = Column(Integer, default=0)
+    converted_7d = Column(Integer, default=0)
+    converted_30d = Column(Integer, default=0)
+    converted_90d = Column(Integer, default=0)
+    converted = Column(Integer, default=0)  # at any time so far
+
+    __table_args__ = (
+        Index('ix_conversion_cohorts_cell', 'week_start', 'location_id', 'creator_id', unique=True),
+    )
+
+class ReportCheckpoint(Base):
+    """How far a precomputed report has caught up with the potentials table."""
+    __tablename__ = 'report_checkpoints'
+
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime, nullable=True)  # rows updated after this are not reflected yet
+
+class SchemaVersion(Base):
+    """Fingerprint of the schema the database was last upgraded to (a single row)."""
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String)
+    upgraded_at = Column(DateTime)
+
+class ReplicaHeartbeat(Base):
+    """Timestamp written to the primary and read back from each replica to measure its lag (a single row)."""
+    __tablename__ = 'replica_heartbeat'
+
+    id = Column(Integer, primary_key=True)
+    beat = Column(DateTime)
+
+class ScopeExit(Base):
+    """
+    Where a potential, disciple or worker was before an update moved it to
+    another location or owner, so /sync can send a tombstone to clients that
+    could only see it there.
+    """
+    __tablename__ = 'scope_exits'
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String)
+    record_id = Column(Integer)
+    location_id = Column(Integer, nullable=True)
+    owner_id = Column(Integer, nullable=True)
+    left_at = Column(DateTime)  # the row's updated_at as of the move
+
+    __table_args__ = (
+        Index('ix_scope_exits_table_name_left_at', 'table_name', 'left_at'),
+    )
+
+class RecordCount(Base):
+    """
+    Live potentials, disciples and workers per location and owner, adjusted
+    by every create, move and delete so that list totals need no COUNT(*).
+    0 stands for "none" in location_id and owner_id. Kept by app/counts.py.
+    """
+    __tablename__ = 'record_counts'
+
+    table_name = Column(String, primary_key=True)
+    location_id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, primary_key=True)
+    live = Column(Integer, nullable=False, default=0)
+
+class LeaderboardCount(Base):
+    """
+    Potentials added and converted per week or month, location and leader
+    (their creator), summed from every process by app/leaderboard.py.
+    0 stands for "none" in location_id and creator_id.
+    """
+    __tablename__ = 'leaderboard_counts'
+
+    period = Column(String, primary_key=True)  # 'week' or 'month'
+    period_start = Column(DateTime, primary_key=True)
+    location_id = Column(Integer, primary_key=True)
+    creator_id = Column(Integer, primary_key=True)
+    added = Column(Integer, nullable=False, default=0)
+    converted = Column(Integer, nullable=False, default=0)
+
+# Sharding bookkeeping (see database.ShardRouter); these live in the primary database.
+class ShardLocation(Base):
+    """Shard a location's contact rows live in, fixed the first time the location is used."""
+    __tablename__ = 'shard_locations'
+
+    location_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    shard = Column(String, nullable=False)
+
+class ShardRecord(Base):
+    """Shard holding each potential, disciple and worker created since sharding was turned on."""
+    __tablename__ = 'shard_records'
+
+    table_name = Column(String, primary_key=True)
+    record_id = Column(Integer, primary_key=True)
+    shard = Column(String, nullable=False)
+
+class ShardSequence(Base):
+    """Last id handed out per sharded table, so ids stay unique across shards."""
+    __tablename__ = 'shard_sequences'
+
+    table_name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False)
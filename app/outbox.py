@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import socket
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def event_to_dict(event: models.OutboxEvent) -> dict:
+    return {
+        "id": event.id,
+        "table": event.table_name,
+        "action": event.action,
+        "record_id": event.record_id,
+        "payload": event.payload,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+# Sinks take a batch of event dicts and raise if delivery failed; the relay
+# then retries the same batch, so consumers must tolerate duplicates (dedupe by id).
+class FileSink:
+    """Appends events as JSON lines to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def deliver(self, events: list):
+        with open(self.path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class UnixSocketSink:
+    """Writes events as JSON lines to a Unix stream socket."""
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+
+    def deliver(self, events: list):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall("".join(json.dumps(event) + "\n" for event in events).encode())
+
+
+class WebhookSink:
+    """POSTs each batch as a JSON array; any non-2xx response is a failure."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, events: list):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(events).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Webhook returned {response.status}")
+
+
+def make_sink(target: str):
+    """Build a sink from file:///path, unix:///path or http(s)://... targets."""
+    parsed = urlparse(target)
+    path = parsed.netloc + parsed.path  # file://./relative keeps "." in netloc
+    if parsed.scheme == "":
+        return FileSink(target)
+    if parsed.scheme == "file":
+        return FileSink(path)
+    if parsed.scheme == "unix":
+        return UnixSocketSink(path)
+    if parsed.scheme in ("http", "https"):
+        return WebhookSink(target)
+    raise ValueError(f"Unsupported sink: {target}")
+
+
+def get_checkpoint(db: Session, consumer: str) -> models.OutboxCheckpoint:
+    checkpoint = db.get(models.OutboxCheckpoint, consumer)
+    if checkpoint is None:
+        checkpoint = models.OutboxCheckpoint(consumer=consumer, last_event_id=0, updated_at=datetime.utcnow())
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+
+def backlog(db: Session, consumer: str) -> dict:
+    """Events not yet delivered to `consumer`, the age of the oldest one and the ids still awaited below the checkpoint."""
+    checkpoint = get_checkpoint(db, consumer)
+    last_id = checkpoint.last_event_id
+    pending, oldest = db.query(func.count(models.OutboxEvent.id), func.min(models.OutboxEvent.created_at)).filter(
+        models.OutboxEvent.id > last_id
+    ).one()
+    return {
+        "consumer": consumer,
+        "last_event_id": last_id,
+        "pending": pending,
+        "oldest_pending_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+        "gaps": len(checkpoint.gaps or {}),
+    }
+
+
+def purge_delivered(db: Session, retention: timedelta) -> int:
+    """Delete events every consumer has seen that are older than `retention`."""
+    delivered_up_to = db.query(func.min(models.OutboxCheckpoint.last_event_id)).scalar()
+    if not delivered_up_to:
+        return 0
+    deleted = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.id <= delivered_up_to,
+        models.OutboxEvent.created_at < datetime.utcnow() - retention,
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+# Gap ids re-checked per run; a few hundred keeps the IN list under SQLite's parameter limit
+GAP_RECHECK = 500
+
+
+class OutboxRelay:
+    """
+    Tails outbox_events in id order and hands batches to a sink, moving the
+    consumer's checkpoint only after the sink accepted the batch
+    (at-least-once delivery).
+
+    Ids are handed out before commit, so a slow transaction can commit a
+    lower id after a higher one has been relayed. Ids skipped that way are
+    kept on the checkpoint as gaps and looked up again on every run; a late
+    event is delivered when it appears, after higher ids. A gap is given up
+    after `gap_seconds` (rolled-back transactions leave ids that never
+    appear), so an event whose transaction commits more than that long
+    after a higher id was relayed is still missed.
+    """
+
+    def __init__(self, session_factory, sink, consumer: str = "default", batch_size: int = 100, gap_seconds: float = 600.0):
+        self.session_factory = session_factory
+        self.sink = sink
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.gap_seconds = gap_seconds
+        self.delivered = 0
+        self.failures = 0
+        self.gaps_abandoned = 0
+
+    def run_once(self) -> int:
+        """Deliver one batch; returns the number of events delivered."""
+        with self.session_factory() as db:
+            checkpoint = get_checkpoint(db, self.consumer)
+            now = datetime.utcnow()
+            gaps = dict(checkpoint.gaps or {})  # str(id) -> when it was first skipped
+            expired = [gap for gap, seen in gaps.items() if datetime.fromisoformat(seen) < now - timedelta(seconds=self.gap_seconds)]
+            for gap in expired:
+                del gaps[gap]
+            self.gaps_abandoned += len(expired)
+
+            filled = []
+            if gaps:
+                filled = db.query(models.OutboxEvent).filter(
+                    models.OutboxEvent.id.in_(sorted(int(gap) for gap in gaps)[:GAP_RECHECK])
+                ).all()
+            fresh = db.query(models.OutboxEvent).filter(
+                models.OutboxEvent.id > checkpoint.last_event_id
+            ).order_by(models.OutboxEvent.id).limit(self.batch_size).all()
+            batch = sorted(filled + fresh, key=lambda event: event.id)
+            if not batch:
+                if expired:
+                    checkpoint.gaps = gaps
+                    db.commit()
+                return 0
+
+            try:
+                self.sink.deliver([event_to_dict(event) for event in batch])
+            except Exception:
+                self.failures += 1
+                raise
+
+            for event in filled:
+                del gaps[str(event.id)]
+            expected = checkpoint.last_event_id + 1
+            for event in fresh:
+                for missing in range(expected, event.id):
+                    gaps[str(missing)] = now.isoformat()
+                expected = event.id + 1
+            if fresh:
+                checkpoint.last_event_id = fresh[-1].id
+            checkpoint.gaps = gaps
+            checkpoint.updated_at = now
+            db.commit()
+            self.delivered += len(batch)
+            return len(batch)
+
+    def run_forever(self, poll_interval: float = 1.0, max_backoff: float = 60.0, on_batch=None):
+        backoff = poll_interval
+        while True:
+            try:
+                count = self.run_once()
+                backoff = poll_interval
+            except Exception:
+                logger.exception("Outbox delivery failed, retrying in %.0fs", backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+            if on_batch is not None:
+                on_batch(count)
+            if count < self.batch_size:
+                time.sleep(poll_interval)
+
+    def metrics(self) -> dict:
+        with self.session_factory() as db:
+            stats = backlog(db, self.consumer)
+        stats.update({"delivered": self.delivered, "failures": self.failures, "gaps_abandoned": self.gaps_abandoned})
+        return stats
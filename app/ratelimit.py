@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class SlidingWindowLimiter:
+    """
+    Allows at most `limit` hits per key within the last `window` seconds.
+    State is in memory and per process; keys with no recent hits are swept
+    once more than `max_keys` are tracked.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until `key` may try again; 0 if it is allowed now."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0.0
+            self._prune(hits, now)
+            if len(hits) < self.limit:
+                return 0.0
+            return hits[0] + self.window - now
+
+    def hit(self, key: str, now: Optional[float] = None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._sweep(now)
+                hits = self._hits[key] = deque()
+            self._prune(hits, now)
+            hits.append(now)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _prune(self, hits: deque, now: float):
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+
+    def _sweep(self, now: float):
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
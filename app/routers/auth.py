@@ -1,6 +1,8 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError
 from sqlalchemy.orm import Session
 
 from .. import schemas, models, crud, auth
@@ -11,11 +13,13 @@ from ..auth import authenticate_user, get_current_active_user
 router = APIRouter(tags=["auth"])
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(
+def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    client_ip = request.client.host if request.client else None
+    user = auth.authenticate_user(db, form_data.username, form_data.password, client_ip)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,9 +28,97 @@ async def login_for_access_token(
         )
     
     access_token = auth.create_access_token(
-        data={"sub": user.username}
+        data=auth.token_claims(user)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = crud.create_refresh_token(db, user_id=user.id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(
+    request: schemas.RefreshRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    The presented refresh token is used up; no password check is needed.
+    """
+    rotated = crud.rotate_refresh_token(db, request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
+    access_token = auth.create_access_token(data=auth.token_claims(user))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+def _decode_or_401(token: str) -> dict:
+    try:
+        return auth.decode_token(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(
+    request: Optional[schemas.RefreshRequest] = None,
+    token: str = Depends(auth.oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Revoke the access token used for this request, and the refresh token if one is sent"""
+    payload = _decode_or_401(token)
+    if "jti" in payload:
+        auth.revoke_token(payload)
+    if request is not None:
+        crud.revoke_refresh_token(db, request.refresh_token)
+    return None
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+def logout_all(
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """End every session of the current user"""
+    auth.revoke_user_tokens(current_user.username)
+    crud.revoke_user_refresh_tokens(db, current_user.id)
+    return None
+
+@router.post("/users/{username}/revoke-tokens", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_user_tokens(
+    username: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Revoke every access and refresh token issued to a user so far (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admin can revoke tokens")
+    auth.revoke_user_tokens(username)
+    user = crud.get_user_by_username(db, username)
+    if user is not None:
+        crud.revoke_user_refresh_tokens(db, user.id)
+    return None
+
+@router.put("/users/{user_id}/parent", response_model=schemas.User)
+def set_user_parent(
+    user_id: int,
+    update: schemas.ParentUpdate,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Move a user (and everyone reporting to them) under another user (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admin can change the hierarchy")
+    try:
+        user = crud.set_user_parent(db, user_id, update.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 @router.get("/users/me", response_model=schemas.User)
 async def read_users_me(
@@ -37,12 +129,14 @@ async def read_users_me(
 
 @router.post("/test-login")
 def test_login(
+    request: Request,
     username: str,
     password: str,
     db: Session = Depends(get_db)
 ):
     """Test endpoint for debugging auth"""
-    user = authenticate_user(db, username, password)
+    client_ip = request.client.host if request.client else None
+    user = authenticate_user(db, username, password, client_ip)
     if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     return {"message": "Login successful"}
\ No newline at end of file
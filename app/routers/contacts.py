@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from .. import schemas, crud, auth
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/contacts",
+    tags=["contacts"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+@router.get("/lookup", response_model=schemas.ContactMatches)
+def lookup_contact(
+    phone: Optional[str] = None,
+    email: Optional[str] = None,
+    network: Optional[str] = None,
+    handle: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Find potentials, disciples and workers by phone, email or social handle.
+    Inputs are normalized the same way as stored contact info, so formatting
+    differences ("(555) 123-4567", "@Name") still match. Results are limited
+    to records the caller can see.
+    """
+    if phone:
+        return crud.find_by_phone(db, phone, user=current_user)
+    if email:
+        return crud.find_by_email(db, email, user=current_user)
+    if network and handle:
+        if network not in crud.CONTACT_HANDLE_NETWORKS:
+            raise HTTPException(status_code=400, detail="Invalid network")
+        return crud.find_by_handle(db, network, handle, user=current_user)
+    raise HTTPException(status_code=400, detail="Provide phone, email, or network and handle")
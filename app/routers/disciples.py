@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from typing import List
+
+from .. import schemas, crud, auth, counts, models, scoping, singleflight, utils
+from ..database import get_db, get_read_db, replicas
+
+router = APIRouter(
+    prefix="/disciples",
+    tags=["disciples"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+disciple_list = TypeAdapter(List[schemas.Disciple])
+list_flight = singleflight.flight("disciples.list")
+
+@router.get("/", response_model=List[schemas.Disciple])
+async def read_disciples(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Get list of disciples:
+    - Admin/Pastor: see all disciples
+    - Overseer: disciples in their location and the locations under it
+    - Leader: disciples they or their sub-leaders created
+    - Others: only see disciples they created
+    X-Total-Count holds the number of disciples in scope.
+    Concurrent identical requests from the same scope share one query and response body.
+    """
+    source = db.info["source"]
+
+    def run():
+        # A session of its own: the request that started the run may go away
+        # (and close its session) while other requests still wait for it
+        with replicas.session_on(source) as flight_db:
+            disciples = crud.get_disciples_for_user(flight_db, current_user, skip=skip, limit=limit)
+            body = disciple_list.dump_json(disciple_list.validate_python(disciples, from_attributes=True))
+            return body, counts.scope_total(flight_db, models.Disciple, current_user)
+
+    # Requests only share a query run against the same database
+    key = (source, scoping.scope_key(models.Disciple, current_user), skip, limit)
+    body, total = await list_flight.do(key, run)
+    return Response(content=body, media_type="application/json", headers=counts.headers(total))
+
+@router.post("/batch-get", response_model=schemas.DiscipleBatch)
+def batch_get_disciples(
+    request: schemas.BatchGetRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Get many disciples by ID in one request.
+    Ids outside the caller's scope are returned in `forbidden` and ids that do not exist in `missing`.
+    """
+    found, forbidden, missing = crud.get_disciples_by_ids(db, request.ids, current_user)
+    return {"found": found, "forbidden": forbidden, "missing": missing}
+
+@router.get("/{disciple_id}", response_model=schemas.Disciple)
+def read_disciple(
+    disciple_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Get a specific disciple by ID.
+    Users can only access disciples within their scope (see read_disciples).
+    """
+    db_disciple, allowed = crud.get_scoped(db, models.Disciple, disciple_id, current_user)
+    if db_disciple is None:
+        raise HTTPException(status_code=404, detail="Disciple not found")
+
+    # Authorization check
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this disciple"
+        )
+
+    response.headers["ETag"] = utils.etag(db_disciple.version)
+    return db_disciple
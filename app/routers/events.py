@@ -0,0 +1,71 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.orm import Session
+
+from .. import auth, events, scoping
+from ..config import settings
+from ..database import get_db
+
+router = APIRouter(tags=["events"])
+
+# EventSource cannot send headers, so the token may also come as ?access_token=
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+async def get_stream_user(
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    token = header_token or access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await auth.get_current_user(token=token, db=db)
+    return await auth.get_current_active_user(current_user=user)
+
+def format_event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+async def event_stream(request: Request, subscriber: events.Subscriber):
+    try:
+        yield ": connected\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if subscriber.overflowed:
+                # The client fell behind; it has to refetch (or /sync) instead
+                subscriber.drain()
+                yield format_event("resync", {})
+                continue
+            yield format_event(event["action"], event)
+    finally:
+        events.bus.unsubscribe(subscriber)
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    current_user=Depends(get_stream_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of create/update/delete/convert changes to
+    potentials, disciples and workers, limited to what the caller may see.
+    A `resync` event means events were dropped and the client should refetch.
+    """
+    subscriber = events.bus.subscribe(scoping.visibility_filter(db, current_user))
+    return StreamingResponse(
+        event_stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
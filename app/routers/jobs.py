@@ -0,0 +1,88 @@
+import os
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from .. import schemas, models, auth
+from ..database import get_db
+from ..jobs import JobLimitExceeded, MEDIA_TYPES, runner
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+def get_own_job(db: Session, job_id: str, user: schemas.User) -> models.Job:
+    job = db.get(models.Job, job_id)
+    # Other users' jobs are reported as missing, not forbidden
+    if job is None or (job.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/", response_model=schemas.Job, status_code=status.HTTP_202_ACCEPTED)
+def create_job(
+    job: schemas.JobCreate,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Queue an export or report. Poll GET /jobs/{id} for progress, then fetch
+    the result from GET /jobs/{id}/artifact before it expires.
+    - export: {"table": "potentials" | "disciples" | "workers" | "audit_logs",
+               "format": "csv" | "jsonl" | "columnar" | "arrow" | "parquet" | "cols"}
+      columnar picks Arrow when pyarrow is installed and cols (see app/columnar.py) otherwise;
+      audit_logs may only be exported by admins
+    - report: {"group_by": "location" | "leader"}
+    Both only include records the caller may see.
+    """
+    try:
+        return runner.submit(db, current_user, job.job_type, job.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+@router.get("/", response_model=List[schemas.Job])
+def read_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """The caller's jobs, newest first"""
+    return db.query(models.Job).filter(models.Job.user_id == current_user.id).order_by(
+        models.Job.created_at.desc()
+    ).offset(skip).limit(limit).all()
+
+@router.get("/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Status and progress of a job"""
+    return get_own_job(db, job_id, current_user)
+
+@router.get("/{job_id}/artifact")
+def download_artifact(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Download a finished job's result"""
+    job = get_own_job(db, job_id, current_user)
+    if job.status == "expired" or (job.status == "succeeded" and not os.path.exists(job.artifact_path)):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Result has expired")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    extension = job.params.get("format", "json")
+    return FileResponse(
+        job.artifact_path,
+        media_type=MEDIA_TYPES.get(extension, "application/octet-stream"),
+        filename=f"{job.job_type}-{job.id}.{extension}",
+    )
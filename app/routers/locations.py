@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+
+from .. import schemas, crud, auth
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/locations",
+    tags=["locations"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+def check_admin(user: schemas.User):
+    if user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can change locations"
+        )
+
+@router.get("/", response_model=List[schemas.Location])
+def read_locations(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """List locations with their parent in the hierarchy"""
+    return crud.get_locations(db, skip=skip, limit=limit)
+
+@router.post("/", response_model=schemas.Location)
+def create_location(
+    location: schemas.LocationCreate,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Create a location, optionally below a parent location (admin only)"""
+    check_admin(current_user)
+    try:
+        return crud.create_location(db, location.name, location.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/{location_id}/parent", response_model=schemas.Location)
+def set_location_parent(
+    location_id: int,
+    update: schemas.ParentUpdate,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """Move a location and its sub-locations under another location (admin only)"""
+    check_admin(current_user)
+    try:
+        db_location = crud.set_location_parent(db, location_id, update.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return db_location
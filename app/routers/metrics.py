@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from .. import schemas, auth, concurrency, database, singleflight
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+def check_admin(user: schemas.User):
+    if user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admin can view metrics")
+
+@router.get("/concurrency")
+async def read_concurrency_metrics(current_user: schemas.User = Depends(auth.get_current_active_user)):
+    """In-flight, queued and shed requests and queue wait times per route class"""
+    check_admin(current_user)
+    return concurrency.metrics()
+
+@router.get("/single-flight")
+async def read_single_flight_metrics(current_user: schemas.User = Depends(auth.get_current_active_user)):
+    """Query executions per coalesced endpoint and how many requests shared one instead"""
+    check_admin(current_user)
+    return singleflight.metrics()
+
+@router.get("/replicas")
+async def read_replica_metrics(current_user: schemas.User = Depends(auth.get_current_active_user)):
+    """Measured lag of each read replica and how many reads each replica and the primary served"""
+    check_admin(current_user)
+    return database.replicas.metrics()
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from .. import schemas, crud, auth, models
-from ..database import get_db
+from .. import schemas, crud, auth, counts, models, scoping, singleflight, utils
+from ..database import get_db, get_read_db, replicas
 
 router = APIRouter(
     prefix="/potentials",
@@ -12,6 +13,9 @@ router = APIRouter(
     dependencies=[Depends(auth.get_current_active_user)]
 )
 
+potential_list = TypeAdapter(List[schemas.Potential])
+list_flight = singleflight.flight("potentials.list")
+
 @router.post("/", response_model=schemas.Potential, status_code=status.HTTP_201_CREATED)
 def create_potential(
     potential: schemas.PotentialCreate,
@@ -29,111 +33,137 @@ def create_potential(
     return crud.create_potential(db=db, potential=potential, creator_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.Potential])
-def read_potentials(
+async def read_potentials(
     skip: int = 0,
     limit: int = 100,
     is_disciple: Optional[bool] = None,
     location: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    count: str = counts.EXACT,
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
-    Get list of potentials with filters:
+    Get list of potentials with filters, limited to the caller's scope:
     - Admin/Pastor: see all potentials
+    - Overseer: potentials in their region
+    - Leader: potentials they or their sub-leaders created
     - Others: only see potentials they created
     Optional filters:
     - is_disciple: filter by disciple status
     - location: filter by location
     - start_date/end_date: date range filter
+    The X-Total-Count header holds the number of matching potentials; with
+    count=estimate a filtered total may be approximate, which is flagged by
+    X-Total-Count-Estimated: true.
+    Concurrent identical requests from the same scope share one query and response body.
     """
-    if current_user.role in ["admin", "pastor"]:
-        potentials = crud.get_potentials_with_filters(
-            db,
-            skip=skip,
-            limit=limit,
-            is_disciple=is_disciple,
-            location=location,
-            start_date=start_date,
-            end_date=end_date
-        )
-    else:
-        potentials = crud.get_potentials_by_creator_with_filters(
-            db,
-            creator_id=current_user.id,
-            skip=skip,
-            limit=limit,
-            is_disciple=is_disciple,
-            location=location,
-            start_date=start_date,
-            end_date=end_date
-        )
-    return potentials
+    if count not in counts.MODES:
+        raise HTTPException(status_code=400, detail="count must be 'exact' or 'estimate'")
+
+    source = db.info["source"]
+
+    def run():
+        # A session of its own: the request that started the run may go away
+        # (and close its session) while other requests still wait for it
+        with replicas.session_on(source) as flight_db:
+            query = crud.potentials_for_user_query(flight_db, current_user, is_disciple, location, start_date, end_date)
+            potentials = crud.fetch(query, [models.Potential.id], skip, limit)
+            body = potential_list.dump_json(potential_list.validate_python(potentials, from_attributes=True))
+            filters = (is_disciple, location, start_date, end_date)
+            return body, *counts.total(flight_db, models.Potential, current_user, query, filters, count)
+
+    # Requests only share a query run against the same database
+    key = (
+        source, scoping.scope_key(models.Potential, current_user),
+        skip, limit, is_disciple, location, start_date, end_date, count
+    )
+    body, total, estimated = await list_flight.do(key, run)
+    return Response(content=body, media_type="application/json", headers=counts.headers(total, estimated))
+
+@router.post("/batch-get", response_model=schemas.PotentialBatch)
+def batch_get_potentials(
+    request: schemas.BatchGetRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Get many potentials by ID in one request.
+    Scoping is applied in the query; ids outside the caller's scope are returned
+    in `forbidden` and ids that do not exist in `missing`.
+    """
+    found, forbidden, missing = crud.get_potentials_by_ids(db, request.ids, current_user)
+    return {"found": found, "forbidden": forbidden, "missing": missing}
 
 @router.get("/{potential_id}", response_model=schemas.Potential)
 def read_potential(
     potential_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
     Get a specific potential by ID.
-    Users can only access potentials they created unless they're admin/pastor.
+    Users can only access potentials within their scope.
     """
-    db_potential = crud.get_potential(db, potential_id=potential_id)
+    db_potential, allowed = crud.get_scoped(db, models.Potential, potential_id, current_user)
     if db_potential is None:
         raise HTTPException(status_code=404, detail="Potential not found")
     
     # Authorization check
-    if current_user.role not in ["admin", "pastor"] and db_potential.creator_id != current_user.id:
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this potential"
         )
     
+    response.headers["ETag"] = utils.etag(db_potential.version)
     return db_potential
 
 @router.put("/{potential_id}", response_model=schemas.Potential)
 def update_potential(
     potential_id: int,
     potential: schemas.PotentialCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
     Update a potential contact.
-    Users can only update potentials they created unless they're admin/pastor.
+    Users can only update potentials within their scope. Send the ETag from
+    GET as If-Match to only update the version you read (412 otherwise).
+    is_disciple is ignored here; use PUT /{potential_id}/convert.
     """
-    db_potential = crud.get_potential(db, potential_id=potential_id)
-    if db_potential is None:
-        raise HTTPException(status_code=404, detail="Potential not found")
-    
-    # Authorization check
-    if current_user.role not in ["admin", "pastor"] and db_potential.creator_id != current_user.id:
+    try:
+        updated_potential = crud.update_potential(
+            db=db,
+            potential_id=potential_id,
+            potential=potential,
+            user_id=current_user.id,
+            user=current_user,
+            versions=utils.parse_if_match(if_match)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if updated_potential is None:
+        # Only failed updates pay for a second query, to tell the cases apart
+        db_potential, allowed = crud.get_scoped(db, models.Potential, potential_id, current_user, detail=False)
+        if db_potential is None:
+            raise HTTPException(status_code=404, detail="Potential not found")
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to update this potential"
+            )
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this potential"
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Potential was modified since it was read",
+            headers={"ETag": utils.etag(db_potential.version)}
         )
-    
-    # Get changes before update for audit log
-    changes = {
-        "old": schemas.Potential.from_orm(db_potential).dict(),
-        "new": potential.dict()
-    }
-    
-    updated_potential = crud.update_potential(db=db, potential_id=potential_id, potential=potential)
-    
-    # Log the update
-    crud.create_audit_log(
-        db=db,
-        action="update",
-        table_name="potentials",
-        record_id=potential_id,
-        user_id=current_user.id,
-        changes=changes
-    )
-    
+
+    response.headers["ETag"] = utils.etag(updated_potential.version)
     return updated_potential
 
 @router.delete("/{potential_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -144,30 +174,21 @@ def delete_potential(
 ):
     """
     Delete a potential contact.
-    Users can only delete potentials they created unless they're admin/pastor.
+    Users can only delete potentials within their scope.
     """
-    db_potential = crud.get_potential(db, potential_id=potential_id)
+    db_potential, allowed = crud.get_scoped(db, models.Potential, potential_id, current_user, detail=False)
     if db_potential is None:
         raise HTTPException(status_code=404, detail="Potential not found")
     
     # Authorization check
-    if current_user.role not in ["admin", "pastor"] and db_potential.creator_id != current_user.id:
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to delete this potential"
         )
     
-    # Log before deletion
-    crud.create_audit_log(
-        db=db,
-        action="delete",
-        table_name="potentials",
-        record_id=potential_id,
-        user_id=current_user.id,
-        changes={"deleted_potential": schemas.Potential.from_orm(db_potential).dict()}
-    )
-    
-    crud.delete_potential(db=db, potential_id=potential_id)
+    # Audited by crud; the deleted row's values are in the delete outbox event
+    crud.delete_potential(db=db, potential_id=potential_id, user_id=current_user.id)
     return None
 
 @router.put("/{potential_id}/convert", response_model=schemas.Disciple)
@@ -178,25 +199,25 @@ def convert_to_disciple(
 ):
     """
     Convert a potential to a disciple.
-    Only leaders, pastors, and admins can convert potentials.
-    Leaders can only convert their own potentials.
+    Only leaders, pastors, overseers and admins can convert potentials.
+    Leaders can only convert their team's potentials.
     """
-    db_potential = crud.get_potential(db, potential_id=potential_id)
+    db_potential, allowed = crud.get_scoped(db, models.Potential, potential_id, current_user)
     if db_potential is None:
         raise HTTPException(status_code=404, detail="Potential not found")
     
     # Authorization check - must be at least leader
-    if current_user.role not in ["admin", "pastor", "leader"]:
+    if current_user.role not in ["admin", "overseer", "pastor", "leader"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only leaders and above can convert potentials"
         )
     
-    # Additional check for leaders - can only convert their own
-    if current_user.role == "leader" and db_potential.creator_id != current_user.id:
+    # Additional check - can only convert potentials within their scope
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Leaders can only convert their own potentials"
+            detail="Leaders can only convert their team's potentials"
         )
     
     # Check if already a disciple
@@ -219,10 +240,10 @@ def convert_to_disciple(
     )
     
     # Create the disciple
-    disciple = crud.create_disciple(db=db, disciple=disciple_data)
+    disciple = crud.create_disciple(db=db, disciple=disciple_data, creator_id=current_user.id)
     
     # Update potential to mark as disciple
-    crud.update_potential_disciple_status(db=db, potential_id=potential_id, is_disciple=True)
+    crud.update_potential_disciple_status(db=db, potential_id=potential_id, is_disciple=True, disciple_id=disciple.id)
     
     # Log the conversion
     crud.create_audit_log(
@@ -231,10 +252,7 @@ def convert_to_disciple(
         table_name="potentials",
         record_id=potential_id,
         user_id=current_user.id,
-        changes={
-            "converted_to_disciple_id": disciple.id,
-            "previous_potential": schemas.Potential.from_orm(db_potential).dict()
-        }
+        changes={"converted_to_disciple_id": disciple.id}
     )
     
     return disciple
\ No newline at end of file
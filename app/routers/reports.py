@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from .. import schemas, auth, cohorts, leaderboard
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+@router.get("/cohorts", response_model=schemas.CohortReport)
+def read_cohorts(
+    group_by: str = "location",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Conversion cohorts: potentials added per week and per location or leader
+    (group_by=location|leader), with how many became disciples within 7, 30
+    and 90 days. Limited to the potentials the caller may see.
+    """
+    if group_by not in ("location", "leader"):
+        raise HTTPException(status_code=400, detail="group_by must be location or leader")
+    cohorts.refresh(db)
+    return {
+        "group_by": group_by,
+        "cohorts": cohorts.cohort_matrix(db, current_user, group_by=group_by, start=start, end=end),
+    }
+
+@router.get("/leaderboard", response_model=schemas.LeaderboardReport)
+def read_leaderboard(
+    period: str = "week",
+    metric: str = "added",
+    limit: int = 10,
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    The top `limit` leaders by potentials added or converted (metric) in the
+    current week or month (period), or the one holding `at`. Served from
+    in-memory counters and limited to the potentials the caller may see.
+    """
+    if period not in leaderboard.PERIODS:
+        raise HTTPException(status_code=400, detail="period must be week or month")
+    if metric not in leaderboard.METRICS:
+        raise HTTPException(status_code=400, detail="metric must be added or converted")
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    start, ranked = leaderboard.board.top(db, current_user, period=period, metric=metric, limit=limit, at=at)
+    names = leaderboard.board.usernames(db, [leader_id for leader_id, _, _ in ranked])
+    return {
+        "period": period,
+        "period_start": start,
+        "metric": metric,
+        "leaders": [
+            {"rank": rank, "leader_id": leader_id, "name": names[leader_id], "added": added, "converted": converted}
+            for rank, (leader_id, added, converted) in enumerate(ranked, 1)
+        ],
+    }
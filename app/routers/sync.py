@@ -0,0 +1,83 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import schemas, crud, auth, models
+from ..config import settings
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"],
+    dependencies=[Depends(auth.get_current_active_user)]
+)
+
+# Short keys used in the sync token for each synced table; the key plus "x"
+# holds how far moves out of scope (crud.get_scope_exits) have been reported
+SYNCED_TABLES = {
+    "potentials": ("p", models.Potential, crud.potential_scope),
+    "disciples": ("d", models.Disciple, crud.disciple_scope),
+    "workers": ("w", models.Worker, crud.worker_scope),
+}
+
+def encode_sync_token(watermarks: dict) -> str:
+    data = {key: [updated_at.isoformat(), last_id] for key, (updated_at, last_id) in watermarks.items()}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode()
+
+def decode_sync_token(token: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return {key: (datetime.fromisoformat(updated_at), int(last_id)) for key, (updated_at, last_id) in data.items()}
+    except (ValueError, TypeError, AttributeError):  # not base64 JSON, or not shaped like a token
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token")
+
+@router.get("", response_model=schemas.SyncResponse)
+def sync(
+    since: Optional[str] = None,
+    limit: int = settings.SYNC_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Delta sync for offline clients.
+    Returns potentials, disciples and workers in the caller's scope that changed
+    since the `since` token (everything on the first call), with deleted rows
+    reported by id only. Rows moved out of the caller's scope (to another
+    location or owner) are reported as deleted too; after a change to the
+    user or location hierarchy, sync again without `since`. Each table
+    returns at most `limit` rows per call.
+    """
+    limit = max(1, min(limit, settings.SYNC_PAGE_SIZE))
+    watermarks = decode_sync_token(since) if since else {}
+    until = datetime.utcnow() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+    response = {"has_more": False}
+    for name, (key, model, scope) in SYNCED_TABLES.items():
+        since_mark = watermarks.get(key)
+        rows = crud.get_changes_since(db, model, scope(current_user), since_mark, until, limit)
+        upto = until
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response["has_more"] = True
+            upto = rows[-1].updated_at
+        if rows:
+            watermarks[key] = (rows[-1].updated_at, rows[-1].id)
+        changed = [row for row in rows if row.deleted_at is None]
+        deleted = [row.id for row in rows if row.deleted_at is not None]
+        # Rows moved out of the caller's scope, tracked under their own
+        # watermark since the rows themselves are no longer visible
+        exits_since = watermarks.get(key + "x", since_mark)
+        if exits_since is not None:
+            changed_ids = {row.id for row in changed}
+            deleted += [record_id for record_id in crud.get_scope_exits(db, model, current_user, exits_since[0], upto)
+                        if record_id not in changed_ids and record_id not in deleted]
+            upto = max(upto, exits_since[0])
+        watermarks[key + "x"] = (upto, 0)
+        response[name] = {"changed": changed, "deleted": deleted}
+
+    response["next"] = encode_sync_token(watermarks)
+    return response
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from .. import schemas, crud, auth
-from ..database import get_db
+from .. import schemas, crud, auth, counts, models, scoping, singleflight, utils
+from ..database import get_db, get_read_db, replicas
 
 router = APIRouter(
     prefix="/workers",
@@ -11,6 +12,9 @@ router = APIRouter(
     dependencies=[Depends(auth.get_current_active_user)]
 )
 
+worker_list = TypeAdapter(List[schemas.Worker])
+list_flight = singleflight.flight("workers.list")
+
 @router.post("/", response_model=schemas.Worker)
 def create_worker(
     worker: schemas.WorkerCreate,
@@ -21,107 +25,119 @@ def create_worker(
     return crud.create_worker(db=db, worker=worker, leader_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.Worker])
-def read_workers(
+async def read_workers(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     
     """
     Get list of workers with different access levels:
     - Admin: all workers
-    - Pastor: workers in their location
-    - Leader: workers they created
+    - Pastor/Overseer: workers in their location and the locations under it
+    - Leader: workers they or their sub-leaders created
     - Worker: not authorized
+    X-Total-Count holds the number of workers in scope.
+    Concurrent identical requests from the same scope share one query and response body.
     """
 
-    if current_user.role == "admin":
-        workers = crud.get_workers(db, skip=skip, limit=limit)
-    elif current_user.role == "pastor":
-        workers = crud.get_workers_by_location(db, location=current_user.location, skip=skip, limit=limit)
-    elif current_user.role == "leader":
-        workers = crud.get_workers_by_leader(db, leader_id=current_user.id, skip=skip, limit=limit)
-    else:
+    if scoping.scope_rule(models.Worker, current_user) == scoping.NONE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view workers"
         )
-    return workers
+
+    source = db.info["source"]
+
+    def run():
+        # A session of its own: the request that started the run may go away
+        # (and close its session) while other requests still wait for it
+        with replicas.session_on(source) as flight_db:
+            workers = crud.get_workers_for_user(flight_db, current_user, skip=skip, limit=limit)
+            body = worker_list.dump_json(worker_list.validate_python(workers, from_attributes=True))
+            return body, counts.scope_total(flight_db, models.Worker, current_user)
+
+    # Requests only share a query run against the same database
+    key = (source, scoping.scope_key(models.Worker, current_user), skip, limit)
+    body, total = await list_flight.do(key, run)
+    return Response(content=body, media_type="application/json", headers=counts.headers(total))
+
+@router.post("/batch-get", response_model=schemas.WorkerBatch)
+def batch_get_workers(
+    request: schemas.BatchGetRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_active_user)
+):
+    """
+    Get many workers by ID in one request, with the same access levels as the list view
+    """
+    found, forbidden, missing = crud.get_workers_by_ids(db, request.ids, current_user)
+    return {"found": found, "forbidden": forbidden, "missing": missing}
 
 # More endpoints for workers...
 @router.get("/{worker_id}", response_model=schemas.Worker)
 def read_worker(
     worker_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
     Get a specific worker by ID with proper authorization checks
     """
 
-    db_worker = crud.get_worker(db, worker_id=worker_id)
+    db_worker, allowed = crud.get_scoped(db, models.Worker, worker_id, current_user)
     if db_worker is None:
         raise HTTPException(status_code=404, detail="Worker not found")
     
     # Access control
-    if current_user.role == "admin":
-        return db_worker
-    elif current_user.role == "pastor" and db_worker.location == current_user.location:
-        return db_worker
-    elif current_user.role == "leader" and db_worker.leader_id == current_user.id:
-        return db_worker
-    else:
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this worker"
         )
+    response.headers["ETag"] = utils.etag(db_worker.version)
+    return db_worker
     
 @router.put("/{worker_id}", response_model=schemas.Worker)
 def update_worker(
     worker_id: int,
     worker: schemas.WorkerCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
-    Update a specific worker by ID with proper authorization checks
+    Update a specific worker by ID with proper authorization checks.
+    Send the ETag from GET as If-Match to only update the version you read (412 otherwise).
     """
-
-    db_worker = crud.get_worker(db, worker_id=worker_id)
-    if db_worker is None:
-        raise HTTPException(status_code=404, detail="Worker not found")
-    
-    # Authorization check
-    if current_user.role == "admin":
-        pass  # Admin can update any worker
-    elif current_user.role == "pastor":
-        if db_worker.location != current_user.location:
-            raise HTTPException(status_code=403, detail="Not authorized to update this worker")
-    elif current_user.role == "leader":
-        if db_worker.leader_id != current_user.id:
+    try:
+        updated_worker = crud.update_worker(
+            db=db,
+            worker_id=worker_id,
+            worker=worker,
+            user_id=current_user.id,
+            user=current_user,
+            versions=utils.parse_if_match(if_match)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if updated_worker is None:
+        # Only failed updates pay for a second query, to tell the cases apart
+        db_worker, allowed = crud.get_scoped(db, models.Worker, worker_id, current_user, detail=False)
+        if db_worker is None:
+            raise HTTPException(status_code=404, detail="Worker not found")
+        if not allowed:
             raise HTTPException(status_code=403, detail="Not authorized to update this worker")
-    else:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Get changes before update for audit log
-    changes = {
-        "old": {k: v for k, v in db_worker.__dict__.items() if not k.startswith('_')},
-        "new": worker.dict()
-    }
-    
-    updated_worker = crud.update_worker(db=db, worker_id=worker_id, worker=worker)
-    
-    # Log the update
-    crud.create_audit_log(
-        db=db,
-        action="update",
-        table_name="workers",
-        record_id=worker_id,
-        user_id=current_user.id,
-        changes=changes
-    )
-    
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Worker was modified since it was read",
+            headers={"ETag": utils.etag(db_worker.version)}
+        )
+
+    response.headers["ETag"] = utils.etag(updated_worker.version)
     return updated_worker
 
 @router.delete("/{worker_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -131,29 +147,20 @@ def delete_worker(
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
-    Delete a worker (only for admin/pastor)
+    Delete a worker (only for admin/overseer/pastor)
     """
     auth.check_admin_or_pastor(current_user)
     
-    db_worker = crud.get_worker(db, worker_id=worker_id)
+    db_worker, allowed = crud.get_scoped(db, models.Worker, worker_id, current_user, detail=False)
     if db_worker is None:
         raise HTTPException(status_code=404, detail="Worker not found")
     
-    # Additional check for pastor - can only delete in their location
-    if current_user.role == "pastor" and db_worker.location != current_user.location:
+    # Additional check for pastor/overseer - can only delete in their locations
+    if not allowed:
         raise HTTPException(status_code=403, detail="Can only delete workers in your location")
     
-    # Log before deletion
-    crud.create_audit_log(
-        db=db,
-        action="delete",
-        table_name="workers",
-        record_id=worker_id,
-        user_id=current_user.id,
-        changes={"deleted_worker": db_worker.__dict__}
-    )
-    
-    crud.delete_worker(db=db, worker_id=worker_id)
+    # Audited by crud; the deleted row's values are in the delete outbox event
+    crud.delete_worker(db=db, worker_id=worker_id, user_id=current_user.id)
     return None
 
 @router.get("/location/{location}", response_model=List[schemas.Worker])
@@ -161,26 +168,24 @@ def read_workers_by_location(
     location: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
-    Get workers by location (admin/pastor only)
+    Get workers by location (admin/overseer/pastor only)
     """
     auth.check_admin_or_pastor(current_user)
     
-    # Additional check for pastor - can only view their own location
-    if current_user.role == "pastor" and location != current_user.location:
-        raise HTTPException(status_code=403, detail="Can only view workers in your location")
-    
-    return crud.get_workers_by_location(db, location=location, skip=skip, limit=limit)
+    # Results are also limited to the caller's scope, so pastors and overseers
+    # only get workers in a location under their own
+    return crud.get_workers_by_location(db, location=location, skip=skip, limit=limit, user=current_user)
 
 @router.get("/role/{role}", response_model=List[schemas.Worker])
 def read_workers_by_role(
     role: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: schemas.User = Depends(auth.get_current_active_user)
 ):
     """
@@ -189,7 +194,7 @@ def read_workers_by_role(
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admin can filter by role")
     
-    if role not in ["admin", "pastor", "leader", "worker"]:
+    if role not in scoping.ROLES:
         raise HTTPException(status_code=400, detail="Invalid role")
     
     return crud.get_workers_by_role(db, role=role, skip=skip, limit=limit)
\ No newline at end of file
@@ -22,12 +22,30 @@ class UserCreate(UserBase):
     password: str
     role: Optional[str] = 'worker'  # Default role is 'worker'
     location: Optional[str] = None
+    parent_id: Optional[int] = None  # the user this one reports to
 
 class User(UserBase):
     id: int
     role: str
     is_active: bool = True
     location: Optional[str] = None
+    location_id: Optional[int] = None
+    parent_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class ParentUpdate(BaseModel):
+    parent_id: Optional[int] = None
+
+class LocationCreate(BaseModel):
+    name: str
+    parent_id: Optional[int] = None
+
+class Location(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -36,6 +54,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     username: Optional[str] = None
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class PotentialBase(BaseModel):
     first_name: str
@@ -52,6 +74,10 @@ class PotentialCreate(PotentialBase):
 class Potential(PotentialBase):
     id: int
     leader_id: int
+    version: int = 1
+    updated_at: Optional[datetime] = None
+    converted_at: Optional[datetime] = None
+    disciple_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -71,6 +97,8 @@ class DiscipleCreate(DiscipleBase):
 class Disciple(DiscipleBase):
     id: int
     leader_id: int
+    version: int = 1
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -89,7 +117,118 @@ class WorkerCreate(WorkerBase):
 class Worker(WorkerBase):
     id: int
     leader_id: int
+    version: int = 1
     date_added: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Upper bound on ids per batch-get request; keeps one request to a handful of queries.
+MAX_BATCH_IDS = 5000
+
+class BatchGetRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class PotentialBatch(BaseModel):
+    """
+    Result of a batch read: rows the caller may see, plus the ids that exist
+    but are outside the caller's scope and the ids that do not exist.
+    """
+    found: List[Potential]
+    forbidden: List[int]
+    missing: List[int]
+
+class DiscipleBatch(BaseModel):
+    found: List[Disciple]
+    forbidden: List[int]
+    missing: List[int]
+
+class WorkerBatch(BaseModel):
+    found: List[Worker]
+    forbidden: List[int]
+    missing: List[int]
+
+class PotentialChanges(BaseModel):
+    changed: List[Potential]
+    deleted: List[int]
+
+class DiscipleChanges(BaseModel):
+    changed: List[Disciple]
+    deleted: List[int]
+
+class WorkerChanges(BaseModel):
+    changed: List[Worker]
+    deleted: List[int]
+
+class SyncResponse(BaseModel):
+    """
+    Rows changed since the client's sync token. Pass `next` back as `since`
+    on the next call; when `has_more` is true call again straight away.
+    """
+    potentials: PotentialChanges
+    disciples: DiscipleChanges
+    workers: WorkerChanges
+    next: str
+    has_more: bool
+
+class ContactMatches(BaseModel):
+    potentials: List[Potential]
+    disciples: List[Disciple]
+    workers: List[Worker]
+
+class CohortRow(BaseModel):
+    week_start: datetime
+    key: Optional[int] = None  # location or leader id
+    name: Optional[str] = None
+    added: int
+    converted: int
+    converted_7d: int
+    converted_30d: int
+    converted_90d: int
+
+class CohortReport(BaseModel):
+    """
+    Weekly cohorts of added potentials and how many converted within 7,
+    30 and 90 days. Windows that have not fully elapsed are still filling.
+    """
+    group_by: str
+    cohorts: List[CohortRow]
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    leader_id: int
+    name: Optional[str] = None
+    added: int
+    converted: int
+
+class LeaderboardReport(BaseModel):
+    """
+    Leaders ranked by potentials added or converted in one week or month.
+    Counts from other server processes can trail by a few seconds.
+    """
+    period: str
+    period_start: datetime
+    metric: str
+    leaders: List[LeaderboardEntry]
+
+class JobCreate(BaseModel):
+    job_type: str  # 'export' or 'report'
+    params: Dict[str, Any] = {}
+
+class Job(BaseModel):
+    id: str
+    job_type: str
+    params: Dict[str, Any]
+    status: str
+    progress: float
+    error: Optional[str] = None
+    artifact_size: Optional[int] = None
+    row_count: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,107 @@
+from typing import Callable
+
+from sqlalchemy import false, select, true
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import shards
+
+# How far each role can see, per table:
+#   ALL            every row
+#   LOCATION_TREE  rows in the user's location or any location under it
+#   TEAM           rows owned by the user or anyone who reports to them, at any depth
+#   OWN            rows owned by the user
+#   NONE           nothing
+ALL, LOCATION_TREE, TEAM, OWN, NONE = "all", "location_tree", "team", "own", "none"
+
+SCOPE_RULES = {
+    "potentials": {"admin": ALL, "pastor": ALL, "overseer": LOCATION_TREE, "leader": TEAM, "worker": OWN},
+    "disciples": {"admin": ALL, "pastor": ALL, "overseer": LOCATION_TREE, "leader": TEAM, "worker": OWN},
+    "workers": {"admin": ALL, "pastor": LOCATION_TREE, "overseer": LOCATION_TREE, "leader": TEAM, "worker": NONE},
+}
+# Precomputed reports over potentials are scoped like potentials
+SCOPE_RULES["conversion_cohorts"] = SCOPE_RULES["potentials"]
+
+ROLES = ["admin", "overseer", "pastor", "leader", "worker"]
+
+
+def owner_column(model):
+    return model.manager_id if model is models.Worker else model.creator_id
+
+
+def scope_rule(model, user) -> str:
+    return SCOPE_RULES[model.__tablename__].get(user.role, NONE)
+
+
+def scope_key(model, user) -> tuple:
+    """Identifies the set of `model` rows `user` may see; users with equal keys see the same rows."""
+    rule = scope_rule(model, user)
+    if rule == LOCATION_TREE:
+        return (rule, user.location_id)
+    if rule in (TEAM, OWN):
+        return (rule, user.id)
+    return (rule,)
+
+
+def locations_under(location_id):
+    """Subquery of the location and every location below it."""
+    return select(models.LocationClosure.descendant_id).where(models.LocationClosure.ancestor_id == location_id)
+
+
+def users_under(user_id):
+    """Subquery of the user and everyone who reports to them, directly or not."""
+    return select(models.UserClosure.descendant_id).where(models.UserClosure.ancestor_id == user_id)
+
+
+def scope_predicate(model, user, columns=None):
+    """
+    SQL predicate limiting `model` rows to those `user` may see. Every rule
+    is a single semi-join against a closure table, whatever the tree depth.
+    Pass `columns` as (location column, owner column) to apply the model's
+    rule to another table that records a location and owner.
+    """
+    rule = scope_rule(model, user)
+    location, owner = columns or (model.location_id, owner_column(model))
+    # Shard databases have no closure tables; their queries get the ids
+    # instead, which also routes them to the shards of those locations
+    resolve = shards.primary_ids if shards.holds(location.class_.__tablename__) else (lambda subquery: subquery)
+    if rule == ALL:
+        return true()
+    if rule == LOCATION_TREE:
+        if user.location_id is None:
+            return false()
+        return location.in_(resolve(locations_under(user.location_id)))
+    if rule == TEAM:
+        return owner.in_(resolve(users_under(user.id)))
+    if rule == OWN:
+        return owner == user.id
+    return false()
+
+
+def visibility_filter(db: Session, user) -> Callable[[dict], bool]:
+    """
+    Python equivalent of scope_predicate for change-feed events (which carry
+    table, location_id and owner_id). The user's subtrees are loaded once,
+    so later hierarchy changes apply from the next subscription.
+    """
+    rules = {table: SCOPE_RULES[table].get(user.role, NONE) for table in SCOPE_RULES}
+    location_ids = set()
+    if LOCATION_TREE in rules.values() and user.location_id is not None:
+        location_ids = set(db.execute(locations_under(user.location_id)).scalars())
+    team_ids = set()
+    if TEAM in rules.values():
+        team_ids = set(db.execute(users_under(user.id)).scalars())
+
+    def accepts(event: dict) -> bool:
+        rule = rules.get(event["table"], NONE)
+        if rule == ALL:
+            return True
+        if rule == LOCATION_TREE:
+            return event["location_id"] in location_ids
+        if rule == TEAM:
+            return event["owner_id"] in team_ids
+        if rule == OWN:
+            return event["owner_id"] == user.id
+        return False
+
+    return accepts
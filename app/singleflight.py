@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Callable, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for `key` is running,
+    later callers with the same key wait for it and get the same result
+    instead of running `fn` again. Nothing is cached once the call returns.
+    `fn` may outlive the request that started it, so it must not use that
+    request's resources (such as its DB session).
+    Used from the event loop only, so it needs no lock.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._in_flight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """Run the sync `fn(*args)` in the threadpool, or join the run already in flight for `key`."""
+        if not self.enabled:
+            self.executions += 1
+            return await run_in_threadpool(fn, *args)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            # A task of its own, so one caller going away does not cancel the others
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+
+flights = {}
+
+
+def flight(name: str) -> SingleFlight:
+    """The coalescer for an endpoint; SINGLE_FLIGHT_ENDPOINTS turns it on or off."""
+    if name not in flights:
+        flights[name] = SingleFlight(name, settings.SINGLE_FLIGHT_ENDPOINTS.get(name, False))
+    return flights[name]
+
+
+def metrics() -> dict:
+    return {name: f.metrics() for name, f in flights.items()}
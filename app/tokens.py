@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    Bounded LRU of decoded token payloads keyed by token digest.
+    Entries are dropped once the token they came from has expired.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes, now: float) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key: bytes, payload: dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RevocationList:
+    """
+    Revoked token ids (jti) plus per-subject cutoffs: a token for a subject
+    issued before its cutoff is rejected. Stored in the token_revocations
+    table so a revocation applies in every worker process. Each process
+    checks a copy held in memory, which a background thread (start())
+    reloads every `refresh_interval` seconds, so other processes see a
+    revocation within that time and checks never wait on the database.
+    """
+
+    def __init__(self, session_factory, refresh_interval: float = 2.0, max_token_lifetime: float = 3600.0):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self.max_token_lifetime = max_token_lifetime
+        self._jtis = set()
+        self._not_before = {}  # subject -> cutoff timestamp
+        self._stop = threading.Event()
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get("jti") in self._jtis:
+            return True
+        cutoff = self._not_before.get(payload.get("sub"))
+        return cutoff is not None and payload.get("iat", 0) < cutoff
+
+    def load(self):
+        """Replace the in-memory copy with the revocations still in force."""
+        revocation = models.TokenRevocation
+        with self.session_factory() as db:
+            rows = db.query(revocation.jti, revocation.subject, revocation.not_before).filter(
+                revocation.expires_at > time.time()
+            ).all()
+        jtis = set()
+        not_before = {}
+        for jti, subject, cutoff in rows:
+            if jti is not None:
+                jtis.add(jti)
+            elif subject is not None:
+                not_before[subject] = max(cutoff, not_before.get(subject, cutoff))
+        self._jtis, self._not_before = jtis, not_before
+
+    def start(self):
+        """Load the list, then keep reloading it in the background."""
+        self._stop.clear()
+        self.load()
+        threading.Thread(target=self._reload_loop, name="revocation-reload", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _reload_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception:
+                logger.exception("Token revocation reload failed")
+
+    def revoke(self, jti: str, expires_at: float):
+        self._store(models.TokenRevocation(jti=jti, expires_at=expires_at))
+        self._jtis.add(jti)
+
+    def revoke_subject(self, subject: str, at: Optional[float] = None):
+        at = at if at is not None else time.time()
+        self._store(models.TokenRevocation(subject=subject, not_before=at, expires_at=at + self.max_token_lifetime))
+        self._not_before[subject] = max(at, self._not_before.get(subject, at))
+
+    def _store(self, row):
+        """Commit a revocation and drop the ones no token can match any more."""
+        with self.session_factory() as db:
+            db.add(row)
+            db.query(models.TokenRevocation).filter(
+                models.TokenRevocation.expires_at <= time.time()
+            ).delete(synchronize_session=False)
+            db.commit()
@@ -0,0 +1,89 @@
+import re
+import zlib
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used instead
+    zstandard = None
+
+_NON_DIGITS = re.compile(r"\D")
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+def normalize_phone(phone: Optional[str], default_country_code: str = settings.DEFAULT_PHONE_COUNTRY_CODE) -> Optional[str]:
+    """
+    Best-effort E.164 form of a phone number ("+15551234567").
+    Numbers without an international prefix get `default_country_code`,
+    after dropping a national trunk "0". Returns None if it cannot be a
+    valid number.
+    """
+    if not phone:
+        return None
+    raw = phone.strip()
+    digits = _NON_DIGITS.sub("", raw)
+    if raw.startswith("+"):
+        pass
+    elif raw.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith(default_country_code) and len(digits) > 10:
+        pass  # national number written with its country code
+    else:
+        digits = default_country_code + digits.lstrip("0")
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+def normalize_handle(handle: Optional[str]) -> Optional[str]:
+    """Lowercase social handle without "@" or profile URL around it."""
+    if not handle:
+        return None
+    handle = handle.strip()
+    if "/" in handle:
+        path = urlparse(handle if "//" in handle else "//" + handle).path
+        parts = [p for p in path.split("/") if p]
+        handle = parts[-1] if parts else ""
+    return handle.lstrip("@").lower() or None
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+def parse_if_match(header: Optional[str]) -> Optional[List[int]]:
+    """
+    Versions an If-Match header accepts, or None if any version will do
+    (no header, or "*"). ETags that are not ours match nothing.
+    """
+    if header is None or header.strip() == "*":
+        return None
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            continue  # If-Match uses strong comparison
+        tag = tag.strip('"')
+        if tag.isdigit():
+            versions.append(int(tag))
+    return versions
+
+# First byte of a compressed blob names its codec
+ZLIB, ZSTD = b"\x01", b"\x02"
+
+def compress(data: bytes, codec: str = "zlib") -> bytes:
+    """Compress with zstd if asked for and installed, else zlib; decompress() tells them apart."""
+    if codec == "zstd" and zstandard is not None:
+        return ZSTD + zstandard.ZstdCompressor().compress(data)
+    return ZLIB + zlib.compress(data)
+
+def decompress(blob: bytes) -> bytes:
+    codec, data = blob[:1], blob[1:]
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed data needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
@@ -0,0 +1,141 @@
+"""
+Measure what compact audit diffs and deferred large columns save.
+
+Run from the repository root:
+
+    python benchmarks/bench_audit_storage.py [--records 5000] [--updates 3] [--notes-bytes 1500]
+
+Writes the audit trail of `records` potentials (create, `updates` one-field
+edits, delete) twice into throwaway SQLite databases: once the way it used
+to be stored (every submitted field on update, whole-row dumps on delete,
+plain JSON) and once through crud.audit_log_row (changed fields only,
+compressed above AUDIT_COMPRESS_MIN_BYTES). Prints the audit_logs size of
+each, then times loading audit rows and scope checks with and without the
+large columns.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session, undefer
+
+sys.path.append(".")
+
+from app import crud, models, schemas
+from app.migrations import upgrade
+
+CONTACT_KEYS = list(schemas.ContactInfo.model_fields)
+
+
+def potential_values(i: int, notes_bytes: int) -> dict:
+    contact_info = dict.fromkeys(CONTACT_KEYS)
+    contact_info.update(email=f"p{i}@example.com", phone="+15551234567")
+    return {
+        "first_name": f"p{i}", "last_name": "bench", "contact_info": contact_info,
+        "location": "loc1", "notes": ("note %d " % i * notes_bytes)[:notes_bytes],
+        "date_added": datetime.utcnow(), "is_disciple": False,
+    }
+
+
+def old_trail(i: int, values: dict, updates: int) -> list:
+    """Audit rows as written before: full values everywhere, plus the router's delete dump."""
+    fields = {**values, "location_id": 2, "contact_email": f"p{i}@example.com", "contact_phone": "+15551234567"}
+    del fields["location"], fields["date_added"]
+    rows = [("create", values)]
+    for version in range(2, updates + 2):
+        fields = {**fields, "first_name": f"p{i}v{version}"}
+        rows.append(("update", {**fields, "version": version}))
+    rows.append(("delete", {"deleted_potential": {**values, "id": i, "leader_id": 1, "version": updates + 1}}))
+    rows.append(("delete", {"deleted": True}))
+    return [
+        {"action": action, "table_name": "potentials", "record_id": i, "user_id": 1, "timestamp": datetime.utcnow(),
+         "changes": json.loads(json.dumps(changes, default=crud.json_serial))}
+        for action, changes in rows
+    ]
+
+
+def new_trail(i: int, values: dict, updates: int) -> list:
+    """Audit rows as crud writes them now."""
+    rows = [crud.audit_log_row("create", "potentials", i, 1, crud.without_nulls(values))]
+    first_name = values["first_name"]
+    for version in range(2, updates + 2):
+        changed = crud.audit_diff({"first_name": first_name}, {"first_name": f"p{i}v{version}"})
+        first_name = f"p{i}v{version}"
+        rows.append(crud.audit_log_row("update", "potentials", i, 1, {"changed": changed, "version": version}))
+    rows.append(crud.audit_log_row("delete", "potentials", i, 1, {"deleted": True}))
+    return [
+        {"action": r.action, "table_name": r.table_name, "record_id": r.record_id, "user_id": r.user_id,
+         "timestamp": r.timestamp, "changes": r.changes, "changes_packed": r.changes_packed}
+        for r in rows
+    ]
+
+
+def table_bytes(engine, table: str) -> int:
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :t"), {"t": table}).scalar() or 0
+
+
+def timeit(label, fn, repeat=5):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    print(f"{label:<48} {(time.perf_counter() - start) / repeat * 1e3:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--updates", type=int, default=3)
+    parser.add_argument("--notes-bytes", type=int, default=1500)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    engines = {}
+    for name, trail in (("before", old_trail), ("after", new_trail)):
+        engine = engines[name] = create_engine(f"sqlite:///{os.path.join(root, name + '.db')}")
+        upgrade(engine)
+        with engine.begin() as conn:
+            rows = []
+            for i in range(1, args.records + 1):
+                rows += trail(i, potential_values(i, args.notes_bytes), args.updates)
+            conn.execute(insert(models.AuditLog), rows)
+
+    before, after = table_bytes(engines["before"], "audit_logs"), table_bytes(engines["after"], "audit_logs")
+    print(f"audit_logs for {args.records} potentials, {args.updates} updates each:")
+    print(f"  full values, plain JSON     {before / 1e6:8.2f} MB")
+    print(f"  diffs, compressed           {after / 1e6:8.2f} MB  ({1 - after / before:.0%} smaller)\n")
+
+    engine = engines["after"]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Location), [{"id": 1, "name": "loc1"}])
+        conn.execute(insert(models.User), [{"id": 1, "username": "admin", "hashed_password": "x", "role": "admin"}])
+        now = datetime.utcnow()
+        conn.execute(insert(models.Potential), [
+            {"id": i, "first_name": f"p{i}", "last_name": "bench", "location_id": 1, "creator_id": 1,
+             "contact_info": potential_values(i, args.notes_bytes)["contact_info"],
+             "notes": potential_values(i, args.notes_bytes)["notes"], "date_added": now, "updated_at": now}
+            for i in range(1, args.records + 1)
+        ])
+    admin = schemas.User(id=1, username="admin", role="admin", is_active=True)
+    with Session(engine) as db:
+        audit = db.query(models.AuditLog).filter(models.AuditLog.action == "update")
+        timeit("load update audit rows, changes undeferred",
+               lambda: (db.expunge_all(), audit.options(undefer(models.AuditLog.changes),
+                                                        undefer(models.AuditLog.changes_packed)).all()))
+        timeit("load update audit rows, changes deferred", lambda: (db.expunge_all(), audit.all()))
+        ids = range(1, min(args.records, 1000) + 1)
+        timeit(f"{len(ids)} scope checks, full rows",
+               lambda: (db.expunge_all(), [crud.get_scoped(db, models.Potential, i, admin) for i in ids]))
+        timeit(f"{len(ids)} scope checks, detail=False",
+               lambda: (db.expunge_all(), [crud.get_scoped(db, models.Potential, i, admin, detail=False) for i in ids]))
+
+
+if __name__ == "__main__":
+    main()
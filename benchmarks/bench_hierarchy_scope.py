@@ -0,0 +1,126 @@
+"""
+Benchmark hierarchy-scoped list queries with 10k users.
+
+Run from the repository root:
+
+    python benchmarks/bench_hierarchy_scope.py [--users 10000] [--fanout 8] [--potentials 200000]
+
+Builds a throwaway SQLite database with a user tree (each user reports to
+one of the previous `fanout`-ary level), regions of locations, and
+potentials spread over the users, then times the scoped potential list for a
+top-level leader, a mid-level leader and an overseer, and prints the query
+plan so the closure-table semi-join is visible.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+
+from app import crud, models, schemas
+from app.migrations import upgrade
+
+
+def seed(engine, n_users, fanout, n_regions, locations_per_region, n_potentials):
+    with engine.begin() as conn:
+        locations, location_closure = [], []
+        for r in range(n_regions):
+            region_id = r * (locations_per_region + 1) + 1
+            locations.append({"id": region_id, "name": f"region{r}", "parent_id": None})
+            location_closure.append({"ancestor_id": region_id, "descendant_id": region_id, "depth": 0})
+            for i in range(1, locations_per_region + 1):
+                locations.append({"id": region_id + i, "name": f"region{r}-loc{i}", "parent_id": region_id})
+                location_closure.append({"ancestor_id": region_id + i, "descendant_id": region_id + i, "depth": 0})
+                location_closure.append({"ancestor_id": region_id, "descendant_id": region_id + i, "depth": 1})
+        conn.execute(insert(models.Location), locations)
+        conn.execute(insert(models.LocationClosure), location_closure)
+        leaf_ids = [l["id"] for l in locations if l["parent_id"] is not None]
+
+        # User i reports to (i - 2) // fanout + 1, giving a complete fanout-ary tree
+        users, parents = [], {}
+        for i in range(1, n_users + 1):
+            parent_id = (i - 2) // fanout + 1 if i > 1 else None
+            parents[i] = parent_id
+            users.append({"id": i, "username": f"u{i}", "hashed_password": "x", "role": "leader",
+                          "location_id": leaf_ids[i % len(leaf_ids)], "parent_id": parent_id})
+        conn.execute(insert(models.User), users)
+        user_closure = []
+        for i in range(1, n_users + 1):
+            node, depth = i, 0
+            while node is not None:
+                user_closure.append({"ancestor_id": node, "descendant_id": i, "depth": depth})
+                node, depth = parents[node], depth + 1
+        for start in range(0, len(user_closure), 10000):
+            conn.execute(insert(models.UserClosure), user_closure[start:start + 10000])
+
+        now = datetime.utcnow()
+        rows = [
+            {"first_name": f"p{i}", "last_name": "bench", "contact_info": {},
+             "location_id": leaf_ids[i % len(leaf_ids)], "creator_id": (i % n_users) + 1,
+             "date_added": now, "updated_at": now, "is_disciple": False}
+            for i in range(n_potentials)
+        ]
+        for start in range(0, len(rows), 10000):
+            conn.execute(insert(models.Potential), rows[start:start + 10000])
+        conn.execute(text("ANALYZE"))
+        return len(user_closure)
+
+
+def timeit(label, fn, repeat=50):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<44} {elapsed * 1e3:8.3f} ms  ({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--regions", type=int, default=10)
+    parser.add_argument("--locations-per-region", type=int, default=10)
+    parser.add_argument("--potentials", type=int, default=200_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade(engine)
+
+    start = time.perf_counter()
+    closure_rows = seed(engine, args.users, args.fanout, args.regions,
+                        args.locations_per_region, args.potentials)
+    print(f"seeded {args.users} users ({closure_rows} closure rows) and "
+          f"{args.potentials} potentials in {time.perf_counter() - start:.1f}s\n")
+
+    def as_user(user_id, role, location_id=None):
+        return schemas.User(id=user_id, username=f"u{user_id}", role=role, is_active=True,
+                            location_id=location_id, parent_id=None)
+
+    root_leader = as_user(1, "leader")
+    mid_leader = as_user(2 + args.fanout, "leader")  # second level, ~1/fanout^2 of the tree
+    overseer = as_user(1, "overseer", location_id=1)  # region0
+    with Session(engine) as db:
+        timeit("leader at the root, first page", lambda: crud.get_potentials_for_user(db, root_leader, limit=100))
+        timeit("leader at depth 2, first page", lambda: crud.get_potentials_for_user(db, mid_leader, limit=100))
+        timeit("leader at depth 2, page 10", lambda: crud.get_potentials_for_user(db, mid_leader, skip=1000, limit=100))
+        timeit("overseer of a region, first page", lambda: crud.get_potentials_for_user(db, overseer, limit=100))
+        timeit("single record scope check", lambda: [crud.get_scoped(db, models.Potential, 12345, mid_leader)])
+
+        sql = str(crud.query_live(db, models.Potential).filter(crud.potential_scope(mid_leader))
+                  .order_by(models.Potential.id).limit(100)
+                  .statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        print("\nplan for the leader view:")
+        for row in db.execute(text("EXPLAIN QUERY PLAN " + sql)):
+            print("  ", row[-1])
+
+
+if __name__ == "__main__":
+    main()
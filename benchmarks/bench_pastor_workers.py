@@ -0,0 +1,90 @@
+"""
+Benchmark the pastor worker list (workers in one location) at 100k workers.
+
+Run from the repository root:
+
+    python benchmarks/bench_pastor_workers.py [--workers 100000] [--locations 50]
+
+Builds a throwaway SQLite database, fills it with workers spread over N
+locations, then times crud.get_workers_by_location for the first page, a deep
+page and the leader/role variants, and prints the query plan so the index use
+is visible.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+sys.path.append(".")
+
+from app import crud, models
+from app.migrations import upgrade
+
+
+def seed(engine, n_workers, n_locations, n_leaders):
+    with engine.begin() as conn:
+        conn.execute(insert(models.Location), [
+            {"id": i + 1, "name": f"loc{i}"} for i in range(n_locations)
+        ])
+        conn.execute(insert(models.User), [
+            {"id": i + 1, "username": f"leader{i}", "hashed_password": "x",
+             "role": "leader", "location_id": (i % n_locations) + 1}
+            for i in range(n_leaders)
+        ])
+        now = datetime.utcnow()
+        rows = [
+            {"first_name": f"w{i}", "last_name": "bench", "contact_info": {},
+             "location_id": (i % n_locations) + 1, "role": ("worker", "leader")[i % 10 == 0],
+             "manager_id": (i % n_leaders) + 1, "date_added": now}
+            for i in range(n_workers)
+        ]
+        for start in range(0, len(rows), 10000):
+            conn.execute(insert(models.Worker), rows[start:start + 10000])
+        conn.execute(text("ANALYZE"))
+
+
+def timeit(label, fn, repeat=200):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1e3:8.3f} ms  ({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=100_000)
+    parser.add_argument("--locations", type=int, default=50)
+    parser.add_argument("--leaders", type=int, default=500)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade(engine)
+
+    start = time.perf_counter()
+    seed(engine, args.workers, args.locations, args.leaders)
+    print(f"seeded {args.workers} workers in {time.perf_counter() - start:.1f}s\n")
+
+    with Session(engine) as db:
+        timeit("pastor view, first page", lambda: crud.get_workers_by_location(db, "loc7", limit=100))
+        timeit("pastor view, page 10", lambda: crud.get_workers_by_location(db, "loc7", skip=1000, limit=100))
+        timeit("leader view, first page", lambda: crud.get_workers_by_leader(db, 42, limit=100))
+        timeit("role filter, first page", lambda: crud.get_workers_by_role(db, "leader", limit=100))
+
+        sql = str(crud.query_live(db, models.Worker).filter(models.Worker.location_id == 8)
+                  .order_by(models.Worker.id).limit(100)
+                  .statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        print("\nplan for the pastor view:")
+        for row in db.execute(text("EXPLAIN QUERY PLAN " + sql)):
+            print("  ", row[-1])
+
+
+if __name__ == "__main__":
+    main()
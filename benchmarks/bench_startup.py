@@ -0,0 +1,77 @@
+"""
+Profile cold start of one API worker.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 15]
+
+Each run is a fresh interpreter against a throwaway, already migrated
+SQLite database. It reports the time to import app.main (what every
+uvicorn worker pays before it can accept connections), the time the
+lifespan startup takes (schema check, pool and cache warm-up), and the
+slowest modules by cumulative import time from `python -X importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(".")
+
+WORKER = """
+import asyncio, json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def startup():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        pass
+
+asyncio.run(startup())
+print(json.dumps({"import": imported - start, "lifespan": time.perf_counter() - imported}))
+"""
+
+
+def run(env, *args):
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+               PYTHONPATH=os.getcwd())
+    run(env, "migrate.py")
+
+    import json
+    results = [json.loads(run(env, "-c", WORKER).stdout.strip().splitlines()[-1]) for _ in range(args.runs)]
+    for phase in ("import", "lifespan"):
+        times = [r[phase] * 1e3 for r in results]
+        print(f"{phase:<10} median {statistics.median(times):8.1f} ms   min {min(times):8.1f} ms   max {max(times):8.1f} ms")
+
+    profile = run(env, "-X", "importtime", "-c", "import app.main").stderr
+    modules = []
+    for line in profile.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name.strip()))
+    print(f"\nslowest imports (cumulative):")
+    for cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+    print(f"\napp modules (cumulative):")
+    for cumulative, name in sorted(m for m in modules if m[1].startswith("app."))[::-1][:args.top]:
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
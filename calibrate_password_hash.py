@@ -0,0 +1,84 @@
+"""
+Pick password hashing parameters for this machine.
+
+    python calibrate_password_hash.py [--scheme bcrypt|argon2] [--target-ms 250]
+
+Times one hash at increasing cost and prints the settings for the most
+expensive parameters that still hash within the target latency. Put the
+printed lines in .env; existing users are rehashed on their next login.
+"""
+import argparse
+import sys
+import time
+
+sys.path.append(".")
+
+from app.auth import build_password_context
+from app.config import settings
+
+SAMPLE_PASSWORD = "correct horse battery staple"
+
+
+def time_hash(context, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        context.hash(SAMPLE_PASSWORD)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def calibrate_bcrypt(target_ms):
+    chosen = 4
+    for rounds in range(4, 32):
+        elapsed = time_hash(build_password_context("bcrypt", bcrypt_rounds=rounds))
+        print(f"  bcrypt rounds={rounds:<2} {elapsed:8.1f} ms")
+        if elapsed > target_ms:
+            break
+        chosen = rounds
+    return {"PASSWORD_HASH_SCHEME": "bcrypt", "BCRYPT_ROUNDS": chosen}
+
+
+def calibrate_argon2(target_ms, memory_cost, parallelism):
+    chosen = 1
+    for time_cost in range(1, 50):
+        context = build_password_context(
+            "argon2",
+            argon2_time_cost=time_cost,
+            argon2_memory_cost=memory_cost,
+            argon2_parallelism=parallelism,
+        )
+        elapsed = time_hash(context)
+        print(f"  argon2 time_cost={time_cost:<2} {elapsed:8.1f} ms")
+        if elapsed > target_ms:
+            break
+        chosen = time_cost
+    return {
+        "PASSWORD_HASH_SCHEME": "argon2",
+        "ARGON2_TIME_COST": chosen,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": parallelism,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default=settings.PASSWORD_HASH_SCHEME)
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--argon2-memory-cost", type=int, default=settings.ARGON2_MEMORY_COST)
+    parser.add_argument("--argon2-parallelism", type=int, default=settings.ARGON2_PARALLELISM)
+    args = parser.parse_args()
+
+    print(f"calibrating {args.scheme} for {args.target_ms:.0f} ms per hash")
+    if args.scheme == "bcrypt":
+        chosen = calibrate_bcrypt(args.target_ms)
+    else:
+        chosen = calibrate_argon2(args.target_ms, args.argon2_memory_cost, args.argon2_parallelism)
+
+    print("\nadd to .env:")
+    for key, value in chosen.items():
+        print(f"{key}={value}")
+
+
+if __name__ == "__main__":
+    main()
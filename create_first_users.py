@@ -1,23 +1,18 @@
 import sys
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
-from datetime import datetime
-import bcrypt  # Directly using bcrypt for clarity
 
 # Add your app directory to path
 sys.path.append(".")
 
-from app.database import Base
+from app import crud, schemas
+from app.migrations import upgrade
 from app.models import User
 
-def get_password_hash(password: str):
-    """Standalone hashing function using bcrypt directly"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
 def create_first_users():
     # Initialize database
     engine = create_engine("sqlite:///./sql_app.db")
-    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
     
     # Create session
     db = Session(engine)
@@ -47,20 +42,10 @@ def create_first_users():
 
         for user_data in users_data:
             if not db.query(User).filter(User.username == user_data["username"]).first():
-                hashed_pw = get_password_hash(user_data["password"])
-                print(f"Hashing password for {user_data['username']}: {hashed_pw}")  # Debug output
-                
-                db_user = User(
-                    username=user_data["username"],
-                    hashed_password=hashed_pw,
-                    role=user_data["role"],
-                    location=user_data["location"],
-                    is_active=True
-                )
-                db.add(db_user)
+                # crud.create_user commits each user (with its closure row) before
+                # the next query, so interning the next location never waits on us
+                crud.create_user(db, schemas.UserCreate(**user_data))
                 print(f"Created user: {user_data['username']}")
-        
-        db.commit()
     except Exception as e:
         db.rollback()
         print(f"Error creating users: {e}")
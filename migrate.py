@@ -0,0 +1,55 @@
+"""
+Create or upgrade the database schema.
+
+    python migrate.py          # upgrade the database in DATABASE_URL
+    python migrate.py --check  # exit 1 if it needs upgrading
+    python migrate.py --rebuild-counts  # also recount the list totals from the tables
+    python migrate.py --rebuild-leaderboard  # also recount the leaderboard from potentials
+
+Run once per deploy, before starting the API workers; the workers only
+check that the schema is current and never alter it themselves.
+"""
+import argparse
+import sys
+import time
+
+sys.path.append(".")
+
+from app import counts, leaderboard
+from app.database import engine
+from app.migrations import is_current, upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="only report whether an upgrade is needed")
+    parser.add_argument("--rebuild-counts", action="store_true",
+                        help="recount record_counts, e.g. after writes made outside the API")
+    parser.add_argument("--rebuild-leaderboard", action="store_true",
+                        help="recount leaderboard_counts from potentials; restart the API workers afterwards")
+    args = parser.parse_args()
+
+    if args.check:
+        current = is_current(engine)
+        print("schema is up to date" if current else "schema needs upgrading")
+        sys.exit(0 if current else 1)
+
+    start = time.perf_counter()
+    upgrade(engine)
+    print(f"schema upgraded in {time.perf_counter() - start:.2f}s")
+
+    if args.rebuild_counts:
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            counts.rebuild(conn)
+        print(f"record counts rebuilt in {time.perf_counter() - start:.2f}s")
+
+    if args.rebuild_leaderboard:
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            leaderboard.rebuild(conn)
+        print(f"leaderboard rebuilt in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
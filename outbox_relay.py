@@ -0,0 +1,70 @@
+"""
+Deliver outbox events to a downstream sink.
+
+    python outbox_relay.py --sink file://./outbox.jsonl
+    python outbox_relay.py --sink unix:///tmp/events.sock --consumer billing
+    python outbox_relay.py --sink http://localhost:9000/hook --once
+    python outbox_relay.py --metrics
+
+Delivery is at-least-once: each consumer has its own checkpoint and a batch
+is retried until the sink accepts it, so consumers should dedupe on event id.
+Events are relayed in id order, except that one committed after a higher id
+was relayed follows later (see OutboxRelay for how long the relay waits).
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import timedelta
+
+sys.path.append(".")
+
+from app.database import SessionLocal
+from app.outbox import OutboxRelay, make_sink, purge_delivered
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sink", default="file://./outbox.jsonl")
+    parser.add_argument("--consumer", default="default")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--gap-seconds", type=float, default=600.0,
+                        help="how long to wait for an event whose id was skipped by a later commit")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--metrics-interval", type=float, default=30.0)
+    parser.add_argument("--retention-days", type=float, default=7.0,
+                        help="purge events every consumer has received once older than this")
+    parser.add_argument("--once", action="store_true", help="drain the backlog and exit")
+    parser.add_argument("--metrics", action="store_true", help="print backlog metrics and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    relay = OutboxRelay(SessionLocal, make_sink(args.sink), consumer=args.consumer, batch_size=args.batch_size,
+                        gap_seconds=args.gap_seconds)
+
+    if args.metrics:
+        print(json.dumps(relay.metrics()))
+        return
+
+    if args.once:
+        while relay.run_once():
+            pass
+        print(json.dumps(relay.metrics()))
+        return
+
+    last_report = 0.0
+
+    def report(_count):
+        nonlocal last_report
+        if time.monotonic() - last_report >= args.metrics_interval:
+            last_report = time.monotonic()
+            print(json.dumps(relay.metrics()))
+            with SessionLocal() as db:
+                purge_delivered(db, timedelta(days=args.retention_days))
+
+    relay.run_forever(poll_interval=args.poll_interval, on_batch=report)
+
+
+if __name__ == "__main__":
+    main()
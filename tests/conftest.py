@@ -0,0 +1,124 @@
+"""
+Shared fixtures. The app reads its settings at import, so the databases are
+pointed at a temporary directory here, before anything imports it: a primary
+and one shard ("east", holding the east location), so that routing and
+cross-shard merging run for real. Run from the repository root with
+`python -m pytest`.
+"""
+import json
+import os
+import tempfile
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix="app-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/primary.db"
+os.environ["SHARD_URLS"] = json.dumps({"east": f"sqlite:///{DATA_DIR}/east.db"})
+os.environ["SHARD_LOCATIONS"] = json.dumps({"east": "east"})
+os.environ["ARTIFACT_DIR"] = f"{DATA_DIR}/artifacts"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import crud, models, schemas  # noqa: E402
+from app.database import SessionLocal, engine, shards  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+
+PASSWORD = "secret"
+
+# username -> (role, location)
+USERS = {
+    "admin": ("admin", "hq"),
+    "leader": ("leader", "west"),
+    "leader2": ("leader", "north"),
+    "eastleader": ("leader", "east"),
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    upgrade(engine)
+    with SessionLocal() as db:
+        for username, (role, location) in USERS.items():
+            crud.create_user(db, schemas.UserCreate(username=username, password=PASSWORD, role=role, location=location))
+        # Pin the locations to their shards now: pinning takes a write of its
+        # own, which SQLite would block behind a request's open transaction
+        for (location_id,) in db.query(models.Location.id):
+            shards.shard_for_location(location_id)
+
+
+@pytest.fixture(scope="session")
+def org(database):
+    """
+    A small organization of its own: region "south" with "south-site" under
+    it, an overseer of the region, and a leader > sub-leader > worker chain
+    at the site. Returns {name: user id}.
+    """
+    with SessionLocal() as db:
+        region = crud.create_location(db, "south")
+        site = crud.create_location(db, "south-site", region.id)
+        for location in (region, site):
+            shards.shard_for_location(location.id)
+        ids = {}
+        for username, role, parent in [("overseer", "overseer", None), ("boss", "leader", None),
+                                       ("sub", "leader", "boss"), ("helper", "worker", "sub")]:
+            location = "south" if role == "overseer" else "south-site"
+            user = crud.create_user(db, schemas.UserCreate(
+                username=username, password=PASSWORD, role=role, location=location, parent_id=ids.get(parent)
+            ))
+            ids[username] = user.id
+    return ids
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def headers(client):
+    """Authorization headers by username, logging each user in once."""
+    tokens = {}
+
+    def for_user(username):
+        if username not in tokens:
+            response = client.post("/token", data={"username": username, "password": PASSWORD})
+            assert response.status_code == 200, response.text
+            tokens[username] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return tokens[username]
+
+    return for_user
+
+
+@pytest.fixture
+def user_id(db):
+    def by_name(username):
+        return db.query(models.User.id).filter(models.User.username == username).scalar()
+
+    return by_name
+
+
+@pytest.fixture
+def location_id(db):
+    def by_name(name):
+        return db.query(models.Location.id).filter(models.Location.name == name).scalar()
+
+    return by_name
+
+
+@pytest.fixture
+def create_potential(client, headers):
+    def create(username="admin", location="west", **fields):
+        body = {"first_name": "Ada", "last_name": "Lovelace", "contact_info": {"email": "ada@example.com"},
+                "location": location, **fields}
+        response = client.post("/potentials/", json=body, headers=headers(username))
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return create
@@ -0,0 +1,60 @@
+from sqlalchemy import inspect
+
+from app import crud, models, utils
+from app.config import settings
+
+
+def latest_audit(db, record_id):
+    log = db.query(models.AuditLog).filter(
+        models.AuditLog.table_name == "potentials", models.AuditLog.record_id == record_id
+    ).order_by(models.AuditLog.id.desc()).first()
+    db.rollback()  # end the read so the next one sees later commits
+    return log
+
+
+def test_compressed_blobs_round_trip():
+    data = b'{"notes": "' + b"x" * 1000 + b'"}'
+
+    for codec in ("zlib", "zstd"):  # zstd falls back to zlib without the zstandard package
+        packed = utils.compress(data, codec)
+        assert len(packed) < len(data)
+        assert utils.decompress(packed) == data
+
+
+def test_only_large_changes_are_compressed():
+    small = {"first_name": ["Ada", "Grace"]}
+    large = {"notes": [None, "x" * settings.AUDIT_COMPRESS_MIN_BYTES]}
+
+    small_row = crud.audit_log_row("update", "potentials", 1, 1, small)
+    large_row = crud.audit_log_row("update", "potentials", 1, 1, large)
+
+    assert (small_row.changes, small_row.changes_packed) == (small, None)
+    assert large_row.changes is None and large_row.changes_packed is not None
+    assert crud.audit_changes(small_row) == small
+    assert crud.audit_changes(large_row) == large
+
+
+def test_updates_record_only_what_changed(client, headers, db, create_potential):
+    potential = create_potential(last_name="audited")
+    body = {"first_name": "Grace", "last_name": "audited", "contact_info": {"email": "ada@example.com"},
+            "location": "west", "notes": "y" * 2000}
+    assert client.put(f"/potentials/{potential['id']}", json=body, headers=headers("admin")).status_code == 200
+
+    log = latest_audit(db, potential["id"])
+    changes = crud.audit_changes(log)
+
+    assert log.changes_packed is not None  # the notes made it large
+    assert set(changes["changed"]) == {"first_name", "notes"}
+    assert changes["changed"]["first_name"] == ["Ada", "Grace"]
+    assert changes["version"] == potential["version"] + 1
+
+
+def test_audit_rows_load_without_their_changes(db, create_potential):
+    potential = create_potential(last_name="deferred")
+
+    log = db.query(models.AuditLog).filter(
+        models.AuditLog.table_name == "potentials", models.AuditLog.record_id == potential["id"]
+    ).first()
+
+    assert {"changes", "changes_packed"}.isdisjoint(inspect(log).dict)
+    assert crud.audit_changes(log)["last_name"] == "deferred"  # loaded when asked for
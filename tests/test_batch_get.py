@@ -0,0 +1,53 @@
+def batch_get(client, headers, username, ids, path="/potentials/batch-get"):
+    response = client.post(path, json={"ids": ids}, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_found_forbidden_and_missing(client, headers, org, create_potential):
+    mine = create_potential("boss", location="south-site")["id"]
+    theirs = create_potential("leader", location="west")["id"]
+    missing = 10 ** 9
+
+    result = batch_get(client, headers, "boss", [theirs, mine, missing])
+
+    assert [potential["id"] for potential in result["found"]] == [mine]
+    assert result["forbidden"] == [theirs]
+    assert result["missing"] == [missing]
+
+
+def test_found_keeps_request_order_without_duplicates(client, headers, create_potential):
+    ids = [create_potential()["id"] for _ in range(3)]
+
+    result = batch_get(client, headers, "admin", [ids[2], ids[0], ids[2], ids[1]])
+
+    assert [potential["id"] for potential in result["found"]] == [ids[2], ids[0], ids[1]]
+
+
+def test_spans_shards(client, headers, create_potential):
+    ids = [create_potential(location=location)["id"] for location in ("east", "west", "east")]
+
+    result = batch_get(client, headers, "admin", ids)
+
+    assert [potential["id"] for potential in result["found"]] == ids
+
+
+def test_deleted_records_are_missing(client, headers, create_potential):
+    potential = create_potential()["id"]
+    client.delete(f"/potentials/{potential}", headers=headers("admin"))
+
+    assert batch_get(client, headers, "admin", [potential])["missing"] == [potential]
+
+
+def test_workers_batch_is_scoped_like_the_list(client, headers):
+    body = {"first_name": "Wendy", "last_name": "Worker", "contact_info": {}, "location": "west"}
+    worker = client.post("/workers/", json=body, headers=headers("admin")).json()["id"]
+
+    assert batch_get(client, headers, "admin", [worker], "/workers/batch-get")["found"][0]["id"] == worker
+    assert batch_get(client, headers, "leader2", [worker], "/workers/batch-get")["forbidden"] == [worker]
+
+
+def test_empty_and_oversized_requests_are_rejected(client, headers):
+    assert client.post("/potentials/batch-get", json={"ids": []}, headers=headers("admin")).status_code == 422
+    too_many = list(range(1, 10 ** 4))
+    assert client.post("/potentials/batch-get", json={"ids": too_many}, headers=headers("admin")).status_code == 422
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from app import cohorts, crud
+from app.database import SessionLocal, shards
+
+
+@pytest.fixture(scope="module")
+def town(database):
+    """A location of its own, so other modules' potentials stay out of its cohorts."""
+    with SessionLocal() as db:
+        location = crud.create_location(db, "cohort-town")
+        shards.shard_for_location(location.id)
+        return location.id
+
+
+def cohort_rows(client, headers, username, group_by="location"):
+    response = client.get("/reports/cohorts", params={"group_by": group_by}, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return response.json()["cohorts"]
+
+
+def this_week(rows, key):
+    start = cohorts.week_start(datetime.utcnow()).isoformat()
+    return next((row for row in rows if row["key"] == key and row["week_start"] == start), None)
+
+
+def test_week_start_is_monday_midnight():
+    assert cohorts.week_start(datetime(2024, 5, 16, 13, 45)) == datetime(2024, 5, 13)
+    assert cohorts.week_start(datetime(2024, 5, 13)) == datetime(2024, 5, 13)
+
+
+def test_added_and_converted_are_counted_per_week(client, headers, create_potential, town):
+    empty = dict.fromkeys(("added", "converted", "converted_7d", "converted_90d"), 0)
+    before = this_week(cohort_rows(client, headers, "admin"), town) or empty
+
+    kept = create_potential(location="cohort-town", last_name="kept")
+    create_potential(location="cohort-town", last_name="waiting")
+    assert client.put(f"/potentials/{kept['id']}/convert", headers=headers("admin")).status_code == 200
+
+    row = this_week(cohort_rows(client, headers, "admin"), town)
+    assert row["name"] == "cohort-town"
+    assert (row["added"], row["converted"], row["converted_7d"], row["converted_90d"]) == (
+        before["added"] + 2, before["converted"] + 1, before["converted_7d"] + 1, before["converted_90d"] + 1
+    )
+
+
+def test_deleted_potentials_leave_their_cohort(client, headers, create_potential, town):
+    gone = create_potential(location="cohort-town", last_name="gone")
+    added = this_week(cohort_rows(client, headers, "admin"), town)["added"]
+
+    assert client.delete(f"/potentials/{gone['id']}", headers=headers("admin")).status_code == 204
+
+    assert this_week(cohort_rows(client, headers, "admin"), town)["added"] == added - 1
+
+
+def test_leaders_only_see_their_own_cohorts(client, headers, create_potential, user_id, town):
+    create_potential("leader", location="cohort-town", last_name="own")
+
+    leader_rows = cohort_rows(client, headers, "leader", group_by="leader")
+    assert leader_rows
+    assert {row["key"] for row in leader_rows} == {user_id("leader")}
+    assert {row["name"] for row in leader_rows} == {"leader"}
+    assert this_week(cohort_rows(client, headers, "leader2"), town) is None
+
+
+def test_unknown_grouping_is_rejected(client, headers):
+    response = client.get("/reports/cohorts", params={"group_by": "week"}, headers=headers("admin"))
+    assert response.status_code == 400
@@ -0,0 +1,57 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from app import columnar
+
+COLUMNS = [
+    ("id", columnar.INT64),
+    ("score", columnar.FLOAT64),
+    ("active", columnar.BOOL),
+    ("added", columnar.TIMESTAMP),
+    ("name", columnar.UTF8),
+    ("location", columnar.DICTIONARY),
+]
+
+
+def write(batches) -> io.BytesIO:
+    f = io.BytesIO()
+    writer = columnar.ColsWriter(f, COLUMNS)
+    for batch in batches:
+        writer.write(batch)
+    writer.close()
+    f.seek(0)
+    return f
+
+
+def test_cols_round_trip():
+    batches = [
+        {
+            "id": [1, 2, None],
+            "score": [0.5, None, -2.25],
+            "active": [True, False, None],
+            "added": [datetime(2024, 1, 2, 3, 4, 5, 678901), None, datetime(1969, 12, 31, 23, 59, 59)],
+            "name": ["Ada", "", None],
+            "location": ["west", "east", None],
+        },
+        {  # reuses dictionary entries from the first batch and adds one
+            "id": [2 ** 62, -1],
+            "score": [1e300, 0.0],
+            "active": [False, True],
+            "added": [datetime(2030, 6, 1), datetime(2000, 2, 29, 12)],
+            "name": ["Zoë ✓", "x" * 1000],
+            "location": ["east", "north"],
+        },
+    ]
+
+    assert list(columnar.read_cols(write(batches))) == batches
+
+
+def test_cols_empty_batches_are_skipped():
+    assert list(columnar.read_cols(write([{name: [] for name, _ in COLUMNS}]))) == []
+
+
+def test_read_cols_rejects_other_files():
+    with pytest.raises(ValueError):
+        list(columnar.read_cols(io.BytesIO(b"PAR1" + b"\0" * 16)))
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app import auth, concurrency
+from app.concurrency import ConcurrencyLimiter, Overloaded
+from conftest import PASSWORD
+
+
+def test_login_hashes_off_the_event_loop(client, monkeypatch):
+    on_loop = []
+    authenticate = auth.authenticate_user
+
+    def spy(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return authenticate(*args, **kwargs)
+
+    monkeypatch.setattr(auth, "authenticate_user", spy)
+    response = client.post("/token", data={"username": "leader", "password": PASSWORD})
+
+    assert response.status_code == 200
+    assert on_loop == [False]
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/token", "auth"),
+    ("GET", "/reports/cohorts", "reports"),
+    ("GET", "/potentials/", "reads"),
+    ("PUT", "/potentials/1", "writes"),
+    ("GET", "/events", None),
+    ("GET", "/", None),
+])
+def test_route_classes(method, path, expected):
+    assert concurrency.route_class(method, path) == expected
+
+
+def test_waiters_get_freed_slots_in_order():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, queue_timeout=1.0, max_queue=10)
+        order = []
+
+        async def request(name):
+            await limiter.acquire()
+            order.append(name)
+
+        await limiter.acquire()
+        waiting = [asyncio.create_task(request(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert limiter.metrics()["waiting"] == 2
+        limiter.release()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*waiting)
+        return order, limiter.metrics()
+
+    order, metrics = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert (metrics["in_flight"], metrics["admitted"], metrics["shed"]) == (1, 3, 0)
+
+
+def test_waiters_are_shed_after_the_queue_timeout():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, queue_timeout=0.01, max_queue=10)
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        return limiter.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert (metrics["in_flight"], metrics["waiting"], metrics["shed"]) == (1, 0, 1)
+
+
+def test_a_full_queue_sheds_at_once():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, queue_timeout=60, max_queue=0)
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await asyncio.wait_for(limiter.acquire(), 1.0)
+        return limiter.metrics()
+
+    assert asyncio.run(scenario())["shed"] == 1
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, queue_timeout=60, max_queue=10)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        return limiter.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert (metrics["in_flight"], metrics["waiting"]) == (0, 0)
+
+
+def test_overloaded_requests_get_503_with_retry_after(client, headers, monkeypatch):
+    token = headers("admin")
+    full = ConcurrencyLimiter("reads", limit=0, queue_timeout=0.01, max_queue=10)  # every read queues and times out
+    monkeypatch.setitem(concurrency.limiters, "reads", full)
+
+    response = client.get("/potentials/", headers=token)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert full.shed == 1
+    # the other classes keep their own slots
+    assert client.get("/reports/leaderboard", headers=token).status_code == 200
@@ -0,0 +1,62 @@
+import pytest
+
+from app import utils
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("(555) 123-4567", "+15551234567"),
+    ("1-555-123-4567", "+15551234567"),
+    ("+44 20 7946 0958", "+442079460958"),
+    ("0044 20 7946 0958", "+442079460958"),
+    ("12", None),
+    ("", None),
+])
+def test_phone_numbers_are_normalized_to_e164(raw, expected):
+    assert utils.normalize_phone(raw) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("@Ada.Lovelace", "ada.lovelace"),
+    ("https://www.instagram.com/Ada.Lovelace/", "ada.lovelace"),
+    ("instagram.com/ada.lovelace", "ada.lovelace"),
+    ("@", None),
+])
+def test_handles_are_normalized(raw, expected):
+    assert utils.normalize_handle(raw) == expected
+
+
+def lookup(client, headers, username="admin", **params):
+    response = client.get("/contacts/lookup", params=params, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return [record["id"] for record in response.json()["potentials"]]
+
+
+def test_lookups_match_however_the_contact_was_written(client, headers, create_potential):
+    contact = {"email": "Babbage@Example.com", "phone": "(555) 010-2030", "instagram": "@Analytical.Engine"}
+    potential = create_potential(last_name="babbage", contact_info=contact)["id"]
+
+    assert lookup(client, headers, phone="+1 555 010 2030") == [potential]
+    assert lookup(client, headers, email=" babbage@example.COM ") == [potential]
+    assert lookup(client, headers, network="instagram", handle="instagram.com/analytical.engine") == [potential]
+
+
+def test_lookups_stay_within_scope(client, headers, create_potential):
+    potential = create_potential("leader", last_name="private", contact_info={"phone": "555-010-4040"})["id"]
+
+    assert lookup(client, headers, "leader", phone="5550104040") == [potential]
+    assert lookup(client, headers, "leader2", phone="5550104040") == []
+
+
+def test_handles_follow_updates(client, headers, create_potential):
+    potential = create_potential(last_name="renamed", contact_info={"instagram": "old.name"})["id"]
+    body = {"first_name": "Ada", "last_name": "renamed", "contact_info": {"instagram": "new.name"}, "location": "west"}
+    assert client.put(f"/potentials/{potential}", json=body, headers=headers("admin")).status_code == 200
+
+    assert lookup(client, headers, network="instagram", handle="old.name") == []
+    assert lookup(client, headers, network="instagram", handle="New.Name") == [potential]
+
+
+@pytest.mark.parametrize("params", [{}, {"network": "myspace", "handle": "ada"}, {"handle": "ada"}])
+def test_lookups_need_a_known_contact_kind(client, headers, params):
+    response = client.get("/contacts/lookup", params=params, headers=headers("admin"))
+    assert response.status_code == 400
@@ -0,0 +1,49 @@
+from app import models
+
+
+def live(db, location_id, owner_id):
+    counter = models.RecordCount
+    value = db.query(counter.live).filter(
+        counter.table_name == "potentials", counter.location_id == location_id, counter.owner_id == owner_id
+    ).scalar()
+    db.rollback()  # end the read so the next one sees later commits
+    return value or 0
+
+
+def test_moving_a_record_moves_its_count(client, headers, db, create_potential, location_id, user_id):
+    potential = create_potential(location="west", last_name="mover")
+    admin = user_id("admin")
+    west, north = location_id("west"), location_id("north")
+    before = live(db, west, admin), live(db, north, admin)
+
+    body = {"first_name": "Ada", "last_name": "mover", "contact_info": {"email": "ada@example.com"}, "location": "north"}
+    response = client.put(f"/potentials/{potential['id']}", json=body, headers=headers("admin"))
+
+    assert response.status_code == 200, response.text
+    assert (live(db, west, admin), live(db, north, admin)) == (before[0] - 1, before[1] + 1)
+
+
+def test_updates_that_keep_the_cell_leave_counts_alone(client, headers, db, create_potential, location_id, user_id):
+    potential = create_potential(location="west", last_name="stayer")
+    west, admin = location_id("west"), user_id("admin")
+    before = live(db, west, admin)
+
+    body = {"first_name": "Renamed", "last_name": "stayer", "contact_info": {"email": "ada@example.com"}, "location": "west"}
+    assert client.put(f"/potentials/{potential['id']}", json=body, headers=headers("admin")).status_code == 200
+
+    assert live(db, west, admin) == before
+
+
+def test_list_totals_follow_moves(client, headers, create_potential):
+    def total(username):
+        response = client.get("/potentials/", headers=headers(username))
+        return int(response.headers["x-total-count"])
+
+    potential = create_potential("leader", location="west", last_name="handover")
+    before = total("leader"), total("admin")
+
+    body = {"first_name": "Ada", "last_name": "handover", "contact_info": {"email": "ada@example.com"}, "location": "north"}
+    assert client.put(f"/potentials/{potential['id']}", json=body, headers=headers("admin")).status_code == 200
+
+    # still the leader's own record, and still one record overall
+    assert (total("leader"), total("admin")) == before
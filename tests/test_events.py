@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+from app import crud, events, scoping
+
+
+def drained(subscriber):
+    return [subscriber.queue.get_nowait() for _ in range(subscriber.queue.qsize())]
+
+
+def test_events_published_from_other_threads_reach_subscribers():
+    async def scenario():
+        bus = events.EventBus(max_buffer=10)
+        everything = bus.subscribe(lambda event: True)
+        updates = bus.subscribe(lambda event: event["action"] == "update")
+        publisher = threading.Thread(target=lambda: [bus.publish({"action": action}) for action in ("create", "update")])
+        publisher.start()
+        publisher.join()
+        await asyncio.sleep(0)  # let the loop run the handed-over deliveries
+        return drained(everything), drained(updates)
+
+    everything, updates = asyncio.run(scenario())
+    assert [event["action"] for event in everything] == ["create", "update"]
+    assert [event["action"] for event in updates] == ["update"]
+
+
+def test_slow_subscribers_overflow_instead_of_growing():
+    async def scenario():
+        bus = events.EventBus(max_buffer=2)
+        subscriber = bus.subscribe(lambda event: True)
+        for n in range(3):
+            bus.publish({"n": n})
+        await asyncio.sleep(0)
+        overflowed = subscriber.overflowed
+        subscriber.drain()
+        return overflowed, subscriber.overflowed, subscriber.queue.qsize()
+
+    assert asyncio.run(scenario()) == (True, False, 0)
+
+
+def test_unsubscribed_clients_get_nothing():
+    async def scenario():
+        bus = events.EventBus()
+        subscriber = bus.subscribe(lambda event: True)
+        bus.unsubscribe(subscriber)
+        bus.publish({"action": "create"})
+        await asyncio.sleep(0)
+        return subscriber.queue.qsize(), bus.subscriber_count
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_committed_writes_are_published_within_scope(client, headers, db):
+    leader2 = crud.get_user_by_username(db, "leader2")
+
+    async def scenario():
+        everything = events.bus.subscribe(lambda event: True)
+        rival = events.bus.subscribe(scoping.visibility_filter(db, leader2))
+        try:
+            body = {"first_name": "Ada", "last_name": "published", "contact_info": {"email": "ada@example.com"},
+                    "location": "west"}
+            response = await asyncio.to_thread(client.post, "/potentials/", json=body, headers=headers("leader"))
+            event = await asyncio.wait_for(everything.queue.get(), 1.0)
+            return response.json()["id"], event, rival.queue.qsize()
+        finally:
+            events.bus.unsubscribe(everything)
+            events.bus.unsubscribe(rival)
+
+    potential_id, event, rival_events = asyncio.run(scenario())
+    assert (event["table"], event["action"], event["id"]) == ("potentials", "create", potential_id)
+    assert rival_events == 0
+
+
+def test_the_stream_needs_a_token(client):
+    assert client.get("/events").status_code == 401
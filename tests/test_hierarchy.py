@@ -0,0 +1,45 @@
+import pytest
+
+from app import crud, models
+
+
+def ancestors(db, location_id):
+    closure = models.LocationClosure
+    rows = db.query(closure.ancestor_id, closure.depth).filter(closure.descendant_id == location_id)
+    return dict(rows)
+
+
+@pytest.fixture
+def chain(db, request):
+    """Locations top > middle > bottom, named after the test."""
+    name = request.node.name
+    top = crud.create_location(db, f"{name} top")
+    middle = crud.create_location(db, f"{name} middle", top.id)
+    bottom = crud.create_location(db, f"{name} bottom", middle.id)
+    return top.id, middle.id, bottom.id
+
+
+def test_moving_a_node_under_its_descendant_is_rejected(db, chain):
+    top, middle, bottom = chain
+
+    with pytest.raises(ValueError):
+        crud.set_location_parent(db, top, bottom)
+    with pytest.raises(ValueError):
+        crud.set_location_parent(db, middle, middle)
+    db.rollback()
+
+    assert ancestors(db, bottom) == {bottom: 0, middle: 1, top: 2}
+
+
+def test_moving_a_subtree_relinks_its_descendants(db, chain, request):
+    top, middle, bottom = chain
+    other = crud.create_location(db, f"{request.node.name} other").id
+
+    crud.set_location_parent(db, middle, other)
+
+    assert ancestors(db, middle) == {middle: 0, other: 1}
+    assert ancestors(db, bottom) == {bottom: 0, middle: 1, other: 2}
+
+    crud.set_location_parent(db, middle, None)
+
+    assert ancestors(db, bottom) == {bottom: 0, middle: 1}
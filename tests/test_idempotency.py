@@ -0,0 +1,63 @@
+import pytest
+
+from app import models
+from app.config import settings
+from app.database import shards
+
+BODY = {"first_name": "Grace", "last_name": "Hopper", "contact_info": {"email": "grace@example.com"}, "location": "west"}
+
+
+def post(client, headers, key, body=BODY):
+    return client.post("/potentials/", json=body, headers={**headers("admin"), "Idempotency-Key": key})
+
+
+def created(db, last_name):
+    return shards.count(db.query(models.Potential).filter(models.Potential.last_name == last_name))
+
+
+def test_retry_replays_the_stored_response(client, headers, db):
+    body = {**BODY, "last_name": "replay"}
+    first = post(client, headers, "replay-key", body)
+    retry = post(client, headers, "replay-key", body)
+
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert created(db, "replay") == 1
+
+
+def test_reusing_a_key_for_another_request_is_rejected(client, headers, db):
+    assert post(client, headers, "mismatch-key", {**BODY, "last_name": "mismatch"}).status_code == 201
+
+    response = post(client, headers, "mismatch-key", {**BODY, "last_name": "mismatch", "first_name": "Other"})
+
+    assert response.status_code == 422
+    assert created(db, "mismatch") == 1
+
+
+def test_keys_are_per_user(client, headers, db):
+    body = {**BODY, "last_name": "per-user"}
+    post(client, headers, "shared-key", body)
+    response = client.post("/potentials/", json=body, headers={**headers("leader"), "Idempotency-Key": "shared-key"})
+
+    assert response.status_code == 201
+    assert "idempotent-replayed" not in response.headers
+    assert created(db, "per-user") == 2
+
+
+def test_responses_too_large_to_store_are_not_rerun(client, headers, db, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_MAX_BODY_BYTES", 10)
+    body = {**BODY, "last_name": "oversized"}
+
+    assert post(client, headers, "oversized-key", body).status_code == 201
+    retry = post(client, headers, "oversized-key", body)
+
+    assert retry.status_code == 409
+    assert created(db, "oversized") == 1
+
+
+@pytest.mark.parametrize("key", ["", "k" * 256])
+def test_invalid_keys_are_rejected(client, headers, key):
+    assert post(client, headers, key).status_code == 400
@@ -0,0 +1,107 @@
+import csv
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, jobs, models, schemas
+from app.database import SessionLocal
+from app.routers import jobs as jobs_router
+from conftest import PASSWORD
+
+
+@pytest.fixture(scope="module")
+def jobber(database):
+    """A user of its own, so the per-user job limit only counts this module's jobs."""
+    with SessionLocal() as db:
+        return crud.create_user(db, schemas.UserCreate(username="jobber", password=PASSWORD, role="leader",
+                                                       location="west")).id
+
+
+def make_runner(tmp_path, **overrides):
+    options = {"workers": 1, "type_limits": {"export": 1, "report": 1}, "max_active_per_user": 3,
+               "ttl": timedelta(hours=1), "purge_seconds": 600, "lease_seconds": 60, **overrides}
+    return jobs.JobRunner(SessionLocal, jobs.ArtifactStore(str(tmp_path)), **options)
+
+
+def submit(client, headers, username, job_type, **params):
+    return client.post("/jobs/", json={"job_type": job_type, "params": params}, headers=headers(username))
+
+
+def add_job(db, user_id, **values):
+    job = models.Job(id=os.urandom(8).hex(), job_type="report", params={"group_by": "location", "format": "json"},
+                     user_id=user_id, progress=0.0, created_at=datetime.utcnow(), **values)
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+@pytest.mark.parametrize("job_type, params, status_code", [
+    ("cleanup", {}, 400),
+    ("report", {"group_by": "week"}, 400),
+    ("export", {"table": "users"}, 400),
+    ("export", {"table": "potentials", "format": "xlsx"}, 400),
+    ("export", {"table": "audit_logs"}, 403),
+])
+def test_bad_jobs_are_rejected(client, headers, job_type, params, status_code):
+    assert submit(client, headers, "leader", job_type, **params).status_code == status_code
+
+
+def test_queued_jobs_per_user_are_limited(client, headers, jobber):
+    # the runner is not started here, so jobs stay queued
+    statuses = [submit(client, headers, "jobber", "report").status_code for _ in range(4)]
+
+    assert statuses == [202, 202, 202, 429]
+    listed = client.get("/jobs/", headers=headers("jobber")).json()
+    assert [job["status"] for job in listed] == ["queued"] * 3
+    job_id = listed[0]["id"]
+    assert client.get(f"/jobs/{job_id}/artifact", headers=headers("jobber")).status_code == 409
+    assert client.get(f"/jobs/{job_id}", headers=headers("leader2")).status_code == 404  # not theirs
+
+
+def test_jobs_run_to_a_downloadable_artifact(client, headers, create_potential, user_id, monkeypatch, tmp_path):
+    create_potential("leader", location="west", last_name="exported")
+    runner = make_runner(tmp_path)
+    monkeypatch.setattr(jobs_router, "runner", runner)
+    runner.start()
+    try:
+        job_id = submit(client, headers, "leader", "export", table="potentials", format="csv").json()["id"]
+        deadline = time.monotonic() + 60
+        while (job := client.get(f"/jobs/{job_id}", headers=headers("leader")).json())["status"] in jobs.ACTIVE:
+            assert time.monotonic() < deadline, job
+            time.sleep(0.1)
+    finally:
+        runner.stop()
+
+    assert (job["status"], job["progress"]) == ("succeeded", 1.0), job
+    response = client.get(f"/jobs/{job_id}/artifact", headers=headers("leader"))
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert len(rows) == job["row_count"] > 0
+    assert "exported" in {row["last_name"] for row in rows}
+    assert {row["creator_id"] for row in rows} == {str(user_id("leader"))}  # only the leader's own records
+
+
+def test_jobs_with_lapsed_leases_are_requeued(db, user_id, tmp_path):
+    admin = user_id("admin")
+    lapsed = add_job(db, admin, status="running", runner_id="gone", lease_expires_at=datetime.utcnow() - timedelta(1))
+    held = add_job(db, admin, status="running", runner_id="alive", lease_expires_at=datetime.utcnow() + timedelta(1))
+
+    make_runner(tmp_path).recover()
+
+    db.expire_all()
+    assert db.get(models.Job, lapsed).status == "queued"
+    assert db.get(models.Job, held).status == "running"
+
+
+def test_expired_artifacts_are_purged(client, headers, db, user_id, tmp_path):
+    artifact = tmp_path / "old.json"
+    artifact.write_text("{}")
+    job_id = add_job(db, user_id("admin"), status="succeeded", artifact_path=str(artifact),
+                     expires_at=datetime.utcnow() - timedelta(minutes=1))
+
+    make_runner(tmp_path).purge_expired()
+
+    assert not artifact.exists()
+    assert client.get(f"/jobs/{job_id}/artifact", headers=headers("admin")).status_code == 410
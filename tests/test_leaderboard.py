@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+from app import crud, leaderboard, schemas
+from app.database import SessionLocal
+from conftest import PASSWORD
+
+ADMIN = schemas.User(id=0, username="admin", role="admin", is_active=True)
+
+
+@pytest.fixture(scope="module")
+def climber(database):
+    """A leader of its own, whose counts no other module touches."""
+    with SessionLocal() as db:
+        user = crud.create_user(db, schemas.UserCreate(username="climber", password=PASSWORD, role="leader",
+                                                       location="west"))
+        return user.id
+
+
+def entries(client, headers, username="admin", **params):
+    response = client.get("/reports/leaderboard", params={"limit": 100, **params}, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return {entry["leader_id"]: entry for entry in response.json()["leaders"]}
+
+
+def test_adds_conversions_and_deletes_are_counted(client, headers, create_potential, climber):
+    first, _, third = (create_potential("climber", last_name=f"climb-{n}") for n in range(3))
+    assert client.put(f"/potentials/{first['id']}/convert", headers=headers("climber")).status_code == 200
+    assert client.delete(f"/potentials/{third['id']}", headers=headers("admin")).status_code == 204
+
+    for period in leaderboard.PERIODS:
+        entry = entries(client, headers, period=period)[climber]
+        assert (entry["name"], entry["added"], entry["converted"]) == ("climber", 2, 1)
+
+
+def test_ranks_follow_the_metric(client, headers, climber):
+    for metric in leaderboard.METRICS:
+        ranked = list(entries(client, headers, metric=metric).values())
+        assert [entry["rank"] for entry in ranked] == list(range(1, len(ranked) + 1))
+        assert [entry[metric] for entry in ranked] == sorted((entry[metric] for entry in ranked), reverse=True)
+
+
+def test_leaders_only_see_their_team(client, headers, create_potential, user_id, climber):
+    create_potential("leader2", location="north", last_name="rival")
+
+    assert set(entries(client, headers, "leader2")) == {user_id("leader2")}
+    assert climber not in entries(client, headers, "leader")
+
+
+def test_flushed_counts_reach_other_processes(db, create_potential, climber):
+    create_potential("climber", last_name="climb-flushed")
+    leaderboard.board.flush()
+    other = leaderboard.Leaderboard(SessionLocal, flush_interval=60)
+
+    _, here = leaderboard.board.top(db, ADMIN, limit=1000)
+    _, there = other.top(db, ADMIN, limit=1000)
+    assert [row for row in there if row[0] == climber] == [row for row in here if row[0] == climber] != []
+
+
+def test_ties_break_on_the_other_metric_then_id(db):
+    board = leaderboard.Leaderboard(SessionLocal, flush_interval=60)
+    board.flush()  # load, so the counts below stay pending in this instance only
+    now = datetime.utcnow()
+    first, second, third = 10**6 + 1, 10**6 + 2, 10**6 + 3
+    for creator_id, added, converted in [(first, 2, 0), (second, 2, 1), (third, 3, 0)]:
+        for n in range(added):
+            board.record(None, creator_id, now, now if n < converted else None)
+
+    _, ranked = board.top(db, ADMIN, metric="added", limit=1000)
+    assert [row for row in ranked if row[0] > 10**6] == [(third, 3, 0), (second, 2, 1), (first, 2, 0)]
+    _, ranked = board.top(db, ADMIN, metric="converted", limit=1000)
+    assert [row for row in ranked if row[0] > 10**6] == [(second, 2, 1), (third, 3, 0), (first, 2, 0)]
+
+
+@pytest.mark.parametrize("params", [{"period": "day"}, {"metric": "visits"}, {"limit": 0}, {"limit": 101}])
+def test_bad_parameters_are_rejected(client, headers, params):
+    response = client.get("/reports/leaderboard", params=params, headers=headers("admin"))
+    assert response.status_code == 400
@@ -0,0 +1,43 @@
+from app import models
+from app.locations import LocationCache
+
+
+def location_rows(db, name):
+    count = db.query(models.Location).filter(models.Location.name == name).count()
+    db.rollback()  # end the read so the next one sees later commits
+    return count
+
+
+def test_names_are_interned_once(db):
+    cache, other_process = LocationCache(), LocationCache()
+
+    location_id = cache.intern(db, "interned")
+
+    assert other_process.intern(db, "interned") == location_id
+    assert location_rows(db, "interned") == 1
+    assert (cache.id_for(None, "interned"), cache.name_for(None, location_id)) == (location_id, "interned")
+
+
+def test_a_cold_cache_reads_through(db):
+    location_id = LocationCache().intern(db, "read-through")
+    cold = LocationCache()
+
+    assert cold.id_for(None, "read-through") is None  # without a session only the cache is consulted
+    assert cold.name_for(db, location_id) == "read-through"
+    assert cold.id_for(None, "read-through") == location_id
+
+
+def test_looking_up_an_unknown_name_creates_nothing(client, headers, db):
+    assert LocationCache().id_for(db, "nowhere") is None
+    response = client.get("/workers/location/nowhere", headers=headers("admin"))
+
+    assert (response.status_code, response.json()) == (200, [])
+    assert location_rows(db, "nowhere") == 0
+
+
+def test_records_keep_an_id_and_show_the_name(db, create_potential, location_id):
+    potential = create_potential(location="north")
+
+    assert potential["location"] == "north"
+    stored = db.query(models.Potential.location_id).filter(models.Potential.id == potential["id"]).scalar()
+    assert stored == location_id("north")
@@ -0,0 +1,79 @@
+import pytest
+
+from app import auth
+from app.ratelimit import SlidingWindowLimiter
+from conftest import PASSWORD
+
+
+def test_sliding_window_allows_limit_hits_per_window():
+    limiter = SlidingWindowLimiter(limit=2, window=10)
+    limiter.hit("ada", now=0)
+    assert limiter.retry_after("ada", now=1) == 0
+    limiter.hit("ada", now=1)
+
+    assert limiter.retry_after("ada", now=2) == 8  # until the first hit leaves the window
+    assert limiter.retry_after("ada", now=10) == 0
+    assert limiter.retry_after("grace", now=2) == 0
+
+
+def test_reset_forgets_a_key():
+    limiter = SlidingWindowLimiter(limit=1, window=10)
+    limiter.hit("ada", now=0)
+    limiter.reset("ada")
+
+    assert limiter.retry_after("ada", now=1) == 0
+
+
+def test_idle_keys_are_swept_when_full():
+    limiter = SlidingWindowLimiter(limit=1, window=10, max_keys=2)
+    limiter.hit("ada", now=0)
+    limiter.hit("grace", now=5)
+    limiter.hit("alan", now=12)  # ada's hit has left the window, grace's has not
+
+    assert set(limiter._hits) == {"grace", "alan"}
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Fresh, small limits, so failures from other tests do not count and these do not leak."""
+    by_user, by_ip = SlidingWindowLimiter(3, 60), SlidingWindowLimiter(5, 60)
+    monkeypatch.setattr(auth, "login_failures_by_user", by_user)
+    monkeypatch.setattr(auth, "login_failures_by_ip", by_ip)
+    return by_user, by_ip
+
+
+def login(client, username, password):
+    return client.post("/token", data={"username": username, "password": password})
+
+
+def test_repeated_failures_lock_the_user_out(client, limits, monkeypatch):
+    for _ in range(3):
+        assert login(client, "leader", "wrong").status_code == 401
+
+    verified = []
+    monkeypatch.setattr(auth, "verify_and_update_password", lambda *args: verified.append(args))
+    response = login(client, "leader", PASSWORD)
+
+    assert response.status_code == 429
+    assert 0 < int(response.headers["retry-after"]) <= 61
+    assert verified == []  # rejected before any hashing
+
+
+def test_a_successful_login_clears_the_users_failures(client, limits):
+    for _ in range(2):
+        assert login(client, "leader", "wrong").status_code == 401
+    assert login(client, "leader", PASSWORD).status_code == 200
+
+    for _ in range(2):
+        assert login(client, "leader", "wrong").status_code == 401
+    assert login(client, "leader", PASSWORD).status_code == 200
+
+
+def test_failures_across_users_lock_the_address_out(client, limits):
+    for n in range(5):
+        assert login(client, f"nobody-{n}", "wrong").status_code == 401
+
+    response = login(client, "leader2", PASSWORD)
+
+    assert response.status_code == 429
+    assert "retry-after" in response.headers
@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from app import main
+from app.database import engine
+from app.migrations import is_current, upgrade
+
+
+@pytest.fixture
+def fresh_engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path}/fresh.db")
+
+
+def test_the_upgraded_database_is_current():
+    assert is_current(engine)
+
+
+def test_an_empty_database_is_not_current_until_upgraded(fresh_engine):
+    assert not is_current(fresh_engine)
+
+    upgrade(fresh_engine)
+
+    assert is_current(fresh_engine)
+
+
+def test_a_changed_schema_needs_an_upgrade(fresh_engine):
+    upgrade(fresh_engine)
+    with fresh_engine.begin() as conn:  # as if upgraded by an older version of the code
+        conn.execute(text("ALTER TABLE outbox_checkpoints DROP COLUMN gaps"))
+        conn.execute(text("UPDATE schema_version SET fingerprint = 'older'"))
+    assert not is_current(fresh_engine)
+
+    upgrade(fresh_engine)
+
+    assert is_current(fresh_engine)
+    assert "gaps" in {column["name"] for column in inspect(fresh_engine).get_columns("outbox_checkpoints")}
+
+
+def test_upgrading_twice_changes_nothing(fresh_engine):
+    upgrade(fresh_engine)
+    upgrade(fresh_engine)
+
+    assert is_current(fresh_engine)
+
+
+def test_workers_refuse_to_start_on_an_old_schema(monkeypatch):
+    monkeypatch.setattr(main, "is_current", lambda engine: False)
+
+    with pytest.raises(RuntimeError, match="migrate.py"):
+        with TestClient(main.app):
+            pass
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, outbox
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+        self.failing = False
+
+    def deliver(self, events):
+        if self.failing:
+            raise RuntimeError("sink down")
+        self.batches.append([event["id"] for event in events])
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """An outbox of its own, so the ids (and the gaps between them) are the test's to choose."""
+    engine = create_engine(f"sqlite:///{tmp_path}/outbox.db")
+    models.Base.metadata.create_all(engine, tables=[models.OutboxEvent.__table__, models.OutboxCheckpoint.__table__])
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def add_events(session_factory):
+    def add(*ids):
+        with session_factory() as db:
+            db.add_all(models.OutboxEvent(id=event_id, table_name="potentials", action="create", record_id=event_id,
+                                          payload={}, created_at=datetime.utcnow()) for event_id in ids)
+            db.commit()
+
+    return add
+
+
+def gaps(session_factory):
+    with session_factory() as db:
+        return set(outbox.get_checkpoint(db, "default").gaps or {})
+
+
+def test_events_are_delivered_in_batches_and_checkpointed(session_factory, add_events):
+    sink = ListSink()
+    relay = outbox.OutboxRelay(session_factory, sink, batch_size=2)
+    add_events(1, 2, 3)
+
+    assert [relay.run_once() for _ in range(3)] == [2, 1, 0]
+
+    assert sink.batches == [[1, 2], [3]]
+    with session_factory() as db:
+        assert outbox.backlog(db, "default")["last_event_id"] == 3
+
+
+def test_failed_deliveries_are_retried(session_factory, add_events):
+    sink = ListSink()
+    relay = outbox.OutboxRelay(session_factory, sink)
+    add_events(1, 2)
+
+    sink.failing = True
+    with pytest.raises(RuntimeError):
+        relay.run_once()
+    sink.failing = False
+    relay.run_once()
+
+    assert sink.batches == [[1, 2]]
+    assert relay.failures == 1
+
+
+def test_late_commits_fill_their_gap(session_factory, add_events):
+    sink = ListSink()
+    relay = outbox.OutboxRelay(session_factory, sink)
+    add_events(1, 2, 5)
+
+    relay.run_once()
+    assert gaps(session_factory) == {"3", "4"}
+
+    add_events(4)  # committed after 5 was relayed
+    assert relay.run_once() == 1
+
+    assert sink.batches == [[1, 2, 5], [4]]
+    assert gaps(session_factory) == {"3"}
+    with session_factory() as db:
+        assert outbox.backlog(db, "default")["gaps"] == 1
+
+
+def test_gap_fills_are_delivered_with_new_events(session_factory, add_events):
+    sink = ListSink()
+    relay = outbox.OutboxRelay(session_factory, sink)
+    add_events(1, 3)
+    relay.run_once()
+
+    add_events(2, 4)
+    relay.run_once()
+
+    assert sink.batches == [[1, 3], [2, 4]]
+    assert gaps(session_factory) == set()
+
+
+def test_gaps_are_given_up_after_gap_seconds(session_factory, add_events):
+    sink = ListSink()
+    relay = outbox.OutboxRelay(session_factory, sink, gap_seconds=60)
+    add_events(1, 3)
+    relay.run_once()
+    with session_factory() as db:  # skipped two minutes ago
+        checkpoint = outbox.get_checkpoint(db, "default")
+        checkpoint.gaps = {"2": (datetime.utcnow() - timedelta(seconds=120)).isoformat()}
+        db.commit()
+
+    assert relay.run_once() == 0
+    assert gaps(session_factory) == set()
+    assert relay.gaps_abandoned == 1
+
+    add_events(2)  # too late: below the checkpoint and no longer awaited
+    assert relay.run_once() == 0
+    assert sink.batches == [[1, 3]]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from app import auth, crud, models
+from conftest import PASSWORD
+
+
+def refresh(client, token):
+    return client.post("/token/refresh", json={"refresh_token": token})
+
+
+def login(client, username="leader"):
+    response = client.post("/token", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 200
+    return response.json()["refresh_token"]
+
+
+def test_refresh_rotates_the_token(client):
+    first = login(client)
+    response = refresh(client, first)
+
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    assert refresh(client, second).status_code == 200
+
+
+def test_reusing_a_rotated_token_revokes_its_family(client):
+    first = login(client)
+    second = refresh(client, first).json()["refresh_token"]
+
+    assert refresh(client, first).status_code == 401
+    # the token issued in its place is now unusable too
+    assert refresh(client, second).status_code == 401
+
+
+def test_reuse_leaves_other_sessions_alone(client):
+    other = login(client)
+    first = login(client)
+    refresh(client, first)
+    refresh(client, first)
+
+    assert refresh(client, other).status_code == 200
+
+
+def test_expired_and_unknown_tokens_are_rejected(client, db, user_id):
+    token = crud.create_refresh_token(db, user_id("leader"))
+    db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == auth.hash_refresh_token(token)).update(
+        {models.RefreshToken.expires_at: datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+    assert refresh(client, token).status_code == 401
+    assert refresh(client, "not-a-token").status_code == 401
@@ -0,0 +1,171 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import models
+from app.database import READ_HEARTBEAT, Replica, ReplicaRouter, SessionLocal, replicas
+
+LISTS = ["/potentials/", "/disciples/", "/workers/"]
+
+
+@pytest.fixture
+def routed(client, headers, monkeypatch):
+    """
+    Stand-ins for the router's session choice, recording what each request
+    asked for. The suite runs with sharding on, where replicas are not used,
+    so the sessions are primary ones labelled with the chosen source.
+    """
+    calls = {"last_write": [], "ran_on": []}
+
+    def session_for(last_write=None):
+        calls["last_write"].append(last_write)
+        db = SessionLocal()
+        db.info["source"] = "primary" if replicas.is_sticky(last_write) else "replica-0"
+        return db
+
+    def session_on(source):
+        calls["ran_on"].append(source)
+        db = SessionLocal()
+        db.info["source"] = source
+        return db
+
+    monkeypatch.setattr(replicas, "replicas", ["replica-0"])  # only needs to be non-empty
+    monkeypatch.setattr(replicas, "session_for", session_for)
+    monkeypatch.setattr(replicas, "session_on", session_on)
+    headers("admin")  # logging in is a write too
+    client.cookies.clear()  # no read-your-writes cookie from earlier requests
+    return calls
+
+
+@pytest.mark.parametrize("path", LISTS)
+def test_lists_run_on_the_routed_source(client, headers, routed, path):
+    assert client.get(path, headers=headers("admin")).status_code == 200
+
+    assert routed["last_write"] == [None]
+    assert routed["ran_on"] == ["replica-0"]
+
+
+@pytest.mark.parametrize("path", LISTS)
+def test_lists_stay_on_the_primary_after_the_clients_write(client, headers, routed, create_potential, path):
+    create_potential()  # answered with the write time, kept in the client's cookie
+
+    assert client.get(path, headers=headers("admin")).status_code == 200
+
+    assert routed["last_write"][-1] is not None
+    assert routed["ran_on"] == ["primary"]
+
+
+CREATE_HEARTBEAT = text("CREATE TABLE replica_heartbeat (id INTEGER PRIMARY KEY, beat DATETIME)")
+
+
+def set_beat(engine, beat):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM replica_heartbeat"))
+        if beat is not None:
+            conn.execute(text("INSERT INTO replica_heartbeat (id, beat) VALUES (1, :beat)"), {"beat": beat})
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """
+    A router over a primary and two replicas, each a database of its own
+    holding just the heartbeat table. Lag is measured on the first read
+    only (the check interval is long); set the beats before it.
+    """
+    urls = {name: f"sqlite:///{tmp_path}/{name}.db" for name in ("primary", "replica-0", "replica-1")}
+    for url in urls.values():
+        with create_engine(url).begin() as conn:
+            conn.execute(CREATE_HEARTBEAT)
+    primary = create_engine(urls["primary"])
+    members = [Replica(name, urls[name]) for name in ("replica-0", "replica-1")]
+    return ReplicaRouter(primary, members, max_lag=5, check_interval=3600)
+
+
+def read_sources(router, reads=4, last_write=None):
+    sources = []
+    for _ in range(reads):
+        with router.session_for(last_write) as db:
+            sources.append(db.info["source"])
+    return sources
+
+
+def test_replicas_are_unused_until_the_first_beat(cluster):
+    assert read_sources(cluster) == ["primary"] * 4
+    assert [replica.lag for replica in cluster.replicas] == [None, None]
+
+    cluster.check()  # the first check wrote the primary's beat, which the replicas lack
+    assert [replica.lag for replica in cluster.replicas] == [float("inf")] * 2
+
+
+def test_lag_is_the_distance_between_beats(cluster):
+    beat = datetime.utcnow()
+    set_beat(cluster.primary, beat)
+    set_beat(cluster.replicas[0].engine, beat)
+    set_beat(cluster.replicas[1].engine, beat - timedelta(seconds=3))
+
+    cluster.check()
+
+    assert [replica.lag for replica in cluster.replicas] == [0.0, 3.0]
+    with cluster.primary.connect() as conn:
+        assert conn.execute(READ_HEARTBEAT).scalar() > beat  # advanced for the next check
+
+
+def test_reads_go_round_robin_over_close_replicas(cluster):
+    beat = datetime.utcnow()
+    for engine in (cluster.primary, cluster.replicas[0].engine, cluster.replicas[1].engine):
+        set_beat(engine, beat)
+
+    sources = read_sources(cluster)
+
+    assert sorted(sources) == ["replica-0", "replica-0", "replica-1", "replica-1"]
+    assert sources[0] != sources[1]
+    assert cluster.metrics()["primary_reads"] == 0
+
+
+def test_replicas_behind_the_limit_are_skipped(cluster):
+    beat = datetime.utcnow()
+    set_beat(cluster.primary, beat)
+    set_beat(cluster.replicas[0].engine, beat - timedelta(seconds=60))
+    set_beat(cluster.replicas[1].engine, beat)
+
+    assert read_sources(cluster) == ["replica-1"] * 4
+
+    cluster.replicas[1].lag = 60.0  # both behind now
+    assert read_sources(cluster, reads=1) == ["primary"]
+
+
+def test_unreachable_replicas_are_skipped(cluster, tmp_path):
+    cluster.replicas[0] = Replica("replica-0", f"sqlite:///{tmp_path}/missing/replica.db")
+    beat = datetime.utcnow()
+    set_beat(cluster.primary, beat)
+    set_beat(cluster.replicas[1].engine, beat)
+
+    assert read_sources(cluster) == ["replica-1"] * 4
+    assert cluster.replicas[0].lag is None and cluster.replicas[0].error
+
+
+def test_recent_writers_read_from_the_primary(cluster):
+    beat = datetime.utcnow()
+    for engine in (cluster.primary, cluster.replicas[0].engine, cluster.replicas[1].engine):
+        set_beat(engine, beat)
+
+    assert read_sources(cluster, reads=2, last_write=time.time()) == ["primary"] * 2
+    assert cluster.metrics()["sticky_reads"] == 2
+    assert "primary" not in read_sources(cluster, reads=2, last_write=time.time() - cluster.sticky_seconds - 1)
+
+
+def test_session_on_names_its_source(cluster):
+    for source in ("replica-1", "primary"):
+        with cluster.session_on(source) as db:
+            assert db.info["source"] == source
+    with cluster.session_on("replica-9") as db:  # gone since the read started
+        assert db.info["source"] == "primary"
+
+
+def test_replica_sessions_refuse_writes(cluster):
+    with cluster.replicas[0].session_factory() as db:
+        db.add(models.Location(name="nowhere"))
+        with pytest.raises(RuntimeError):
+            db.flush()
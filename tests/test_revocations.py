@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from app import auth, crud, schemas
+from app.database import SessionLocal
+from app.tokens import RevocationList
+from conftest import PASSWORD
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def other_process():
+    """The revocation list of another worker process, reloading quickly."""
+    revocations = RevocationList(SessionLocal, refresh_interval=0.05)
+    revocations.start()
+    yield revocations
+    revocations.stop()
+
+
+def token_of(headers):
+    return headers["Authorization"].split()[1]
+
+
+def test_logout_reaches_other_processes(client, headers, other_process):
+    login = client.post("/token", data={"username": "leader", "password": PASSWORD})
+    session = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    payload = auth.decode_token(token_of(session))
+    assert not other_process.is_revoked(payload)
+
+    assert client.post("/logout", headers=session).status_code == 204
+
+    assert client.get("/users/me", headers=session).status_code == 401
+    assert wait_for(lambda: other_process.is_revoked(payload))
+    assert client.get("/users/me", headers=headers("leader")).status_code == 200
+
+
+def test_checks_only_read_memory(other_process, monkeypatch):
+    def no_database():
+        raise AssertionError("is_revoked queried the database")
+
+    monkeypatch.setattr(other_process, "session_factory", no_database)
+    time.sleep(0.1)  # reloads fail (and are logged) while the database is unreachable
+
+    assert not other_process.is_revoked({"sub": "leader", "jti": "unknown", "iat": time.time()})
+
+
+def fresh_session(client, username):
+    login = client.post("/token", data={"username": username, "password": PASSWORD})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+@pytest.fixture
+def member(db, request):
+    """A leader of their own, so revoking their tokens affects no other test."""
+    username = request.node.name
+    user = crud.create_user(db, schemas.UserCreate(username=username, password=PASSWORD, role="leader", location="west"))
+    return user
+
+
+def test_claim_changes_revoke_the_users_tokens(client, db, member):
+    session = fresh_session(client, member.username)
+    assert client.get("/users/me", headers=session).json()["role"] == "leader"
+
+    member.role = "pastor"
+    db.commit()
+
+    assert client.get("/users/me", headers=session).status_code == 401
+    assert client.get("/users/me", headers=fresh_session(client, member.username)).json()["role"] == "pastor"
+
+
+def test_other_user_changes_leave_tokens_alone(client, db, member):
+    session = fresh_session(client, member.username)
+
+    member.hashed_password = auth.get_password_hash(PASSWORD)  # not a claim
+    db.commit()
+
+    assert client.get("/users/me", headers=session).status_code == 200
+
+
+def test_moving_a_user_revokes_their_tokens(client, headers, member, user_id):
+    session = fresh_session(client, member.username)
+
+    response = client.put(f"/users/{member.id}/parent", json={"parent_id": user_id("admin")}, headers=headers("admin"))
+    assert response.status_code == 200
+
+    assert client.get("/users/me", headers=session).status_code == 401
+    me = client.get("/users/me", headers=fresh_session(client, member.username)).json()
+    assert me["parent_id"] == user_id("admin")
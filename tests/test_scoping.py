@@ -0,0 +1,87 @@
+import pytest
+
+from app import crud, models, scoping, schemas
+from conftest import PASSWORD
+
+
+@pytest.fixture(scope="module")
+def records(org, client, headers):
+    """One potential created by each member of the org, plus one by an outsider, keyed by creator."""
+    created = {}
+    for username in ["boss", "sub", "helper", "leader"]:
+        location = "west" if username == "leader" else "south-site"
+        body = {"first_name": username, "last_name": "scoped", "contact_info": {}, "location": location}
+        response = client.post("/potentials/", json=body, headers=headers(username))
+        assert response.status_code == 201
+        created[username] = response.json()["id"]
+    body = {"first_name": "regional", "last_name": "scoped", "contact_info": {}, "location": "south"}
+    created["region"] = client.post("/potentials/", json=body, headers=headers("admin")).json()["id"]
+    return created
+
+
+def visible(client, headers, username):
+    response = client.get("/potentials/", params={"limit": 1000}, headers=headers(username))
+    assert response.status_code == 200
+    return {potential["id"] for potential in response.json()}, int(response.headers["x-total-count"])
+
+
+@pytest.mark.parametrize("username, expected", [
+    ("overseer", {"boss", "sub", "helper", "region"}),  # the region and the site under it
+    ("boss", {"boss", "sub", "helper"}),                # their team, at any depth
+    ("sub", {"sub", "helper"}),
+    ("helper", {"helper"}),                             # only their own
+])
+def test_lists_are_limited_to_the_users_scope(client, headers, records, username, expected):
+    ids, total = visible(client, headers, username)
+
+    assert ids & set(records.values()) == {records[name] for name in expected}
+    assert records["leader"] not in ids
+
+
+def test_admins_see_everything(client, headers, records):
+    ids, _ = visible(client, headers, "admin")
+
+    assert set(records.values()) <= ids
+
+
+def test_totals_count_the_same_rows_as_the_list(client, headers, records):
+    for username in ["overseer", "boss", "sub", "helper"]:
+        ids, total = visible(client, headers, username)
+        assert total == len(ids)
+
+
+def test_single_reads_check_scope(client, headers, records):
+    assert client.get(f"/potentials/{records['helper']}", headers=headers("boss")).status_code == 200
+    assert client.get(f"/potentials/{records['boss']}", headers=headers("helper")).status_code == 403
+    assert client.get(f"/potentials/{records['region']}", headers=headers("boss")).status_code == 403
+
+
+def test_event_filter_matches_the_sql_predicate(db, org, records):
+    """The change feed's Python check agrees with scope_predicate row for row."""
+    potentials = db.query(models.Potential).filter(models.Potential.id.in_(records.values())).all()
+    for username in ["overseer", "boss", "sub", "helper"]:
+        user = schemas.User.model_validate(crud.get_user_by_username(db, username))
+        accepts = scoping.visibility_filter(db, user)
+        in_sql = {
+            row.id for row in db.query(models.Potential.id).filter(
+                models.Potential.id.in_(records.values()), scoping.scope_predicate(models.Potential, user)
+            )
+        }
+        in_python = {
+            row.id for row in potentials
+            if accepts({"table": "potentials", "location_id": row.location_id, "owner_id": row.creator_id})
+        }
+        assert in_python == in_sql, username
+
+
+def test_moving_a_user_changes_what_their_leader_sees(db, client, headers, org):
+    mover = crud.create_user(db, schemas.UserCreate(
+        username="mover", password=PASSWORD, role="worker", location="south-site", parent_id=org["sub"]
+    ))
+    body = {"first_name": "mover", "last_name": "scoped", "contact_info": {}, "location": "south-site"}
+    potential = client.post("/potentials/", json=body, headers=headers("mover")).json()["id"]
+    assert potential in visible(client, headers, "boss")[0]
+
+    crud.set_user_parent(db, mover.id, None)
+
+    assert potential not in visible(client, headers, "boss")[0]
@@ -0,0 +1,66 @@
+from sqlalchemy import or_, select
+
+from app import models
+from app.database import PRIMARY_SHARD, routing_criteria, shards
+
+Potential = models.Potential
+
+
+def test_routing_criteria_reads_anded_equalities_and_in_lists():
+    statement = select(Potential).where(Potential.location_id == 3, Potential.id.in_([1, 2]))
+
+    assert routing_criteria(statement.whereclause) == {
+        ("potentials", "location_id"): {3},
+        ("potentials", "id"): {1, 2},
+    }
+
+
+def test_routing_criteria_intersects_repeated_columns():
+    statement = select(Potential).where(Potential.id.in_([1, 2, 3]), Potential.id.in_([2, 3, 4]))
+
+    assert routing_criteria(statement.whereclause) == {("potentials", "id"): {2, 3}}
+
+
+def test_routing_criteria_ignores_terms_that_do_not_narrow():
+    statement = select(Potential).where(
+        or_(Potential.location_id == 1, Potential.location_id == 2),
+        Potential.id > 5,
+    )
+
+    assert routing_criteria(statement.whereclause) == {}
+    assert routing_criteria(None) == {}
+
+
+def test_statements_are_routed_by_location(create_potential, location_id):
+    create_potential(location="east")
+    create_potential(location="west")
+    east, west = location_id("east"), location_id("west")
+
+    assert shards.shards_for_statement(select(Potential).where(Potential.location_id == east)) == ["east"]
+    assert shards.shards_for_statement(select(Potential).where(Potential.location_id == west)) == [PRIMARY_SHARD]
+    assert set(shards.shards_for_statement(select(Potential))) == {"east", PRIMARY_SHARD}
+    # Tables that are not sharded always stay in the primary
+    assert shards.shards_for_statement(select(models.User)) == [PRIMARY_SHARD]
+
+
+def test_statements_are_routed_by_record_id(create_potential):
+    east = create_potential(location="east")
+    west = create_potential(location="west")
+
+    assert shards.shards_for_statement(select(Potential).where(Potential.id == east["id"])) == ["east"]
+    assert shards.shards_for_statement(select(Potential).where(Potential.id == west["id"])) == [PRIMARY_SHARD]
+    both = select(Potential).where(Potential.id.in_([east["id"], west["id"]]))
+    assert shards.shards_for_statement(both) == sorted(["east", PRIMARY_SHARD])
+
+
+def test_cross_shard_lists_are_merged_in_order(client, headers, create_potential):
+    created = [create_potential(location=location)["id"] for location in ["east", "west"] * 4]
+
+    response = client.get("/potentials/", params={"limit": 1000}, headers=headers("admin"))
+    assert response.status_code == 200
+    ids = [potential["id"] for potential in response.json()]
+    assert ids == sorted(ids)
+    assert set(created) <= set(ids)
+
+    page = client.get("/potentials/", params={"skip": 3, "limit": 4}, headers=headers("admin"))
+    assert [potential["id"] for potential in page.json()] == ids[3:7]
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+class Gate:
+    """A blocking fn whose calls are counted and held until open() is called."""
+
+    def __init__(self, result="rows"):
+        self.result = result
+        self.calls = 0
+        self._open = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self._open.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def open(self):
+        self._open.set()
+
+
+async def gather_while_held(flight, gate, keys):
+    """Start a call per key, let them all join in, then let the runs finish."""
+    calls = [asyncio.ensure_future(flight.do(key, gate)) for key in keys]
+    await asyncio.sleep(0.05)
+    gate.open()
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def test_identical_concurrent_calls_share_one_run():
+    flight, gate = SingleFlight("test"), Gate()
+
+    results = asyncio.run(gather_while_held(flight, gate, ["key"] * 3))
+
+    assert results == ["rows"] * 3
+    assert gate.calls == 1
+    assert flight.metrics() == {"enabled": True, "executions": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_different_keys_run_separately():
+    flight, gate = SingleFlight("test"), Gate()
+
+    asyncio.run(gather_while_held(flight, gate, ["one", "two"]))
+
+    assert gate.calls == 2
+
+
+def test_finished_runs_are_not_cached():
+    flight, gate = SingleFlight("test"), Gate()
+    gate.open()
+
+    async def twice():
+        return [await flight.do("key", gate), await flight.do("key", gate)]
+
+    assert asyncio.run(twice()) == ["rows", "rows"]
+    assert gate.calls == 2
+
+
+def test_disabled_flights_run_every_call():
+    flight, gate = SingleFlight("test", enabled=False), Gate()
+
+    asyncio.run(gather_while_held(flight, gate, ["key"] * 3))
+
+    assert gate.calls == 3
+
+
+def test_errors_reach_every_caller():
+    flight, gate = SingleFlight("test"), Gate(result=RuntimeError("query failed"))
+
+    results = asyncio.run(gather_while_held(flight, gate, ["key"] * 2))
+
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert gate.calls == 1
+
+
+def test_a_caller_going_away_leaves_the_others_their_result():
+    flight, gate = SingleFlight("test"), Gate()
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("key", gate))
+        second = asyncio.ensure_future(flight.do("key", gate))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        gate.open()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "rows"
+    assert gate.calls == 1
@@ -0,0 +1,97 @@
+import base64
+
+import pytest
+
+from app.config import settings
+
+BODY = {"first_name": "Sam", "last_name": "Sync", "contact_info": {}, "location": "south-site"}
+
+
+@pytest.fixture(autouse=True)
+def settled(monkeypatch):
+    """Report rows straight away instead of holding back the last few seconds."""
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+
+
+def sync(client, headers, username, since=None, **params):
+    if since is not None:
+        params["since"] = since
+    response = client.get("/sync", params=params, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def catch_up(client, headers, username, since=None):
+    """Sync until has_more is false; returns ({changed ids}, {deleted ids}, token)."""
+    changed, deleted = set(), set()
+    while True:
+        page = sync(client, headers, username, since)
+        changed |= {row["id"] for row in page["potentials"]["changed"]}
+        deleted |= set(page["potentials"]["deleted"])
+        since = page["next"]
+        if not page["has_more"]:
+            return changed, deleted, since
+
+
+def test_first_sync_then_nothing_new(client, headers, org):
+    potential = client.post("/potentials/", json=BODY, headers=headers("helper")).json()
+
+    changed, deleted, token = catch_up(client, headers, "overseer")
+    assert potential["id"] in changed
+
+    assert catch_up(client, headers, "overseer", token)[:2] == (set(), set())
+
+
+def test_updates_and_deletes_since_the_token(client, headers, org):
+    updated = client.post("/potentials/", json=BODY, headers=headers("helper")).json()["id"]
+    removed = client.post("/potentials/", json=BODY, headers=headers("helper")).json()["id"]
+    token = catch_up(client, headers, "overseer")[2]
+
+    client.put(f"/potentials/{updated}", json={**BODY, "notes": "changed"}, headers=headers("admin"))
+    client.delete(f"/potentials/{removed}", headers=headers("admin"))
+
+    changed, deleted, _ = catch_up(client, headers, "overseer", token)
+    assert updated in changed
+    assert removed in deleted and removed not in changed
+
+
+def test_moves_out_of_scope_are_reported_once(client, headers, org):
+    moved = client.post("/potentials/", json=BODY, headers=headers("helper")).json()["id"]
+    token = catch_up(client, headers, "overseer")[2]
+
+    response = client.put(f"/potentials/{moved}", json={**BODY, "location": "west"}, headers=headers("admin"))
+    assert response.status_code == 200
+
+    changed, deleted, token = catch_up(client, headers, "overseer", token)
+    assert moved in deleted and moved not in changed
+    # the exits watermark moved past it, so the tombstone is not sent again
+    assert moved not in catch_up(client, headers, "overseer", token)[1]
+    # while a user who can still see the row gets it as a change
+    assert moved in catch_up(client, headers, "admin")[0]
+
+
+def test_pages_cover_every_row(client, headers, org):
+    created = {client.post("/potentials/", json=BODY, headers=headers("helper")).json()["id"] for _ in range(5)}
+
+    seen, pages, since = set(), 0, None
+    while True:
+        page = sync(client, headers, "helper", since, limit=2)
+        assert len(page["potentials"]["changed"]) <= 2
+        seen |= {row["id"] for row in page["potentials"]["changed"]}
+        since, pages = page["next"], pages + 1
+        if not page["has_more"]:
+            break
+
+    assert created <= seen
+    assert pages >= 3
+
+
+@pytest.mark.parametrize("token", [
+    "not a token",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),  # JSON, but not an object
+    base64.urlsafe_b64encode(b'{"p": ["yesterday", 1]}').decode(),
+])
+def test_malformed_tokens_are_rejected(client, headers, token):
+    response = client.get("/sync", params={"since": token}, headers=headers("admin"))
+
+    assert response.status_code == 400
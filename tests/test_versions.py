@@ -0,0 +1,105 @@
+import pytest
+
+from app import crud
+
+BODY = {"first_name": "Ada", "last_name": "Lovelace", "contact_info": {"email": "ada@example.com"}, "location": "west"}
+
+
+def put_elsewhere(client, headers, potential_id, **fields):
+    """A write through another session, bumping the row's version behind `db`'s back."""
+    response = client.put(f"/potentials/{potential_id}", json={**BODY, **fields}, headers=headers("admin"))
+    assert response.status_code == 200, response.text
+
+
+def test_delete_after_a_concurrent_update(client, headers, db, create_potential, user_id):
+    potential = create_potential()
+    loaded = crud.get_potential(db, potential["id"])
+    put_elsewhere(client, headers, potential["id"], first_name="Changed")
+
+    deleted = crud.delete_potential(db, potential["id"], user_id("admin"))
+
+    assert deleted is loaded
+    assert deleted.deleted_at is not None
+    assert deleted.first_name == "Changed"
+    assert crud.delete_potential(db, potential["id"], user_id("admin")) is None
+
+
+def test_conversion_after_a_concurrent_update(client, headers, db, create_potential):
+    potential = create_potential()
+    crud.get_potential(db, potential["id"])
+    put_elsewhere(client, headers, potential["id"], notes="changed")
+
+    converted = crud.update_potential_disciple_status(db, potential["id"], True)
+
+    assert converted.is_disciple and converted.converted_at is not None
+    assert converted.version == 3
+
+
+def test_deleting_through_the_api(client, headers, create_potential):
+    potential = create_potential()
+
+    assert client.delete(f"/potentials/{potential['id']}", headers=headers("admin")).status_code == 204
+    assert client.get(f"/potentials/{potential['id']}", headers=headers("admin")).status_code == 404
+
+
+def test_updates_out_of_scope_change_nothing(client, headers, create_potential):
+    potential = create_potential("leader", last_name="scoped")
+
+    response = client.put(f"/potentials/{potential['id']}", json={**BODY, "first_name": "Intruder"},
+                          headers=headers("leader2"))
+
+    assert response.status_code == 403
+    current = client.get(f"/potentials/{potential['id']}", headers=headers("leader")).json()
+    assert current["first_name"] == potential["first_name"]
+    assert current["version"] == potential["version"]
+
+
+def test_etag_round_trip(client, headers, create_potential):
+    potential = create_potential()
+    url = f"/potentials/{potential['id']}"
+    etag = client.get(url, headers=headers("admin")).headers["etag"]
+    assert etag == f'"{potential["version"]}"'
+
+    response = client.put(url, json={**BODY, "notes": "first"}, headers={**headers("admin"), "If-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{potential["version"] + 1}"'
+    assert client.get(url, headers=headers("admin")).headers["etag"] == response.headers["etag"]
+
+
+def test_stale_if_match_is_rejected_with_412(client, headers, create_potential):
+    potential = create_potential()
+    url = f"/potentials/{potential['id']}"
+    stale = client.get(url, headers=headers("admin")).headers["etag"]
+    current = client.put(url, json={**BODY, "notes": "theirs"}, headers=headers("admin")).headers["etag"]
+
+    response = client.put(url, json={**BODY, "notes": "mine"}, headers={**headers("admin"), "If-Match": stale})
+
+    assert response.status_code == 412
+    assert response.headers["etag"] == current
+    assert client.get(url, headers=headers("admin")).json()["notes"] == "theirs"
+
+
+@pytest.mark.parametrize("if_match, status_code", [
+    ("*", 200),
+    ('"999", "{version}"', 200),  # any listed version will do
+    ('W/"{version}"', 412),        # If-Match compares strongly
+    ('"abc"', 412),                # not one of ours
+])
+def test_if_match_forms(client, headers, create_potential, if_match, status_code):
+    potential = create_potential()
+    if_match = if_match.format(version=potential["version"])
+
+    response = client.put(f"/potentials/{potential['id']}", json=BODY, headers={**headers("admin"), "If-Match": if_match})
+
+    assert response.status_code == status_code
+
+
+def test_workers_are_versioned_too(client, headers):
+    body = {"first_name": "Wes", "last_name": "Worker", "contact_info": {}, "location": "west"}
+    created = client.post("/workers/", json=body, headers=headers("admin")).json()
+    url = f"/workers/{created['id']}"
+    etag = client.get(url, headers=headers("admin")).headers["etag"]
+
+    assert client.put(url, json=body, headers={**headers("admin"), "If-Match": etag}).status_code == 200
+    assert client.put(url, json=body, headers={**headers("admin"), "If-Match": etag}).status_code == 412
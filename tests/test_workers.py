@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+
+
+@pytest.fixture
+def create_worker(client, headers):
+    def create(location="west", role="worker", username="admin"):
+        body = {"first_name": "Grace", "last_name": "Hopper", "contact_info": {"email": "grace@example.com"},
+                "location": location, "role": role}
+        response = client.post("/workers/", json=body, headers=headers(username))
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    return create
+
+
+def listed(client, headers, path, username="admin"):
+    response = client.get(path, params={"limit": 1000}, headers=headers(username))
+    assert response.status_code == 200, response.text
+    return [worker["id"] for worker in response.json()]
+
+
+def test_workers_by_location(client, headers, create_worker):
+    west, north, east = create_worker("west"), create_worker("north"), create_worker("east")
+
+    ids = listed(client, headers, "/workers/location/west")
+    assert west in ids and north not in ids
+    assert east in listed(client, headers, "/workers/location/east")  # served by its shard
+    assert ids == sorted(ids)
+
+
+def test_workers_by_location_stay_within_scope(client, headers, org, create_worker):
+    site, west = create_worker("south-site"), create_worker("west")
+
+    assert site in listed(client, headers, "/workers/location/south-site", "overseer")
+    assert west not in listed(client, headers, "/workers/location/west", "overseer")
+
+
+def test_workers_by_role_follow_updates(client, headers, create_worker):
+    worker = create_worker(role="pastor")
+    assert worker in listed(client, headers, "/workers/role/pastor")
+
+    body = {"first_name": "Grace", "last_name": "Hopper", "contact_info": {"email": "grace@example.com"},
+            "location": "west", "role": "leader"}
+    assert client.put(f"/workers/{worker}", json=body, headers=headers("admin")).status_code == 200
+
+    assert worker not in listed(client, headers, "/workers/role/pastor")
+    assert worker in listed(client, headers, "/workers/role/leader")
+
+
+def test_role_filter_is_for_admins_with_known_roles(client, headers):
+    assert client.get("/workers/role/worker", headers=headers("leader")).status_code == 403
+    assert client.get("/workers/role/wizard", headers=headers("admin")).status_code == 400
+
+
+def test_role_lists_use_the_role_index():
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM workers WHERE role = 'worker' ORDER BY id LIMIT 10"
+        )).all()
+
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_workers_role_id" in details
+    assert "TEMP B-TREE" not in details  # no sort